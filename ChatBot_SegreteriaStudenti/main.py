@@ -8,6 +8,8 @@ Tecnologie: Mistral 7B + SentenceTransformers + ChromaDB
 import os
 import sys
 import re
+import time
+import logging
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -18,28 +20,45 @@ load_dotenv()
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 # Import moduli core con gestione errori
+# I moduli caricano le librerie pesanti (torch, sentence_transformers, chromadb)
+# solo al primo utilizzo: --help, --setup e --check partono senza attenderle
 try:
     from src.local_embeddings import LocalEmbeddings
-    from src.creazione_vectorstore import search_vectorstore, crea_vectorstore_free
+    from src.creazione_vectorstore import search_vectorstore, search_routed, warm_up_vectorstore, get_index_version
     from src.ollama_llm import OllamaLLM
-    from src.dividi_chunks import split_text_in_chunks
+    from src.warmup import WarmUp
+    from src.prompt_templates import categorize_question, TEMPLATE_VERSION
+    from src.intent_classifier import get_intent_classifier
+    from src.answer_cache import get_answer_cache, ResponseCache
+    from src.query_log import get_query_log, build_entry
+    from src.log_config import setup_logging
 except ImportError:
     # Fallback per sviluppo locale
     try:
         from local_embeddings import LocalEmbeddings
-        from creazione_vectorstore import search_vectorstore, crea_vectorstore_free
+        from creazione_vectorstore import search_vectorstore, search_routed, warm_up_vectorstore, get_index_version
         from ollama_llm import OllamaLLM
-        from dividi_chunks import split_text_in_chunks
+        from warmup import WarmUp
+        from prompt_templates import categorize_question, TEMPLATE_VERSION
+        from intent_classifier import get_intent_classifier
+        from answer_cache import get_answer_cache, ResponseCache
+        from query_log import get_query_log, build_entry
+        from log_config import setup_logging
     except ImportError as e:
         print(f"Errore import moduli: {e}")
         print("Esegui: pip install -r requirements.txt")
         sys.exit(1)
 
+logger = logging.getLogger(__name__)
+
 class ChatbotRAG:
     """Classe principale del chatbot RAG - coordina embedding, retrieval e generazione"""
     
-    def __init__(self):
-        """Inizializza i componenti core del sistema RAG"""
+    def __init__(self, warm_up=True, background=True):
+        """
+        Inizializza i componenti core del sistema RAG
+        Con warm_up=True precarica modello Ollama, embedder e indice (in background se richiesto)
+        """
         
         try:
             # Inizializza sistema di embedding semantico
@@ -53,38 +72,98 @@ class ChatbotRAG:
                 raise Exception("Ollama non raggiungibile")
             
         except Exception as e:
-            print(f"Errore inizializzazione: {e}")
+            logger.error("Errore inizializzazione: %s", e)
             raise
+        
+        # Cache persistente delle risposte (ANSWER_CACHE=0 per disattivarla)
+        self.answer_cache = None
+        self.response_cache = None
+        if os.getenv('ANSWER_CACHE', '1') == '1':
+            try:
+                self.answer_cache = get_answer_cache()
+                self.response_cache = ResponseCache(self.answer_cache, self.llm.model, TEMPLATE_VERSION,
+                                                    get_index_version)
+            except Exception as e:
+                logger.warning("Cache risposte non disponibile: %s", e)
+        
+        # Log JSONL delle query reali (QUERY_LOG=0 per disattivarlo)
+        try:
+            self.query_log = get_query_log()
+        except Exception as e:
+            self.query_log = None
+            logger.warning("Log delle query non disponibile: %s", e)
+        
+        # Warm-up: caricamento modello Ollama, embedding fittizio e apertura indice
+        self.warmup = WarmUp({
+            "llm": self.llm.warm_up,
+            "embedder": self.embedder.warm_up,
+            "vectordb": warm_up_vectorstore
+        })
+        if warm_up:
+            self.warmup.start(background=background)
+    
+    def is_ready(self):
+        """True quando il warm-up dei componenti è terminato"""
+        return self.warmup.is_ready()
     
-    def retrieve_documents(self, query, k=4):
+    def classify_intent(self, query, query_embedding=None):
+        """
+        Categoria della domanda dai centroidi delle FAQ (riusa l'embedding del retrieval)
+        Parole chiave se i centroidi non sono disponibili o la similarità è incerta
+        """
+        try:
+            return get_intent_classifier(self.embedder).classify(query, query_embedding)
+        except Exception as e:
+            logger.warning("Classificatore di intento non disponibile: %s", e)
+            return categorize_question(query)
+    
+    def retrieve_documents(self, query, k=4, where=None, route=True):
         """
         ✅ OTTIMIZZATO: Recupera top-4 documenti (meno = più veloce)
         Ridotto da k=5 a k=4 per velocizzare retrieval + generation
+        route=True: cerca prima tra i chunk della categoria della domanda, nell'intero indice
+        solo se i risultati della categoria sono deboli (vedi search_routed)
+        where: filtro esplicito sui metadati dei chunk (es. {"doc_type": "faq"}), disattiva il routing
         """
         try:
-            results = search_vectorstore(query, k=k, embedder=self.embedder)
+            # Un solo embedding della domanda: classificazione di intento e ricerca
+            query_embedding = self.embedder.embed_query_array(query, normalize=True)
+            intent = self.classify_intent(query, query_embedding)
+            
+            if route and where is None:
+                results = search_routed(query, intent, k=k, query_embedding=query_embedding)
+            else:
+                results = search_vectorstore(query, k=k, where=where, query_embedding=query_embedding)
+            route_used = results.get("route", "global")
             
             if not results["documents"] or not results["documents"][0]:
                 return []
             
-            # Formatta documenti con score di rilevanza
+            # Formatta documenti con score di rilevanza, metadati e id del chunk
             docs = []
-            for doc, distance in zip(results["documents"][0], results["distances"][0]):
+            metadatas = results.get("metadatas") or [[{}] * len(results["documents"][0])]
+            for doc, distance, metadata, chunk_id in zip(results["documents"][0], results["distances"][0],
+                                                         metadatas[0], results["ids"][0]):
                 docs.append({
                     "content": doc,
-                    "score": distance
+                    "score": distance,
+                    "metadata": metadata or {},
+                    "id": chunk_id,
+                    "route": route_used,
+                    "intent": intent
                 })
             
             return docs
             
         except Exception as e:
-            print(f"Errore retrieval: {e}")
+            logger.error("Errore retrieval: %s", e)
             return []
     
-    def generate_response(self, query, context_docs):
+    def generate_response(self, query, context_docs, category=None):
         """
         ✅ OTTIMIZZATO: Genera risposta usando query + context separati
         Permette a prompt_templates.py di categorizzare e ottimizzare il prompt
+        category: se assente si usa l'intento calcolato da retrieve_documents
         """
         
         if not context_docs:
@@ -103,7 +182,23 @@ class ChatbotRAG:
         try:
             # ✅ MODIFICA CRITICA: Passa query originale + context separati
             # Questo permette a prompt_templates.py di categorizzare e ottimizzare
-            response = self.llm.generate(query, context)
+            if category is None:
+                category = context_docs[0].get("intent")
+            
+            # Risposta già generata con stessi chunk, indice, template, modello e opzioni
+            cache_entry = None
+            if self.response_cache is not None:
+                cached, cache_entry = self.response_cache.lookup(query, context_docs[:2], category,
+                                                                 self.llm.generation_options(category))
+                if cached is not None:
+                    return {
+                        "response": cached,
+                        "context_used": len(context_docs),
+                        "should_redirect": False,
+                        "cached": True
+                    }
+            
+            response = self.llm.generate(query, context, category=category)
             
             # Gestione redirect to human
             if "REDIRECT_TO_HUMAN" in response:
@@ -120,14 +215,18 @@ Dettagli tecnici: {response.replace('REDIRECT_TO_HUMAN - ', '')}""",
                     "should_redirect": True
                 }
             
+            if self.response_cache is not None:
+                self.response_cache.store(cache_entry, query, response, category)
+            
             return {
                 "response": response,
                 "context_used": len(context_docs),
-                "should_redirect": False
+                "should_redirect": False,
+                "cached": False
             }
             
         except Exception as e:
-            print(f"Errore generazione: {e}")
+            logger.error("Errore generazione: %s", e)
             ticket_url = os.getenv('TICKET_URL', 'https://helpdesk.unibg.it/')
             return {
                 "response": f"Mi dispiace, sto avendo difficoltà tecniche. Contatta direttamente la segreteria studenti ({ticket_url}).",
@@ -137,13 +236,38 @@ Dettagli tecnici: {response.replace('REDIRECT_TO_HUMAN - ', '')}""",
     
     def chat(self, query):
         """Metodo principale per processare una query utente completa"""
+        start_time = time.time()
         
         # Fase 1: Recupera documenti rilevanti
         docs = self.retrieve_documents(query)
+        retrieval_time = time.time() - start_time
         
         # Fase 2: Genera risposta contestualizzata
         result = self.generate_response(query, docs)
         
+        # Tempi per fase (usati da test di carico e diagnostica)
+        total_time = time.time() - start_time
+        llm_stats = self.llm.get_last_generation_stats() if docs and not result.get("cached") else {}
+        first_token = llm_stats.get("first_token")
+        result["timings"] = {
+            "retrieval": retrieval_time,
+            "generation": total_time - retrieval_time,
+            "first_token": retrieval_time + first_token if first_token is not None else None,
+            "total": total_time
+        }
+        # Budget effettivo e motivo di fine generazione (taratura di num_predict per categoria)
+        result["generation"] = {
+            "num_predict": llm_stats.get("num_predict"),
+            "tokens": llm_stats.get("tokens"),
+            "stop_reason": llm_stats.get("stop_reason")
+        }
+        
+        if self.query_log is not None and self.query_log.sampled():
+            try:
+                self.query_log.record(build_entry(query, docs, result))
+            except Exception as e:
+                logger.warning("Errore log delle query: %s", e)
+        
         return result
 
 def check_requirements():
@@ -220,6 +344,8 @@ def chatbot_cli():
     print("Fai una domanda sull'università!")
     print("Comandi: 'help' per esempi | 'exit' per uscire")
     print("=" * 50)
+    if not chatbot.is_ready():
+        print("(Preparazione modelli in corso in background...)")
     
     while True:
         print("\n" + "-" * 30)
@@ -254,6 +380,8 @@ def chatbot_cli():
             # Mostra info aggiuntive se utili
             if result['context_used'] > 0:
                 print(f"(Basato su {result['context_used']} documenti)")
+            if result.get('cached'):
+                print("(Risposta dalla cache)")
             
             if result['should_redirect']:
                 ticket_url = os.getenv('TICKET_URL', 'https://helpdesk.unibg.it/')
@@ -319,6 +447,8 @@ def show_setup_instructions():
 
 def main():
     """Funzione principale - gestisce i comandi CLI e avvia l'interfaccia appropriata"""
+    # Log diagnostici su stderr tramite coda (LOG_LEVEL / LOG_LEVELS per il dettaglio)
+    setup_logging()
     print("ChatBot Segreteria Studenti - UniBg")
     print(f"Avviato il {datetime.now().strftime('%d/%m/%Y alle %H:%M')}")
     
@@ -0,0 +1,123 @@
+"""
+Circuit breaker per il backend LLM
+Dopo un numero di errori ravvicinati smette di inoltrare richieste (fail-fast)
+e verifica il ripristino del servizio con un probe in background
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any, Optional
+
+
+class CircuitBreaker:
+    """
+    Stati:
+    - closed: richieste inoltrate normalmente, si contano gli errori recenti
+    - open: richieste rifiutate subito, un thread verifica periodicamente il servizio
+    - half_open: il probe è riuscito, una richiesta di prova decide se richiudere
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, window: float = 60.0,
+                 probe: Optional[Callable[[], bool]] = None, probe_interval: float = 5.0,
+                 trial_timeout: float = 120.0):
+        """Configura soglia errori, finestra temporale (s) e funzione di probe del servizio"""
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.trial_timeout = trial_timeout
+
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.total_rejected = 0
+        self._failures = deque()
+        self._trial_started = None
+        self._probe_thread = None
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Indica se una richiesta può essere inoltrata al backend"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.HALF_OPEN:
+                now = time.time()
+                if self._trial_started is None or now - self._trial_started > self.trial_timeout:
+                    self._trial_started = now
+                    return True
+
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        """Registra una richiesta riuscita: il circuito si richiude"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.opened_at = None
+            self._failures.clear()
+            self._trial_started = None
+
+    def release_trial(self):
+        """Richiesta conclusa senza esito sul backend: la prova half-open torna disponibile"""
+        with self._lock:
+            self._trial_started = None
+
+    def record_failure(self):
+        """Registra un errore del backend; oltre la soglia il circuito si apre"""
+        with self._lock:
+            now = time.time()
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and len(self._failures) >= self.failure_threshold
+            ):
+                self._open(now)
+
+    def _open(self, now: float):
+        """Apre il circuito e avvia il probe di ripristino (chiamato con il lock acquisito)"""
+        self.state = self.OPEN
+        self.opened_at = now
+        self._trial_started = None
+
+        if self.probe and (self._probe_thread is None or not self._probe_thread.is_alive()):
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="circuit-probe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        """Verifica periodicamente il servizio finché il circuito resta aperto"""
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self.state != self.OPEN:
+                    return
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            if healthy:
+                with self._lock:
+                    if self.state == self.OPEN:
+                        self.state = self.HALF_OPEN
+                        self._trial_started = None
+                return
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Stato corrente del circuito per health check e diagnostica"""
+        with self._lock:
+            now = time.time()
+            recent = sum(1 for t in self._failures if now - t <= self.window)
+            return {
+                "state": self.state,
+                "recent_failures": recent,
+                "failure_threshold": self.failure_threshold,
+                "open_for": round(now - self.opened_at, 1) if self.opened_at else 0.0,
+                "rejected_requests": self.total_rejected
+            }
@@ -3,8 +3,8 @@ Modulo per gestire gli embedding con Sentence Transformers
 Ottimizzato per performance e affidabilità
 """
 
-from sentence_transformers import SentenceTransformer
 import os
+import time
 import numpy as np
 from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
@@ -12,10 +12,12 @@ import logging
 
 load_dotenv()
 
-# Configurazione logging
-logging.basicConfig(level=logging.INFO)
+# Logger del modulo: livelli e handler sono configurati dagli entry point (log_config)
 logger = logging.getLogger(__name__)
 
+# Barra di avanzamento solo per batch grandi (indicizzazione), mai per query singole
+PROGRESS_BAR_MIN_TEXTS = int(os.getenv('EMBEDDING_PROGRESS_MIN_TEXTS', '256'))
+
 class LocalEmbeddings:
     """
     Classe per gestire embedding locali con SentenceTransformers
@@ -26,40 +28,71 @@ class LocalEmbeddings:
         self.model_name = model_name or os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
         
         try:
-            print(f"Caricamento modello di embedding: {self.model_name}")
+            # Import differito: sentence_transformers carica torch e transformers (diversi secondi)
+            from sentence_transformers import SentenceTransformer
+
+            logger.info("Caricamento modello di embedding: %s", self.model_name)
             self.model = SentenceTransformer(self.model_name)
-            print("Modello di embedding caricato")
+            logger.info("Modello di embedding caricato")
         except Exception as e:
-            logger.error(f"Errore nel caricamento del modello: {e}")
+            logger.error("Errore nel caricamento del modello: %s", e)
             raise
     
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Crea embedding per una lista di documenti"""
+    def embed_documents_array(self, texts: List[str], normalize: bool = False) -> np.ndarray:
+        """Crea embedding per una lista di documenti come matrice float32 contigua (n, dim)"""
         if not texts:
             logger.warning("Lista di testi vuota")
-            return []
-            
-        print(f"Creazione embedding per {len(texts)} documenti...")
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        logger.debug("Creazione embedding per %d documenti...", len(texts))
         try:
-            embeddings = self.model.encode(texts, show_progress_bar=True, convert_to_tensor=False)
-            return embeddings.tolist()
+            embeddings = self.model.encode(
+                texts,
+                show_progress_bar=len(texts) >= PROGRESS_BAR_MIN_TEXTS,
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+            )
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
         except Exception as e:
-            logger.error(f"Errore nella creazione embedding documenti: {e}")
+            logger.error("Errore nella creazione embedding documenti: %s", e)
             raise
-    
-    def embed_query(self, text: str) -> List[float]:
-        """Crea embedding per una singola query di ricerca"""
+
+    def embed_query_array(self, text: str, normalize: bool = False) -> np.ndarray:
+        """Crea embedding per una singola query come vettore float32 contiguo (dim,)"""
         if not text.strip():
             logger.warning("Query vuota")
-            return []
-            
+            return np.empty((0,), dtype=np.float32)
+
         try:
-            embedding = self.model.encode([text], convert_to_tensor=False)
-            return embedding[0].tolist()
+            embedding = self.model.encode(
+                [text],
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+            )
+            return np.ascontiguousarray(embedding[0], dtype=np.float32)
         except Exception as e:
-            logger.error(f"Errore nella creazione embedding query: {e}")
+            logger.error("Errore nella creazione embedding query: %s", e)
             raise
-    
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Compatibilità: come embed_documents_array ma restituisce liste Python"""
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Compatibilità: come embed_query_array ma restituisce una lista Python"""
+        return self.embed_query_array(text).tolist()
+
+    @property
+    def dimension(self) -> int:
+        """Dimensione dei vettori prodotti dal modello"""
+        return self.model.get_sentence_embedding_dimension()
+
+    def warm_up(self) -> float:
+        """Esegue un embedding fittizio per inizializzare kernel e buffer prima delle query reali"""
+        start_time = time.time()
+        self.embed_query_array("segreteria studenti", normalize=True)
+        return time.time() - start_time
+
     def get_model_info(self) -> Dict[str, Any]:
         """Restituisce informazioni tecniche sul modello di embedding utilizzato"""
         try:
@@ -71,34 +104,34 @@ class LocalEmbeddings:
                 "model_type": "SentenceTransformer"
             }
         except Exception as e:
-            logger.error(f"Errore nel recupero info modello: {e}")
+            logger.error("Errore nel recupero info modello: %s", e)
             return {"error": str(e)}
     
     def compute_similarity(self, text1: str, text2: str) -> float:
         """Calcola la similarità coseno tra due testi (0-1, dove 1 = identici)"""
         try:
-            emb1 = np.array(self.embed_query(text1))
-            emb2 = np.array(self.embed_query(text2))
+            emb1 = self.embed_query_array(text1, normalize=True)
+            emb2 = self.embed_query_array(text2, normalize=True)
             
-            if len(emb1) == 0 or len(emb2) == 0:
+            if emb1.size == 0 or emb2.size == 0:
                 return 0.0
             
-            # Similarità coseno
-            cos_sim = np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2))
-            return float(cos_sim)
+            # Vettori già normalizzati: la similarità coseno è il prodotto scalare
+            return float(np.dot(emb1, emb2))
         except Exception as e:
-            logger.error(f"Errore nel calcolo similarità: {e}")
+            logger.error("Errore nel calcolo similarità: %s", e)
             return 0.0
 
-    def batch_embed_with_metadata(self, texts: List[str], metadata: List[Dict] = None) -> List[Dict]:
-        """Crea embedding con metadati associati per ogni chunk di testo"""
-        embeddings = self.embed_documents(texts)
+    def batch_embed_with_metadata(self, texts: List[str], metadata: List[Dict] = None,
+                                  normalize: bool = False) -> List[Dict]:
+        """Crea embedding con metadati associati per ogni chunk di testo (righe della matrice numpy)"""
+        embeddings = self.embed_documents_array(texts, normalize=normalize)
         
         results = []
-        for i, (text, embedding) in enumerate(zip(texts, embeddings)):
+        for i, text in enumerate(texts):
             result = {
                 "text": text,
-                "embedding": embedding,
+                "embedding": embeddings[i],
                 "metadata": metadata[i] if metadata and i < len(metadata) else {"index": i}
             }
             results.append(result)
@@ -106,6 +139,8 @@ class LocalEmbeddings:
         return results
 
 if __name__ == "__main__":
+    from log_config import setup_logging
+    setup_logging(level="INFO")
     try:
         embedder = LocalEmbeddings()
         
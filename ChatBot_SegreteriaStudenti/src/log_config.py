@@ -0,0 +1,97 @@
+"""
+Configurazione del logging per gli entry point (CLI, Streamlit, script batch)
+I moduli di libreria si limitano a logging.getLogger(__name__): livelli e destinazioni
+si decidono qui, una sola volta per processo. I record passano da una QueueHandler
+(un semplice put in coda, senza I/O nel thread della richiesta) e un QueueListener
+in background li scrive su console e, se richiesto, su file.
+
+Variabili d'ambiente:
+    LOG_LEVEL   livello generale (default WARNING)
+    LOG_LEVELS  livelli per modulo, es. "ollama_llm=INFO,local_embeddings=DEBUG"
+                (valgono sia per l'import diretto sia per quello da main.py come src.ollama_llm)
+    LOG_FILE    file di log aggiuntivo (opzionale)
+"""
+
+import os
+import sys
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Pacchetti da cui i moduli possono essere importati (main.py usa "from src.ollama_llm import ...")
+PACKAGE_PREFIXES = ("src",)
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def parse_module_levels(spec: str) -> Dict[str, str]:
+    """Converte "modulo=LIVELLO,altro=LIVELLO" in dizionario"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def module_loggers(name: str):
+    """Logger di un modulo con tutti i nomi con cui può essere importato (ollama_llm, src.ollama_llm)"""
+    base = name.rsplit('.', 1)[-1]
+    return [logging.getLogger(base)] + [logging.getLogger(f"{prefix}.{base}") for prefix in PACKAGE_PREFIXES]
+
+
+def setup_logging(level: Optional[str] = None, module_levels: Optional[Dict[str, str]] = None,
+                  log_file: Optional[str] = None) -> QueueListener:
+    """
+    Installa il QueueHandler sul logger root e avvia il listener (idempotente)
+    Gli argomenti hanno precedenza sulle variabili d'ambiente
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        level = (level or os.getenv('LOG_LEVEL', 'WARNING')).upper()
+        module_levels = {**parse_module_levels(os.getenv('LOG_LEVELS', '')), **(module_levels or {})}
+        log_file = log_file or os.getenv('LOG_FILE')
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(QueueHandler(log_queue))
+        root.setLevel(level)
+
+        # Livelli per modulo: i messaggi sotto soglia sono scartati prima di formattare gli argomenti
+        # (anche per i moduli non ancora importati: getLogger(__name__) restituirà questi logger)
+        for name, module_level in module_levels.items():
+            for logger in module_loggers(name):
+                logger.setLevel(module_level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def shutdown_logging():
+    """Svuota la coda e ferma il listener (chiamata anche all'uscita del processo)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -6,35 +6,68 @@ Versione ottimizzata con prompt templates e gestione errori migliorata
 
 import requests
 import os
+import json
 import logging
 import time
-import subprocess
+import threading
 from dotenv import load_dotenv
 from typing import Dict, Any
+from urllib3.exceptions import ReadTimeoutError
+
+from circuit_breaker import CircuitBreaker
+from repetition_guard import RepetitionDetector
+
+load_dotenv()
+
+# Logger del modulo: livelli e handler sono configurati dagli entry point (log_config)
+logger = logging.getLogger(__name__)
 
 # Import sicuro per prompt templates
 try:
     from prompt_templates import get_optimized_prompt
     PROMPT_OPTIMIZATION = True
-    print("✅ Sistema prompt ottimizzati caricato")
 except ImportError as e:
     PROMPT_OPTIMIZATION = False
-    print(f"⚠️ Prompt optimization non disponibile: {e}")
+    logger.warning("Prompt optimization non disponibile: %s", e)
+
+# Import sicuro per il matcher di categoria condiviso con prompt_templates
+try:
+    from category_matcher import categorize
+except ImportError as e:
+    categorize = None
+    logger.warning("Category matcher non disponibile: %s", e)
+
+# Import sicuro per budget di generazione per categoria e rilevamento di risposta completa
+try:
+    from generation_budget import get_num_predict, CompletionDetector, NO_EARLY_STOP_CATEGORIES
+    GENERATION_BUDGETS_AVAILABLE = True
+except ImportError as e:
+    GENERATION_BUDGETS_AVAILABLE = False
+    logger.warning("Budget di generazione non disponibili: %s", e)
 
 # Import sicuro per link enhancer
 try:
     from link_enhancer import LinkEnhancer
     LINK_ENHANCEMENT_AVAILABLE = True
-    print("✅ Sistema link automatico caricato")
 except ImportError as e:
     LINK_ENHANCEMENT_AVAILABLE = False
-    print(f"⚠️ Link enhancement non disponibile: {e}")
+    logger.warning("Link enhancement non disponibile: %s", e)
 
-load_dotenv()
+class GenerationTimeout(Exception):
+    """La generazione ha superato il budget di tempo ed è stata annullata"""
+    
+    def __init__(self, budget: float):
+        super().__init__(f"Generazione oltre {budget:.0f}s")
+        self.budget = budget
+
+
+class OllamaHTTPError(Exception):
+    """Ollama ha risposto con uno status HTTP diverso da 200"""
+    
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
 
-# Configurazione logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
 class OllamaLLM:
     """
@@ -48,6 +81,39 @@ class OllamaLLM:
         self.base_url = base_url or os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
         self.model = model or os.getenv('OLLAMA_MODEL', 'mistral:7b')
         self.temperature = float(os.getenv('TEMPERATURE', '0.1'))
+        self.keep_alive = os.getenv('OLLAMA_KEEP_ALIVE', '30m')  # Modello residente in memoria tra le richieste
+        self.num_ctx = int(os.getenv('OLLAMA_NUM_CTX', '2048'))
+        
+        # Deadline e retry: una sola deadline complessiva per richiesta
+        self.request_deadline = float(os.getenv('OLLAMA_REQUEST_DEADLINE', '90'))
+        self.connect_timeout = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '3'))
+        self.min_generation_timeout = 10.0
+        self.max_attempts = 3           # Tentativi totali (risposte inadeguate o errori di connessione)
+        self.max_connection_retries = 2
+        
+        # Rilevamento loop sul flusso di token: n-grammi ripetuti consecutivi (0 = disattivato)
+        self.repeat_ngram = int(os.getenv('OLLAMA_REPEAT_NGRAM', '8'))
+        self.repeat_min_run = int(os.getenv('OLLAMA_REPEAT_MIN_RUN', '16'))
+        self.repeat_window = int(os.getenv('OLLAMA_REPEAT_WINDOW', '400'))
+        
+        # Budget num_predict per categoria e stop quando inizia la formula di chiusura
+        self.adaptive_num_predict = os.getenv('OLLAMA_ADAPTIVE_NUM_PREDICT', '1') == '1'
+        self.early_stop = os.getenv('OLLAMA_EARLY_STOP', '1') == '1'
+        
+        # Stime adattive dal throughput osservato (medie mobili esponenziali)
+        self._tokens_per_second = None
+        self._first_token_latency = None
+        
+        # Statistiche dell'ultima generazione, separate per thread (richieste concorrenti)
+        self._local = threading.local()
+        
+        # Circuit breaker: con Ollama giù le richieste falliscono subito invece di attendere i retry
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('OLLAMA_CB_THRESHOLD', '3')),
+            window=float(os.getenv('OLLAMA_CB_WINDOW', '60')),
+            probe=self._probe,
+            probe_interval=float(os.getenv('OLLAMA_CB_PROBE_INTERVAL', '5'))
+        )
         
         # Statistiche interne
         self._request_count = 0
@@ -60,30 +126,56 @@ class OllamaLLM:
             try:
                 self.link_enhancer = LinkEnhancer()
                 self.link_enhancement_enabled = True
-                print("🔗 Link enhancer inizializzato")
+                logger.debug("🔗 Link enhancer inizializzato")
             except Exception as e:
                 self.link_enhancement_enabled = False
-                print(f"⚠️ Errore inizializzazione link enhancer: {e}")
+                logger.warning("⚠️ Errore inizializzazione link enhancer: %s", e)
             
-        logger.info(f"Inizializzato OllamaLLM: {self.base_url}, modello: {self.model}")
+        logger.info("Inizializzato OllamaLLM: %s, modello: %s", self.base_url, self.model)
     
     def is_running(self) -> bool:
-        """Verifica se il servizio Ollama è attivo e raggiungibile"""
+        """Verifica se il servizio Ollama è attivo e raggiungibile (immediato se il circuito è aperto)"""
+        if self.circuit_breaker.state == CircuitBreaker.OPEN:
+            return False
+        if self._probe():
+            self.circuit_breaker.record_success()
+            return True
+        self.circuit_breaker.record_failure()
+        return False
+    
+    def _probe(self) -> bool:
+        """Controllo leggero di raggiungibilità del server Ollama"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = requests.get(f"{self.base_url}/api/tags", timeout=2)
             return response.status_code == 200
-        except:
-            # Verifica se il processo è in esecuzione su Windows
-            try:
-                result = subprocess.run(
-                    ['tasklist', '/FI', 'IMAGENAME eq ollama.exe'], 
-                    capture_output=True, 
-                    text=True,
-                    timeout=5
-                )
-                return 'ollama.exe' in result.stdout
-            except:
-                return False
+        except requests.exceptions.RequestException:
+            return False
+    
+    def warm_up(self, timeout: int = 180) -> bool:
+        """
+        Precarica il modello in memoria con una richiesta a prompt vuoto (nessun token generato)
+        e keep_alive, così la prima domanda reale non paga il caricamento del modello
+        """
+        try:
+            response = requests.post(
+                f"{self.base_url}/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": "",
+                    "stream": False,
+                    "keep_alive": self.keep_alive,
+                    "options": {"num_ctx": self.num_ctx}  # Stesso contesto di generate: evita un ricaricamento
+                },
+                timeout=timeout
+            )
+            if response.status_code == 200:
+                self._warmed_up = True
+                return True
+            logger.warning("Warm-up Ollama fallito: HTTP %s", response.status_code)
+            return False
+        except Exception as e:
+            logger.warning("Warm-up Ollama fallito: %s", e)
+            return False
     
     def check_connection(self) -> bool:
         """Metodo di compatibilità per main.py - verifica connessione Ollama"""
@@ -98,16 +190,17 @@ class OllamaLLM:
                 return [model['name'] for model in data.get('models', [])]
             return []
         except Exception as e:
-            logger.warning(f"Errore nel recupero modelli: {e}")
+            logger.warning("Errore nel recupero modelli: %s", e)
             return []
     
-    def generate(self, query: str, context: str = "") -> str:
+    def generate(self, query: str, context: str = "", category: str = None) -> str:
         """
         ✅ OTTIMIZZATO: Genera risposta veloce con prompt ottimizzato
         
         Args:
             query: Query ORIGINALE dell'utente (es. "Come iscrivermi agli esami?")
             context: Contesto documenti recuperati dal RAG (testo concatenato)
+            category: Categoria già determinata (classificatore di intento); None = parole chiave
             
         Returns:
             str: Risposta generata o messaggio di errore
@@ -115,115 +208,306 @@ class OllamaLLM:
         
         start_time = time.time()
         self._request_count += 1
+        self._local.started_at = start_time
+        self._local.first_token_at = None
+        self._local.eval_count = 0
+        self._local.prompt_eval_count = 0
+        self._local.attempts = 0
+        self._local.repetition_stops = 0
+        self._local.stop_reason = None
+        
+        # Categoria decisa una volta: prompt, budget di generazione e footer dei link
+        category = category or self._determine_category(query)
+        self._local.category = category
+        
+        # Fail-fast: backend giudicato non sano, nessuna richiesta inoltrata
+        if not self.circuit_breaker.allow_request():
+            return "REDIRECT_TO_HUMAN - Servizio Ollama temporaneamente non disponibile. Riprova tra qualche minuto."
         
         # ✅ WARM-UP: Prima richiesta richiede più tempo (caricamento modello)
         if not self._warmed_up:
-            print("🔥 Caricamento modello in corso (prima richiesta più lenta)...")
+            logger.info("🔥 Caricamento modello in corso (prima richiesta più lenta)...")
             self._warmed_up = True
         
+        options = self.generation_options(category)
+        num_predict = options["num_predict"]
+        self._local.num_predict = num_predict
+        logger.info("num_predict=%d (categoria: %s)", num_predict, category)
+        
         # FASE 1: Costruzione prompt ottimizzato
         if PROMPT_OPTIMIZATION:
             try:
                 # ✅ Passa query originale + context separati per categorizzazione
-                final_prompt = get_optimized_prompt(query, context)
-                print("🔧 Usando prompt ottimizzato")
+                # Contesto ridotto al budget: finestra meno risposta, istruzioni e domanda
+                final_prompt = get_optimized_prompt(query, context, category,
+                                                    num_ctx=self.num_ctx, num_predict=num_predict)
+                logger.debug("🔧 Usando prompt ottimizzato")
             except Exception as e:
-                print(f"⚠️ Errore prompt optimization: {e}")
+                logger.warning("⚠️ Errore prompt optimization: %s", e)
                 final_prompt = self._get_fallback_prompt(query, context)
         else:
             final_prompt = self._get_fallback_prompt(query, context)
-            print("⚠️ Usando prompt base")
+            logger.debug("⚠️ Usando prompt base")
         
         # FASE 2: Configurazione parametri ottimizzati per velocità/qualità
         payload = {
             "model": self.model,
             "prompt": final_prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.25,     # ✅ AUMENTATO leggermente (più varietà = meno retry)
-                "top_p": 0.88,           # ✅ AUMENTATO (meno stringente = più veloce)
-                "num_predict": 350,      # ✅ RIDOTTO da 400 (risposte concise ma complete)
-                "num_ctx": 2048,         # ✅ Mantenuto (efficiente)
-                "repeat_penalty": 1.15,  # ✅ AUMENTATO (meno ripetizioni = meno token)
-                "top_k": 40,             # ✅ OK
-                "stop": ["Human:", "Assistant:", "###"]
-            }
+            "stream": True,              # Streaming: la generazione si interrompe chiudendo la connessione
+            "keep_alive": self.keep_alive,
+            "options": options
         }
         
-        # FASE 3: Sistema retry con timeout progressivi ottimizzati
-        timeouts = [25, 40, 55]  # ✅ RIDOTTI: 25-40s sufficiente per la maggior parte (max 120s)
+        # FASE 3: Generazione entro una deadline complessiva unica
+        # I retry avvengono solo per errori di connessione (o risposte inadeguate),
+        # mai per generazioni lente: una generazione scaduta viene annullata, non ripetuta
+        deadline = start_time + self.request_deadline
+        connection_failures = 0
+        attempt = 0
         
-        for attempt, timeout in enumerate(timeouts, 1):
+        while attempt < self.max_attempts:
+            attempt += 1
+            self._local.attempts = attempt
+            remaining = deadline - time.time()
+            if remaining <= 1:
+                break
+            if attempt > 1 and not self.circuit_breaker.allow_request():
+                return "REDIRECT_TO_HUMAN - Servizio Ollama temporaneamente non disponibile. Riprova tra qualche minuto."
+            budget = min(remaining, self._generation_budget(payload["options"]["num_predict"]))
+            
             try:
-                print(f"🔄 Tentativo {attempt}/{len(timeouts)} (timeout: {timeout}s)")
-                
-                response = requests.post(
-                    f"{self.base_url}/api/generate",
-                    json=payload,
-                    timeout=timeout,
-                    headers={'Content-Type': 'application/json'}
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    answer = result.get('response', '').strip()
-                    
-                    # FASE 4: Validazione e post-processing
-                    processed_answer = self._process_response(answer, query)  # ✅ Usa query originale
-                    
-                    if self.link_enhancement_enabled and hasattr(self, 'link_enhancer') and processed_answer:
-                        try:
-                            category = self._determine_category(query)  # ✅ Usa query originale
-                            original_links = self.link_enhancer.count_links(processed_answer)
-                            processed_answer = self.link_enhancer.enhance_response(processed_answer, category)
-                            new_links = self.link_enhancer.count_links(processed_answer)
-                            if new_links > original_links:
-                                print(f"🔗 Link aggiunti: {new_links - original_links} (totale: {new_links})")
-                        except Exception as e:
-                            print(f"⚠️ Errore link enhancement: {e}")
-
-                    if self._is_valid_response(processed_answer):
-                        response_time = time.time() - start_time
-                        self._success_count += 1
-                        self._total_response_time += response_time
-                        
-                        print(f"✅ Risposta generata ({len(processed_answer)} caratteri, {response_time:.1f}s)")
-                        return processed_answer
-                    else:
-                        print(f"⚠️ Risposta inadeguata al tentativo {attempt}: {answer[:50]}...")
-                        if attempt < len(timeouts):
-                            continue
-                
-                elif response.status_code == 404:
-                    return f"REDIRECT_TO_HUMAN - Modello '{self.model}' non trovato. Verifica installazione."
-                
-                else:
-                    print(f"❌ HTTP {response.status_code} al tentativo {attempt}")
-                    if attempt == len(timeouts):
-                        return f"REDIRECT_TO_HUMAN - Errore server (HTTP {response.status_code})"
+                logger.debug("🔄 Tentativo %d/%d (deadline generazione: %.0fs)", attempt, self.max_attempts, budget)
+                answer = self._stream_generate(payload, budget)
             
-            except requests.exceptions.Timeout:
-                print(f"⏰ Timeout {timeout}s al tentativo {attempt} - il modello sta elaborando...")
-                if attempt == len(timeouts):
-                    return "REDIRECT_TO_HUMAN - Il sistema sta richiedendo più tempo del previsto. Riprova tra un momento o semplifica la domanda."
+            except GenerationTimeout:
+                self.circuit_breaker.record_failure()
+                logger.warning("⏰ Generazione annullata dopo %.0fs (stream chiuso)", budget)
+                return "REDIRECT_TO_HUMAN - Il sistema sta richiedendo più tempo del previsto. Riprova tra un momento o semplifica la domanda."
             
             except requests.exceptions.ConnectionError:
-                print(f"🔌 Errore connessione al tentativo {attempt}")
-                if attempt == len(timeouts):
+                self.circuit_breaker.record_failure()
+                connection_failures += 1
+                logger.warning("🔌 Errore connessione al tentativo %d", attempt)
+                if connection_failures > self.max_connection_retries:
                     return "REDIRECT_TO_HUMAN - Servizio Ollama non disponibile. Verifica che sia in esecuzione."
+                # Backoff breve: un server irraggiungibile non sta elaborando nulla
+                time.sleep(min(0.5 * connection_failures, max(deadline - time.time(), 0)))
+                continue
+            
+            except OllamaHTTPError as e:
+                # 5xx: backend guasto; 4xx: il backend ha risposto, quindi è raggiungibile
+                if e.status_code >= 500:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+                if e.status_code == 404:
+                    return f"REDIRECT_TO_HUMAN - Modello '{self.model}' non trovato. Verifica installazione."
+                logger.error("❌ HTTP %s al tentativo %d", e.status_code, attempt)
+                return f"REDIRECT_TO_HUMAN - Errore server (HTTP {e.status_code})"
             
             except Exception as e:
-                print(f"❌ Errore imprevisto al tentativo {attempt}: {str(e)}")
-                if attempt == len(timeouts):
-                    return f"REDIRECT_TO_HUMAN - Errore tecnico: {str(e)[:100]}"
+                # Errori di trasporto (ReadTimeout, ChunkedEncodingError), errori riportati da Ollama
+                # nello stream o JSON non valido sono guasti del backend; altrimenti si libera la prova
+                if isinstance(e, (requests.exceptions.RequestException, RuntimeError, ValueError)):
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.release_trial()
+                logger.error("❌ Errore imprevisto al tentativo %d: %s", attempt, e)
+                return f"REDIRECT_TO_HUMAN - Errore tecnico: {str(e)[:100]}"
+            
+            self.circuit_breaker.record_success()
+            
+            # FASE 4: Validazione e post-processing
+            processed_answer = self._finalize_answer(answer, query)  # ✅ Usa query originale
             
-            # Pausa tra tentativi
-            if attempt < len(timeouts):
-                print(f"⏸️ Pausa 2 secondi prima del prossimo tentativo...")
-                time.sleep(2)
+            if self._is_valid_response(processed_answer):
+                response_time = time.time() - start_time
+                self._success_count += 1
+                self._total_response_time += response_time
+                
+                logger.info("✅ Risposta generata (%d caratteri, %.1fs)", len(processed_answer), response_time)
+                return processed_answer
+            
+            logger.warning("⚠️ Risposta inadeguata al tentativo %d: %.50s...", attempt, answer)
         
+        if time.time() >= deadline - 1:
+            return "REDIRECT_TO_HUMAN - Il sistema sta richiedendo più tempo del previsto. Riprova tra un momento o semplifica la domanda."
         return "REDIRECT_TO_HUMAN - Impossibile generare risposta dopo tutti i tentativi"
     
+    def generation_options(self, category: str = None) -> Dict[str, Any]:
+        """
+        Opzioni di generazione Ollama per una categoria di domanda
+        Usate anche come parte della chiave della cache delle risposte
+        """
+        # Budget dalla lunghezza delle risposte FAQ della categoria (350 senza riferimenti)
+        num_predict = 350
+        if GENERATION_BUDGETS_AVAILABLE and self.adaptive_num_predict:
+            try:
+                num_predict = get_num_predict(category)
+            except Exception as e:
+                logger.warning("⚠️ Errore budget di generazione: %s", e)
+        
+        return {
+            "temperature": 0.25,     # ✅ AUMENTATO leggermente (più varietà = meno retry)
+            "top_p": 0.88,           # ✅ AUMENTATO (meno stringente = più veloce)
+            "num_predict": num_predict,
+            "num_ctx": self.num_ctx, # ✅ Mantenuto 2048 (efficiente)
+            "repeat_penalty": 1.15,  # ✅ AUMENTATO (meno ripetizioni = meno token)
+            "top_k": 40,             # ✅ OK
+            "stop": ["Human:", "Assistant:", "###"]
+        }
+    
+    def _stream_generate(self, payload: Dict[str, Any], budget: float) -> str:
+        """
+        Esegue una generazione in streaming entro il budget di tempo indicato.
+        Allo scadere chiude la connessione: Ollama interrompe la generazione lato server
+        invece di continuare a occupare il modello per una risposta che nessuno attende.
+        Allo stesso modo la chiude quando il testo entra in un loop, conservando la parte
+        che precede la ripetizione.
+        """
+        start_time = time.time()
+        gen_deadline = start_time + budget
+        first_token_time = None
+        parts = []
+        received = 0
+        cut_at = None
+        stop_reason = None
+        detector = RepetitionDetector(self.repeat_ngram, self.repeat_min_run, self.repeat_window) \
+            if self.repeat_min_run > 0 else None
+        # Per orari e contatti il paragrafo finale con i recapiti è la risposta: niente chiusura anticipata
+        completion = CompletionDetector() \
+            if GENERATION_BUDGETS_AVAILABLE and self.early_stop \
+            and getattr(self._local, 'category', None) not in NO_EARLY_STOP_CATEGORIES else None
+        
+        try:
+            response = requests.post(
+                f"{self.base_url}/api/generate",
+                json=payload,
+                stream=True,
+                timeout=(self.connect_timeout, budget),
+                headers={'Content-Type': 'application/json'}
+            )
+        except requests.exceptions.ConnectTimeout:
+            raise requests.exceptions.ConnectionError("Timeout di connessione")
+        except requests.exceptions.ReadTimeout:
+            raise GenerationTimeout(budget)
+        
+        with response:
+            if response.status_code != 200:
+                raise OllamaHTTPError(response.status_code)
+            
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise RuntimeError(chunk['error'])
+                    
+                    token = chunk.get('response', '')
+                    if token:
+                        if first_token_time is None:
+                            first_token_time = time.time() - start_time
+                            self._local.first_token_at = time.time()
+                        parts.append(token)
+                        received += 1
+                        
+                        if detector is not None:
+                            cut_at = detector.feed(token)
+                            if cut_at is not None:
+                                stop_reason = 'repetition'
+                                self._local.repetition_stops = getattr(self._local, 'repetition_stops', 0) + 1
+                                logger.info("🔁 Ripetizione rilevata dopo %d token: generazione interrotta", received)
+                        if cut_at is None and completion is not None:
+                            cut_at = completion.feed(token)
+                            if cut_at is not None:
+                                stop_reason = 'complete'
+                                logger.debug("🏁 Risposta completa dopo %d token: generazione interrotta", received)
+                        if cut_at is not None:
+                            # Uscire dal with chiude il socket: Ollama smette di generare
+                            self._local.eval_count = received
+                            break
+                    
+                    if chunk.get('done'):
+                        self._local.eval_count = chunk.get('eval_count', 0)
+                        num_predict = payload.get('options', {}).get('num_predict')
+                        stop_reason = 'length' if num_predict and self._local.eval_count >= num_predict else 'stop'
+                        # Token del prompt valutati davvero: più bassi se Ollama riusa il prefisso in cache
+                        self._local.prompt_eval_count = chunk.get('prompt_eval_count', 0)
+                        self._update_throughput(chunk, first_token_time)
+                        break
+                    
+                    if time.time() > gen_deadline:
+                        # Uscire dal with chiude il socket e annulla la generazione in corso
+                        raise GenerationTimeout(budget)
+            except requests.exceptions.ConnectionError as e:
+                # requests segnala il read timeout durante lo streaming come ConnectionError
+                if e.args and isinstance(e.args[0], ReadTimeoutError):
+                    raise GenerationTimeout(budget)
+                raise
+        
+        self._local.stop_reason = stop_reason
+        answer = ''.join(parts)
+        if cut_at is not None:
+            answer = answer[:cut_at]
+        return answer.strip()
+    
+    def get_last_generation_stats(self) -> Dict[str, Any]:
+        """Statistiche dell'ultima chiamata a generate eseguita dal thread corrente"""
+        started_at = getattr(self._local, 'started_at', None)
+        first_token_at = getattr(self._local, 'first_token_at', None)
+        return {
+            "first_token": first_token_at - started_at if started_at and first_token_at else None,
+            "tokens": getattr(self._local, 'eval_count', 0),
+            "prompt_tokens": getattr(self._local, 'prompt_eval_count', 0),
+            "attempts": getattr(self._local, 'attempts', 0),
+            "repetition_stops": getattr(self._local, 'repetition_stops', 0),
+            "num_predict": getattr(self._local, 'num_predict', None),
+            "stop_reason": getattr(self._local, 'stop_reason', None)
+        }
+    
+    def _generation_budget(self, num_predict: int) -> float:
+        """
+        Stima il tempo massimo ragionevole per generare num_predict token a partire
+        dal throughput osservato; senza osservazioni usa l'intera deadline
+        """
+        if not self._tokens_per_second:
+            return self.request_deadline
+        expected = (self._first_token_latency or 0.0) + num_predict / self._tokens_per_second
+        return max(self.min_generation_timeout, expected * 1.5 + 2)
+    
+    def _update_throughput(self, final_chunk: Dict[str, Any], first_token_time: float):
+        """Aggiorna le medie mobili di token/s e latenza al primo token con i dati di Ollama"""
+        eval_count = final_chunk.get('eval_count', 0)
+        eval_duration = final_chunk.get('eval_duration', 0)  # nanosecondi
+        alpha = 0.3
+        
+        if eval_count > 0 and eval_duration > 0:
+            tps = eval_count / (eval_duration / 1e9)
+            self._tokens_per_second = tps if self._tokens_per_second is None else \
+                alpha * tps + (1 - alpha) * self._tokens_per_second
+        
+        if first_token_time is not None:
+            self._first_token_latency = first_token_time if self._first_token_latency is None else \
+                alpha * first_token_time + (1 - alpha) * self._first_token_latency
+    
+    def _finalize_answer(self, answer: str, query: str) -> str:
+        """Applica post-processing e link enhancement alla risposta grezza del modello"""
+        processed_answer = self._process_response(answer, query)
+        
+        if self.link_enhancement_enabled and hasattr(self, 'link_enhancer') and processed_answer:
+            try:
+                category = getattr(self._local, 'category', None) or self._determine_category(query)
+                # Formattazione, rilevamento contatti e conteggio link in una sola scansione
+                result = self.link_enhancer.process(processed_answer, category)
+                processed_answer = result.text
+                if result.links > result.original_links:
+                    logger.debug("🔗 Link aggiunti: %d (totale: %d)", result.links - result.original_links, result.links)
+            except Exception as e:
+                logger.warning("⚠️ Errore link enhancement: %s", e)
+        
+        return processed_answer
+    
     def _get_fallback_prompt(self, query: str, context: str) -> str:
         """
         ✅ OTTIMIZZATO: Usa query invece di prompt per chiarezza
@@ -386,16 +670,26 @@ RISPOSTA:"""
     
     def health_check(self) -> Dict[str, Any]:
         """Esegue verifica completa dello stato del servizio Ollama"""
+        breaker_state = self.circuit_breaker.snapshot()
+        
+        # Circuito aperto: lo stato è già noto, nessuna chiamata di rete
+        if breaker_state["state"] == CircuitBreaker.OPEN:
+            return {
+                "healthy": False,
+                "error": "Servizio non disponibile (circuit breaker aperto)",
+                "circuit_breaker": breaker_state
+            }
+        
         try:
             # Test connessione
             response = requests.get(f"{self.base_url}/api/tags", timeout=10)
             if response.status_code != 200:
-                return {"healthy": False, "error": f"HTTP {response.status_code}"}
+                return {"healthy": False, "error": f"HTTP {response.status_code}", "circuit_breaker": breaker_state}
             
             # Test modelli disponibili
-            models = self.list_models()
+            models = [model['name'] for model in response.json().get('models', [])]
             if not models:
-                return {"healthy": False, "error": "Nessun modello disponibile"}
+                return {"healthy": False, "error": "Nessun modello disponibile", "circuit_breaker": breaker_state}
             
             # Test se il modello corrente è disponibile
             current_model_available = any(self.model in model for model in models)
@@ -403,7 +697,8 @@ RISPOSTA:"""
                 return {
                     "healthy": False,
                     "error": f"Modello '{self.model}' non disponibile",
-                    "available_models": models
+                    "available_models": models,
+                    "circuit_breaker": breaker_state
                 }
             
             return {
@@ -411,21 +706,22 @@ RISPOSTA:"""
                 "base_url": self.base_url,
                 "model": self.model,
                 "available_models": models,
-                "optimization_enabled": PROMPT_OPTIMIZATION
+                "optimization_enabled": PROMPT_OPTIMIZATION,
+                "circuit_breaker": breaker_state
             }
         
         except requests.exceptions.Timeout:
-            return {"healthy": False, "error": "Timeout nella connessione"}
+            return {"healthy": False, "error": "Timeout nella connessione", "circuit_breaker": breaker_state}
         except Exception as e:
-            return {"healthy": False, "error": str(e)}
+            return {"healthy": False, "error": str(e), "circuit_breaker": breaker_state}
     
     def pull_model(self, model_name: str) -> Dict[str, Any]:
         """Scarica e installa un modello specifico da Ollama"""
         try:
-            print(f"📥 Scaricamento modello {model_name}...")
+            logger.info("📥 Scaricamento modello %s...", model_name)
             response = requests.post(
                 f"{self.base_url}/api/pull",
-                json={"name": model_name},
+                json={"name": model_name, "stream": False},
                 timeout=1800  # 30 minuti per il download
             )
             return {
@@ -468,22 +764,9 @@ RISPOSTA:"""
     def _determine_category(self, query: str) -> str:
         """
         ✅ OTTIMIZZATO: Usa query invece di prompt
-        Analizza la domanda per determinare la categoria più appropriata
+        Categoria della domanda per il footer dei link: stesso matcher precompilato dei prompt
         """
-        query_lower = query.lower()
-    
-        if any(word in query_lower for word in ['iscriver', 'esam', 'prenotare']):
-            return 'iscrizioni_esami'
-        elif any(word in query_lower for word in ['tasse', 'pagare', 'pagament']):
-            return 'tasse_pagamenti'  
-        elif any(word in query_lower for word in ['certificat', 'document']):
-            return 'certificati_documenti'
-        elif any(word in query_lower for word in ['orari', 'contatt', 'telefono']):
-            return 'orari_contatti'
-        elif any(word in query_lower for word in ['servizi', 'agevolazioni', 'borse']):
-            return 'servizi_studenti'
-    
-        return 'generic'    
+        return categorize(query) if categorize else 'generic'
 
 
 
@@ -498,6 +781,8 @@ def test_ollama_connection() -> bool:
     
 
 if __name__ == "__main__":
+    from log_config import setup_logging
+    setup_logging(level="INFO")
     # Test del modulo
     print("Test OllamaLLM")
     llm = OllamaLLM()
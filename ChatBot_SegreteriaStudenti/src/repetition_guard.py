@@ -0,0 +1,101 @@
+"""
+Rilevamento online di ripetizioni nel flusso di token del modello
+Ogni parola completata (testo tra spazi: un URL conta come una parola) forma un n-gramma
+con le precedenti; gli hash degli n-grammi recenti sono tenuti in una finestra scorrevole. Quando molti
+n-grammi consecutivi sono già comparsi nella finestra il modello sta ripetendo un tratto
+di testo: la generazione può essere interrotta subito invece di arrivare a num_predict.
+"""
+
+import re
+from collections import deque
+from typing import Optional
+
+_WORD_PATTERN = re.compile(r'\S+')
+
+
+class RepetitionDetector:
+    """
+    Rilevatore incrementale di loop: feed() riceve i token così come arrivano da Ollama
+    e restituisce la posizione (in caratteri) da cui tagliare il testo quando rileva un loop
+    """
+
+    def __init__(self, ngram: int = 8, min_run: int = 16, window: int = 400):
+        """
+        ngram: parole per n-gramma; min_run: n-grammi ripetuti consecutivi che indicano
+        un loop (tratto ripetuto di ngram + min_run - 1 parole); window: n-grammi ricordati
+        """
+        self.ngram = ngram
+        self.min_run = min_run
+        self.window = window
+
+        self._pending = ''          # Testo non ancora diviso in parole (l'ultima può continuare)
+        self._offset = 0            # Posizione di _pending nel testo complessivo
+        self._words = deque(maxlen=ngram)
+        self._starts = deque(maxlen=ngram)
+        self._recent = deque()      # Hash degli n-grammi nella finestra, in ordine di arrivo
+        self._counts = {}           # Hash -> occorrenze nella finestra
+        self._run = 0
+        self._run_start = None
+        self.cut_at = None
+
+    def feed(self, token: str) -> Optional[int]:
+        """Aggiunge un token; restituisce la posizione di taglio se il testo è entrato in un loop"""
+        if self.cut_at is not None:
+            return self.cut_at
+
+        self._pending += token
+        consumed = 0
+        for match in _WORD_PATTERN.finditer(self._pending):
+            if match.end() == len(self._pending):
+                break  # La parola potrebbe continuare nel token successivo
+            consumed = match.end()
+            cut = self._add_word(match.group().lower(), self._offset + match.start())
+            if cut is not None:
+                self.cut_at = cut
+                return cut
+
+        self._offset += consumed
+        self._pending = self._pending[consumed:]
+        return None
+
+    def _add_word(self, word: str, start: int) -> Optional[int]:
+        """Registra una parola completata e aggiorna la serie di n-grammi ripetuti"""
+        self._words.append(word)
+        self._starts.append(start)
+        if len(self._words) < self.ngram:
+            return None
+
+        key = hash(tuple(self._words))
+        if self._counts.get(key):
+            if self._run == 0:
+                self._run_start = self._starts[0]  # Inizio della seconda copia del tratto
+            self._run += 1
+            if self.min_run and self._run >= self.min_run:
+                return self._run_start
+        else:
+            self._run = 0
+
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._recent.append(key)
+        if len(self._recent) > self.window:
+            old = self._recent.popleft()
+            self._counts[old] -= 1
+            if not self._counts[old]:
+                del self._counts[old]
+        return None
+
+
+if __name__ == "__main__":
+    text = ("Per iscriverti agli esami accedi allo Sportello Internet con le tue credenziali. "
+            "Seleziona l'appello e conferma la prenotazione entro la scadenza indicata. ") * 4
+    tokens = re.findall(r'\S+\s*', text)
+
+    detector = RepetitionDetector()
+    for i, token in enumerate(tokens, 1):
+        cut = detector.feed(token)
+        if cut is not None:
+            print(f"🔁 Loop rilevato dopo {i}/{len(tokens)} token")
+            print(f"Testo conservato: {text[:cut].strip()}")
+            break
+    else:
+        print("Nessun loop rilevato")
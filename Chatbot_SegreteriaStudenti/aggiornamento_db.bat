@@ -272,6 +272,32 @@ if errorlevel 1 (
     echo [OK] Database funzionante e testato
 )
 
+echo.
+echo FASE 8: PRERISCALDAMENTO CACHE RISPOSTE (OPZIONALE)
+echo ================================================================
+echo  La cache delle risposte e' legata alla versione dell'indice appena creato:
+echo  generare ora le risposte alle FAQ evita la latenza completa ai primi studenti.
+echo  Richiede Ollama attivo (diversi minuti).
+echo.
+
+set /p prewarm="Preriscaldare la cache delle risposte? (S/N): "
+if /i "%prewarm%"=="S" (
+    echo 8.1- Generazione risposte per FAQ e query registrate...
+    if exist "logs\query_log.jsonl" (
+        chatbot_env\Scripts\python.exe src\prewarm_cache.py --log logs\query_log.jsonl
+    ) else (
+        chatbot_env\Scripts\python.exe src\prewarm_cache.py
+    )
+    if errorlevel 1 (
+        echo [WARN] Preriscaldamento non completato - la cache si riempira' con l'uso
+    ) else (
+        echo [OK] Cache delle risposte preriscaldata
+    )
+) else (
+    echo 8.1- [SKIP] Preriscaldamento cache
+    echo       Per eseguirlo in seguito: python src\prewarm_cache.py
+)
+
 echo.
 echo ================================================================
 echo  AGGIORNAMENTO COMPLETATO CON SUCCESSO!
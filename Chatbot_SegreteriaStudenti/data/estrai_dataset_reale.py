@@ -9,44 +9,67 @@ import re
 from pathlib import Path
 from typing import List, Dict
 
+# Mapping file FAQ -> categoria del dataset
+FAQ_FILE_CATEGORIES = {
+    'iscrizioni_anno_accademico.txt': 'iscrizioni',
+    'tasse.txt': 'tasse',
+    'lezioni_esami.txt': 'esami_lezioni',
+    'lauree.txt': 'laurea',
+    'richiesta_attestati_documenti.txt': 'certificati',
+    'servizio_disabilità_dsa.txt': 'servizi_dsa',
+    'servizio_diritto_studio.txt': 'servizi_diritto_studio',
+    'servizio_orientamento.txt': 'servizi_orientamento',
+    'carriera.txt': 'carriera',
+    'tessera_universitaria.txt': 'tessera',
+    'tirocini.txt': 'tirocini',
+    'corsi_singoli.txt': 'corsi_singoli',
+    'contatti_utili_problematiche_varie.txt': 'contatti',
+    'varie.txt': 'varie',
+    'sito_web_unibg.txt': 'sito_web'
+}
+
+
+def _is_question_title(block_lines: List[str]) -> bool:
+    """
+    Riconosce l'intestazione di una nuova FAQ: prima riga di un blocco che contiene
+    una domanda (il '?' degli URL non conta) oppure titolo breve seguito dalla risposta
+    """
+    first_line = block_lines[0].strip()
+    without_urls = re.sub(r'https?://\S+', '', first_line)
+    if '?' in without_urls and len(first_line) < 250:
+        return True
+    return len(block_lines) > 1 and len(first_line) < 120 and not first_line.endswith(('.', ':', ';', ','))
+
+
 def parse_faq_file(file_path: str) -> List[Dict[str, str]]:
     """
     Estrae coppie domanda-risposta da un file FAQ
-    Formato file FAQ: domanda seguita da risposta, separate da newline
+    Formato file FAQ: blocchi separati da righe vuote, ogni FAQ inizia con la domanda
+    seguita dalla risposta; i blocchi senza domanda continuano la risposta precedente
     """
     qa_pairs = []
     
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    # Split su pattern domanda (termina con ?)
-    # Ogni sezione è: domanda\nrisposta\n\n
-    sections = re.split(r'\n(?=[A-Z].*\?)', content)
+    blocks = [block.strip() for block in re.split(r'\n\s*\n', content) if block.strip()]
     
-    current_question = None
-    for section in sections:
-        section = section.strip()
-        if not section:
-            continue
+    for block in blocks:
+        lines = block.split('\n')
         
-        lines = section.split('\n', 1)
-        
-        if len(lines) == 2:
-            question = lines[0].strip()
-            answer = lines[1].strip()
-            
-            # Verifica che sia una domanda valida (contiene ?)
-            if '?' in question and answer:
-                qa_pairs.append({
-                    'question': question,
-                    'answer': answer,
-                    'source_file': os.path.basename(file_path)
-                })
-        elif len(lines) == 1 and '?' in lines[0]:
-            # Domanda senza risposta esplicita (da skippare)
-            continue
-    
-    return qa_pairs
+        if _is_question_title(lines):
+            qa_pairs.append({
+                'question': lines[0].strip(),
+                'answer': '\n'.join(lines[1:]).strip(),
+                'source_file': os.path.basename(file_path)
+            })
+        elif qa_pairs:
+            # Paragrafo successivo della risposta precedente
+            previous = qa_pairs[-1]
+            previous['answer'] = f"{previous['answer']}\n\n{block}".strip()
+    
+    # Domande senza risposta esplicita (da skippare)
+    return [pair for pair in qa_pairs if pair['answer']]
 
 
 def extract_all_faq_pairs(faq_dir: str) -> Dict[str, List[Dict[str, str]]]:
@@ -54,25 +77,6 @@ def extract_all_faq_pairs(faq_dir: str) -> Dict[str, List[Dict[str, str]]]:
     
     faq_path = Path(faq_dir)
     
-    # Mapping file -> categoria
-    file_categories = {
-        'iscrizioni_anno_accademico.txt': 'iscrizioni',
-        'tasse.txt': 'tasse',
-        'lezioni_esami.txt': 'esami_lezioni',
-        'lauree.txt': 'laurea',
-        'richiesta_attestati_documenti.txt': 'certificati',
-        'servizio_disabilità_dsa.txt': 'servizi_dsa',
-        'servizio_diritto_studio.txt': 'servizi_diritto_studio',
-        'servizio_orientamento.txt': 'servizi_orientamento',
-        'carriera.txt': 'carriera',
-        'tessera_universitaria.txt': 'tessera',
-        'tirocini.txt': 'tirocini',
-        'corsi_singoli.txt': 'corsi_singoli',
-        'contatti_utili_problematiche_varie.txt': 'contatti',
-        'varie.txt': 'varie',
-        'sito_web_unibg.txt': 'sito_web'
-    }
-    
     all_pairs_by_category = {}
     all_pairs_flat = []
     
@@ -80,7 +84,7 @@ def extract_all_faq_pairs(faq_dir: str) -> Dict[str, List[Dict[str, str]]]:
     print("ESTRAZIONE DATASET REALE DA FAQ")
     print("="*80)
     
-    for filename, category in file_categories.items():
+    for filename, category in FAQ_FILE_CATEGORIES.items():
         file_path = faq_path / filename
         
         if not file_path.exists():
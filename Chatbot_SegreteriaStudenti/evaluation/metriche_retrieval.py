@@ -0,0 +1,265 @@
+"""
+Metriche di retrieval (Recall@k, MRR, nDCG@k, context precision) su tutte le FAQ
+Le domande FAQ vengono trasformate in embedding con un'unica chiamata batch e
+interrogate sul vectorstore con un'unica query multipla: nessuna chiamata all'LLM,
+una valutazione completa richiede pochi secondi.
+
+Un chunk è rilevante per una domanda se proviene dallo stesso file FAQ
+(metadato 'source_file'; negli indici costruiti prima dei metadati, prefisso '[FAQ-nome]' del testo).
+"""
+
+import sys
+import os
+import re
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Sequence
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_ROOT))
+sys.path.append(str(PROJECT_ROOT / 'src'))
+sys.path.append(str(PROJECT_ROOT / 'data'))
+
+DEFAULT_K = (1, 3, 5, 10)
+_FAQ_PREFIX = re.compile(r'^\[FAQ-([^\]]+)\]')
+
+
+def load_faq_queries(faq_dir: Optional[str] = None) -> List[Dict[str, str]]:
+    """Estrae tutte le domande dai file FAQ con il file di provenienza (ground truth)"""
+    from estrai_dataset_reale import parse_faq_file
+
+    faq_dir = Path(faq_dir) if faq_dir else PROJECT_ROOT / 'data' / 'FAQ'
+    queries = []
+    for file_path in sorted(faq_dir.glob('*.txt')):
+        for pair in parse_faq_file(str(file_path)):
+            queries.append({'query': pair['question'], 'source_file': pair['source_file']})
+    return queries
+
+
+def chunk_source(document: str, metadata: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """File di origine di un chunk: metadato se presente, altrimenti prefisso [FAQ-...] del testo"""
+    if metadata and metadata.get('source_file'):
+        return metadata['source_file']
+    match = _FAQ_PREFIX.match(document or '')
+    return f"{match.group(1)}.txt" if match else None
+
+
+def relevance_matrix(retrieved_sources: Sequence[Sequence[Optional[str]]],
+                     targets: Sequence[str]) -> np.ndarray:
+    """Matrice booleana (n_query, k): True se il chunk in posizione j proviene dal file atteso"""
+    k = max((len(row) for row in retrieved_sources), default=0)
+    relevance = np.zeros((len(targets), k), dtype=bool)
+    for i, (row, target) in enumerate(zip(retrieved_sources, targets)):
+        relevance[i, :len(row)] = [source == target for source in row]
+    return relevance
+
+
+def compute_retrieval_metrics(relevance: np.ndarray, ks: Sequence[int] = DEFAULT_K,
+                              n_relevant: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Metriche per query calcolate in forma vettoriale
+    - recall_at_k: 1 se almeno un chunk rilevante è nei primi k (hit rate)
+    - mrr: reciproco della posizione del primo chunk rilevante
+    - ndcg_at_k: guadagno binario scontato, normalizzato sul caso ideale (serve n_relevant)
+    - context_precision: frazione di chunk rilevanti tra i primi 5
+    """
+    n_queries, depth = relevance.shape
+    metrics = {}
+
+    any_relevant = relevance.any(axis=1)
+    first_rank = relevance.argmax(axis=1) + 1
+    metrics['mrr'] = np.where(any_relevant, 1.0 / first_rank, 0.0)
+
+    discounts = 1.0 / np.log2(np.arange(2, depth + 2))
+    ideal_cumulative = np.cumsum(discounts)
+
+    for k in ks:
+        top_k = relevance[:, :min(k, depth)]
+        metrics[f'recall_at_{k}'] = top_k.any(axis=1).astype(float)
+
+        if n_relevant is not None and top_k.shape[1]:
+            dcg = (top_k * discounts[:top_k.shape[1]]).sum(axis=1)
+            ideal_hits = np.minimum(n_relevant, top_k.shape[1])
+            idcg = np.where(ideal_hits > 0, ideal_cumulative[np.maximum(ideal_hits - 1, 0)], 1.0)
+            metrics[f'ndcg_at_{k}'] = np.where(ideal_hits > 0, dcg / idcg, 0.0)
+
+    precision_depth = min(5, depth)
+    metrics['context_precision'] = (relevance[:, :precision_depth].mean(axis=1)
+                                    if precision_depth else np.zeros(n_queries))
+    return metrics
+
+
+def score_retrieved_sources(sources: Sequence[Optional[str]], target: str,
+                            ks: Sequence[int] = (1, 3, 5)) -> Dict[str, float]:
+    """Metriche di retrieval per una singola domanda (usato dalla valutazione end-to-end)"""
+    metrics = compute_retrieval_metrics(relevance_matrix([sources], [target]), ks)
+    return {name: float(values[0]) for name, values in metrics.items()}
+
+
+def route_results(collection, query_embeddings: np.ndarray, queries: List[Dict[str, str]],
+                  results: Dict[str, Any], k: int) -> Dict[str, Any]:
+    """
+    Applica il routing per categoria ai risultati globali (stessa logica di search_routed)
+    Una query multipla per categoria sulla sola partizione; restituisce i risultati
+    combinati e il numero di domande servite dalla partizione
+    """
+    from prompt_templates import categorize_question
+    from creazione_vectorstore import select_routed
+
+    fields = ('ids', 'documents', 'metadatas', 'distances')
+    routed = {key: list(results[key]) for key in fields}
+    categories = [categorize_question(q['query']) for q in queries]
+    served = Counter()
+
+    for category in sorted(set(categories) - {'generic'}):
+        indexes = [i for i, c in enumerate(categories) if c == category]
+        partition = collection.query(query_embeddings=query_embeddings[indexes], n_results=k,
+                                     where={'category': category}, include=['documents', 'metadatas', 'distances'])
+        for j, i in enumerate(indexes):
+            selected, used = select_routed({key: partition[key][j] for key in fields},
+                                           {key: results[key][i] for key in fields}, k)
+            for key in fields:
+                routed[key][i] = selected[key]
+            served[category] += used
+
+    routed['routing'] = {
+        'partition_queries': sum(served.values()),
+        'global_queries': len(queries) - sum(served.values()),
+        'by_category': dict(served)
+    }
+    return routed
+
+
+def evaluate_retrieval(collection, embedder, queries: List[Dict[str, str]],
+                       ks: Sequence[int] = DEFAULT_K, routed: bool = False) -> Dict[str, Any]:
+    """
+    Embedding batch delle domande, una sola query multipla sulla collection e metriche aggregate
+    routed=True: ricerca prima nella partizione della categoria della domanda (vedi search_routed)
+    """
+    timings = {}
+
+    start_time = time.perf_counter()
+    query_embeddings = embedder.embed_documents_array([q['query'] for q in queries], normalize=True)
+    timings['embedding'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    results = collection.query(query_embeddings=query_embeddings, n_results=max(ks),
+                               include=['documents', 'metadatas', 'distances'])
+    if routed:
+        results = route_results(collection, query_embeddings, queries, results, max(ks))
+    timings['search'] = time.perf_counter() - start_time
+
+    # Numero di chunk rilevanti per ogni file (denominatore ideale di nDCG)
+    corpus = collection.get(include=['documents', 'metadatas'])
+    source_counts = Counter(chunk_source(doc, meta) for doc, meta in zip(corpus['documents'], corpus['metadatas']))
+
+    targets = [q['source_file'] for q in queries]
+    retrieved_sources = [
+        [chunk_source(doc, meta) for doc, meta in zip(docs, metas or [None] * len(docs))]
+        for docs, metas in zip(results['documents'], results['metadatas'] or [None] * len(queries))
+    ]
+    relevance = relevance_matrix(retrieved_sources, targets)
+    n_relevant = np.array([source_counts.get(target, 0) for target in targets])
+
+    per_query = compute_retrieval_metrics(relevance, ks, n_relevant)
+    aggregate = {name: float(values.mean()) for name, values in per_query.items()}
+
+    # Dettaglio per file FAQ (categoria)
+    by_source = {}
+    for source in sorted(set(targets)):
+        mask = np.array([t == source for t in targets])
+        by_source[source] = {
+            'queries': int(mask.sum()),
+            'recall_at_5': float(per_query['recall_at_5'][mask].mean()) if 'recall_at_5' in per_query else None,
+            'mrr': float(per_query['mrr'][mask].mean())
+        }
+
+    return {
+        'num_queries': len(queries),
+        'num_chunks': len(corpus['documents']),
+        'ks': list(ks),
+        'aggregate': aggregate,
+        'by_source': by_source,
+        'timings': timings,
+        'routing': results.get('routing'),
+        'per_query': [
+            {'query': q['query'], 'source_file': q['source_file'],
+             'retrieved_sources': sources,
+             **{name: float(values[i]) for name, values in per_query.items()}}
+            for i, (q, sources) in enumerate(zip(queries, retrieved_sources))
+        ]
+    }
+
+
+def print_retrieval_report(report: Dict[str, Any]):
+    """Stampa il riepilogo delle metriche di retrieval"""
+    aggregate = report['aggregate']
+    print(f"📊 {report['num_queries']} domande FAQ su {report['num_chunks']} chunk "
+          f"(embedding {report['timings']['embedding']:.2f}s, ricerca {report['timings']['search']:.2f}s)\n")
+    for k in report['ks']:
+        ndcg = aggregate.get(f'ndcg_at_{k}')
+        ndcg_text = f"   nDCG@{k}: {ndcg:.3f}" if ndcg is not None else ""
+        print(f"   Recall@{k:<2d}: {aggregate[f'recall_at_{k}']:.3f}{ndcg_text}")
+    print(f"   MRR:       {aggregate['mrr']:.3f}")
+    print(f"   Context precision@5: {aggregate['context_precision']:.3f}")
+    if report.get('routing'):
+        routing = report['routing']
+        print(f"   Routing per categoria: {routing['partition_queries']} domande dalla partizione, "
+              f"{routing['global_queries']} dall'indice globale")
+
+    weakest = sorted(report['by_source'].items(), key=lambda item: item[1]['mrr'])[:3]
+    print(f"\n   File FAQ con retrieval più debole:")
+    for source, info in weakest:
+        print(f"   - {source:40s} MRR {info['mrr']:.3f} ({info['queries']} domande)")
+
+
+def run_retrieval_evaluation(persist_dir: str = 'vectordb', ks: Sequence[int] = DEFAULT_K,
+                             save_results: bool = True, routed: bool = False) -> Optional[Dict[str, Any]]:
+    """Valutazione completa del solo retrieval sul vectorstore esistente"""
+    print("="*80)
+    print("VALUTAZIONE RETRIEVAL (Recall@k, MRR, nDCG)")
+    print("="*80 + "\n")
+
+    original_dir = os.getcwd()
+    os.chdir(PROJECT_ROOT)
+    try:
+        from local_embeddings import LocalEmbeddings
+        from creazione_vectorstore import get_collection
+
+        queries = load_faq_queries()
+        if not queries:
+            print("❌ Nessuna domanda estratta da data/FAQ")
+            return None
+
+        embedder = LocalEmbeddings()
+        collection = get_collection(persist_dir)
+
+        start_time = time.perf_counter()
+        report = evaluate_retrieval(collection, embedder, queries, ks, routed=routed)
+        report['wall_time'] = time.perf_counter() - start_time
+    except Exception as e:
+        print(f"❌ Errore valutazione retrieval: {e}")
+        return None
+    finally:
+        os.chdir(original_dir)
+
+    print_retrieval_report(report)
+    print(f"\n🕒 Tempo totale: {report['wall_time']:.2f}s")
+
+    if save_results:
+        output_dir = PROJECT_ROOT / 'results'
+        output_dir.mkdir(exist_ok=True)
+        output_file = output_dir / ('metriche_retrieval_routing.json' if routed else 'metriche_retrieval.json')
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Risultati salvati: {output_file}")
+
+    return report
+
+
+if __name__ == "__main__":
+    run_retrieval_evaluation(routed='--routing' in sys.argv)
@@ -0,0 +1,195 @@
+"""
+Sweep dei parametri di chunking (dimensione, overlap, separatori)
+Per ogni combinazione costruisce un indice temporaneo e misura numero di chunk,
+dimensione su disco, tempo di costruzione, latenza di ricerca e metriche di
+retrieval sulle domande FAQ, poi scrive una tabella comparativa.
+
+Esempi:
+    python sweep_chunking.py
+    python sweep_chunking.py --sizes 128,254 --overlaps 0,40 --separators frasi
+    python sweep_chunking.py --unit chars --sizes 500,1000 --overlaps 0,100,200
+"""
+
+import sys
+import os
+import csv
+import json
+import time
+import shutil
+import argparse
+import itertools
+import statistics
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from metriche_retrieval import PROJECT_ROOT, load_faq_queries, evaluate_retrieval
+
+# Set di separatori confrontabili (clean_text unisce le righe: contano quelli di frase e parola)
+SEPARATOR_PRESETS = {
+    'frasi': ["\n\n", "\n", ". ", "? ", "! ", " "],
+    'frasi_punteggiatura': ["\n\n", "\n", ". ", "? ", "! ", "; ", ", ", " "],
+    'parole': [" "]
+}
+# Griglie di default per unità di misura della lunghezza dei chunk
+DEFAULT_GRID = {
+    'tokens': {'sizes': [128, 192, 254], 'overlaps': [0, 20, 40]},
+    'chars': {'sizes': [500, 750, 1000, 1500], 'overlaps': [0, 100, 200]}
+}
+
+
+def directory_size(path):
+    """Dimensione totale dei file in una cartella (byte)"""
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+def query_latency(collection, query_embeddings, k=5):
+    """Latenza mediana di una ricerca singola (embedding precalcolati: misura solo l'indice)"""
+    times = []
+    for embedding in query_embeddings:
+        start_time = time.perf_counter()
+        collection.query(query_embeddings=embedding[np.newaxis, :], n_results=k)
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def run_configuration(size, overlap, separators_name, unit, embedder, queries, query_embeddings, work_dir):
+    """Costruisce l'indice per una combinazione di parametri e ne misura costi e qualità"""
+    from creazione_vectorstore import carica_corpus, crea_vectorstore_free, close_vectorstore
+
+    if overlap >= size:
+        return None
+
+    persist_dir = os.path.join(work_dir, f"size{size}_overlap{overlap}_{separators_name}")
+
+    start_time = time.perf_counter()
+    chunks, metadati, _ = carica_corpus(
+        str(PROJECT_ROOT / 'data' / 'FAQ'), str(PROJECT_ROOT / 'data' / 'testi_estratti'),
+        max_len=size, overlap=overlap, separators=SEPARATOR_PRESETS[separators_name], unit=unit, verbose=False
+    )
+    chunking_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    collection = crea_vectorstore_free(chunks, persist_dir=persist_dir, embedder=embedder, metadatas=metadati)
+    build_time = time.perf_counter() - start_time
+
+    report = evaluate_retrieval(collection, embedder, queries)
+    aggregate = report['aggregate']
+    latency = query_latency(collection, query_embeddings)
+
+    # Indice non più necessario: libera client e file aperti prima della pulizia finale
+    close_vectorstore(persist_dir)
+
+    return {
+        'unit': unit,
+        'chunk_size': size,
+        'overlap': overlap,
+        'separators': separators_name,
+        'chunks': len(chunks),
+        'avg_chunk_chars': statistics.mean(len(c) for c in chunks) if chunks else 0,
+        'index_size_mb': directory_size(persist_dir) / 1e6,
+        'chunking_time': chunking_time,
+        'build_time': build_time,
+        'query_latency_ms': latency * 1000,
+        'recall_at_1': aggregate['recall_at_1'],
+        'recall_at_3': aggregate['recall_at_3'],
+        'recall_at_5': aggregate['recall_at_5'],
+        'mrr': aggregate['mrr'],
+        'ndcg_at_5': aggregate.get('ndcg_at_5'),
+        'context_precision': aggregate['context_precision']
+    }
+
+
+def print_table(rows):
+    """Stampa la tabella comparativa ordinata per MRR"""
+    header = (f"{'size':>5} {'overlap':>7} {'separatori':>20} {'chunk':>6} {'MB':>7} {'build s':>8} "
+              f"{'query ms':>8} {'R@1':>6} {'R@5':>6} {'MRR':>6}")
+    print(header)
+    print("-" * len(header))
+    for row in sorted(rows, key=lambda r: r['mrr'], reverse=True):
+        print(f"{row['chunk_size']:>5} {row['overlap']:>7} {row['separators']:>20} {row['chunks']:>6} "
+              f"{row['index_size_mb']:>7.2f} {row['build_time']:>8.1f} {row['query_latency_ms']:>8.2f} "
+              f"{row['recall_at_1']:>6.3f} {row['recall_at_5']:>6.3f} {row['mrr']:>6.3f}")
+
+
+def save_table(rows, output_dir):
+    """Salva la tabella in JSON e CSV"""
+    output_dir.mkdir(exist_ok=True)
+    json_path = output_dir / 'sweep_chunking.json'
+    csv_path = output_dir / 'sweep_chunking.csv'
+
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, indent=2, ensure_ascii=False)
+
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n💾 Tabella salvata: {json_path}")
+    print(f"💾 Tabella salvata: {csv_path}")
+
+
+def run_sweep(sizes, overlaps, separators, unit='tokens', keep_indexes=False):
+    """Esegue lo sweep su tutte le combinazioni valide di parametri"""
+    print("="*80)
+    print(f"SWEEP PARAMETRI DI CHUNKING (lunghezza in {unit})")
+    print("="*80 + "\n")
+
+    original_dir = os.getcwd()
+    os.chdir(PROJECT_ROOT)
+    work_dir = tempfile.mkdtemp(prefix='sweep_chunking_', dir=str(PROJECT_ROOT))
+    rows = []
+
+    try:
+        from local_embeddings import LocalEmbeddings
+
+        # Modello ed embedding delle domande calcolati una sola volta per tutto lo sweep
+        embedder = LocalEmbeddings()
+        queries = load_faq_queries()
+        query_embeddings = embedder.embed_documents_array([q['query'] for q in queries], normalize=True)
+
+        grid = list(itertools.product(sizes, overlaps, separators))
+        for i, (size, overlap, separators_name) in enumerate(grid, 1):
+            print(f"\n[{i}/{len(grid)}] size={size} overlap={overlap} separatori={separators_name}")
+            row = run_configuration(size, overlap, separators_name, unit, embedder, queries, query_embeddings, work_dir)
+            if row is None:
+                print("   ⏭️  Saltata (overlap >= size)")
+                continue
+            rows.append(row)
+            print(f"   ✅ {row['chunks']} chunk, {row['index_size_mb']:.2f} MB, build {row['build_time']:.1f}s, "
+                  f"Recall@5 {row['recall_at_5']:.3f}, MRR {row['mrr']:.3f}")
+    finally:
+        os.chdir(original_dir)
+        if not keep_indexes:
+            shutil.rmtree(work_dir, onerror=lambda func, path, exc: print(f"⚠️  Impossibile rimuovere {path}: {exc[1]}"))
+
+    if rows:
+        print(f"\n{'='*80}")
+        print_table(rows)
+        save_table(rows, PROJECT_ROOT / 'results')
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep dei parametri di chunking")
+    parser.add_argument('--unit', choices=list(DEFAULT_GRID), default='tokens',
+                        help="Unità di misura di dimensione e overlap dei chunk")
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')])
+    parser.add_argument('--overlaps', type=lambda s: [int(x) for x in s.split(',')])
+    parser.add_argument('--separators', type=lambda s: s.split(','), default=list(SEPARATOR_PRESETS),
+                        help=f"Preset di separatori ({','.join(SEPARATOR_PRESETS)})")
+    parser.add_argument('--keep-indexes', action='store_true', help="Non cancellare gli indici temporanei")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    unknown = [name for name in args.separators if name not in SEPARATOR_PRESETS]
+    if unknown:
+        print(f"❌ Preset di separatori sconosciuti: {', '.join(unknown)}")
+        sys.exit(1)
+    grid = DEFAULT_GRID[args.unit]
+    run_sweep(args.sizes or grid['sizes'], args.overlaps or grid['overlaps'], args.separators,
+              args.unit, args.keep_indexes)
@@ -6,22 +6,123 @@ import sys
 import os
 import json
 import time
+import hashlib
+import argparse
 import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Any
 
 # Setup paths
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+from metriche_retrieval import chunk_source, score_retrieved_sources, run_retrieval_evaluation
+
 # metriche_qualita.py è obsoleto (dati inventati) - usa solo metriche base reali
 METRICS_AVAILABLE = False
 
 
+def run_fingerprint(chatbot, evaluation_set: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Elementi che determinano i risultati: un checkpoint con un'impronta diversa non è riutilizzabile"""
+    from main import TEMPLATE_VERSION, get_index_version
+
+    queries = json.dumps([item['query'] for item in evaluation_set], ensure_ascii=False)
+    return {
+        'model': chatbot.llm.model,
+        'base_url': chatbot.llm.base_url,
+        'template_version': TEMPLATE_VERSION,
+        'index_version': get_index_version(),
+        'answer_cache': chatbot.answer_cache is not None,
+        'samples': hashlib.sha256(queries.encode('utf-8')).hexdigest()[:16]
+    }
+
+
+def load_checkpoint(checkpoint_path: Path, fingerprint: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Carica i risultati già calcolati da un checkpoint JSONL (chiave: query)
+    La prima riga contiene l'impronta della valutazione: se modello, template, indice o
+    campioni sono cambiati il checkpoint è obsoleto e viene eliminato
+    """
+    completed = {}
+    if not checkpoint_path.exists():
+        return completed
+
+    valid = False
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Riga troncata da un'interruzione
+            if 'fingerprint' in record:
+                valid = record['fingerprint'] == fingerprint
+            elif valid and record.get('status') == 'ok':
+                completed[record['query']] = record
+
+    if not valid:
+        print("⚠️  Checkpoint di una valutazione diversa (modello, template, indice o campioni): ignorato")
+        checkpoint_path.unlink()
+    return completed
+
+
+def evaluate_item(chatbot, item: Dict[str, Any], quality_eval=None, rag_eval=None) -> Dict[str, Any]:
+    """Valuta una singola coppia Q&A riusando lo stesso retrieval per metriche e generazione"""
+    query = item['query']
+    reference = item['reference_answer']
+    start_time = time.time()
+    
+    # Recupera documenti una sola volta: i top-5 servono alle metriche,
+    # i primi 4 (come in chat()) alla generazione
+    retrieved_docs = chatbot.retrieve_documents(query, k=5)
+    retrieved_content = [doc['content'] for doc in retrieved_docs] if retrieved_docs else []
+    
+    response_dict = chatbot.generate_response(query, retrieved_docs[:4])
+    generated_response = response_dict['response']
+    response_time = time.time() - start_time
+    
+    result = {
+        'query': query,
+        'category': item['category'],
+        'reference_answer': reference,
+        'generated_answer': generated_response,
+        'response_time': response_time,
+        'cached': bool(response_dict.get('cached')),
+        'status': 'ok'
+    }
+    
+    if METRICS_AVAILABLE and quality_eval and rag_eval:
+        result['quality_metrics'] = quality_eval.evaluate_response(query, generated_response, reference)
+        result['rag_metrics'] = rag_eval.evaluate_rag_system(
+            query=query,
+            generated_response=generated_response,
+            reference_response=reference,
+            retrieved_documents=retrieved_content,
+            relevant_documents=[item['source_file']]
+        )
+    else:
+        # Solo metriche base + metriche di retrieval (file FAQ di origine dei chunk recuperati)
+        result['response_length'] = len(generated_response)
+        result['reference_length'] = len(reference)
+        result['rag_metrics'] = score_retrieved_sources(
+            [chunk_source(doc['content'], doc.get('metadata')) for doc in retrieved_docs], item['source_file']
+        )
+    
+    return result
+
+
 def evaluate_with_real_dataset(dataset_path: str, 
                                num_samples: int = None,
-                               save_results: bool = True):
+                               save_results: bool = True,
+                               workers: int = None,
+                               resume: bool = True):
     """
     Valuta il chatbot usando il dataset REALE estratto dai FAQ
+    Le query sono distribuite su 'workers' thread (default: OLLAMA_NUM_PARALLEL, cioè le
+    generazioni che Ollama esegue in parallelo) e ogni risultato è salvato subito in un
+    checkpoint JSONL: una valutazione interrotta riprende dalle query mancanti, purché
+    modello, template, indice e campioni siano gli stessi. A valutazione completa il
+    checkpoint viene eliminato
     """
     
     print("="*80)
@@ -46,7 +147,7 @@ def evaluate_with_real_dataset(dataset_path: str,
     
     # Cambia directory alla root del progetto (dove si trova vectordb/)
     original_dir = os.getcwd()
-    project_root = Path(__file__).parent.parent
+    project_root = Path(__file__).resolve().parent.parent
     os.chdir(project_root)
     print(f"\n📂 Directory di lavoro: {os.getcwd()}")
     
@@ -54,25 +155,46 @@ def evaluate_with_real_dataset(dataset_path: str,
     print(f"🤖 Inizializzazione chatbot...")
     try:
         from main import ChatbotRAG
-        chatbot = ChatbotRAG()
+        # Warm-up sincrono: i tempi misurati non includono il caricamento dei modelli
+        chatbot = ChatbotRAG(background=False)
+        fingerprint = run_fingerprint(chatbot, evaluation_set)
         print("✅ Chatbot pronto\n")
     except Exception as e:
         print(f"❌ Errore inizializzazione chatbot: {e}")
         os.chdir(original_dir)  # Ripristina directory originale
         return None
     
+    # Checkpoint per-item: i risultati già calcolati con la stessa impronta non vengono rigenerati
+    output_dir = project_root / 'results'
+    output_dir.mkdir(exist_ok=True)
+    checkpoint_path = output_dir / 'valutazione_checkpoint.jsonl'
+    if not resume and checkpoint_path.exists():
+        checkpoint_path.unlink()
+    completed = load_checkpoint(checkpoint_path, fingerprint)
+    pending = [item for item in evaluation_set if item['query'] not in completed]
+    if completed:
+        print(f"🔁 Riprese dal checkpoint: {len(completed)} query (risposte e tempi della run interrotta)")
+    if not checkpoint_path.exists():
+        with open(checkpoint_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'fingerprint': fingerprint}, ensure_ascii=False) + "\n")
+    
     # Usa solo metriche base (dataset reale)
     quality_eval = None
     rag_eval = None
     print("📊 Calcolo metriche base con dati reali\n")
     
+    workers = max(1, workers or int(os.getenv('OLLAMA_NUM_PARALLEL', '1')))
+    
     # Risultati
     results = {
         'metadata': {
             'evaluation_date': time.strftime('%Y-%m-%d %H:%M:%S'),
             'dataset_source': dataset['metadata']['source'],
             'num_evaluated': len(evaluation_set),
-            'metrics_full': METRICS_AVAILABLE
+            'metrics_full': METRICS_AVAILABLE,
+            'workers': workers,
+            'fingerprint': fingerprint,
+            'resumed_from_checkpoint': len(completed)
         },
         'individual_results': [],
         'aggregate_metrics': {}
@@ -80,9 +202,53 @@ def evaluate_with_real_dataset(dataset_path: str,
     
     # Valuta ogni query
     print(f"{'='*80}")
-    print(f"VALUTAZIONE IN CORSO")
+    print(f"VALUTAZIONE IN CORSO ({len(pending)} query, {workers} worker)")
     print(f"{'='*80}\n")
     
+    print_lock = threading.Lock()
+    wall_start = time.time()
+    
+    def run_item(index, item):
+        try:
+            result = evaluate_item(chatbot, item, quality_eval, rag_eval)
+        except Exception as e:
+            result = {'query': item['query'], 'status': 'error', 'error': str(e)}
+        
+        with print_lock:
+            print(f"[{index}/{len(evaluation_set)}] Categoria: {item['category']}")
+            print(f"Query: {item['query'][:70]}...")
+            if result['status'] == 'ok':
+                print(f"  ⏱️  Tempo: {result['response_time']:.1f}s{' (cache)' if result.get('cached') else ''}")
+                print(f"  📝 Risposta: {result['generated_answer'][:100]}...")
+                if 'quality_metrics' in result:
+                    print(f"  📊 Quality Score: {result['quality_metrics']['overall_score']:.3f}")
+                    print(f"  📊 RAG Score: {result['rag_metrics']['rag_overall_score']:.3f}")
+                else:
+                    print(f"  ℹ️  Lunghezza risposta: {result['response_length']} char")
+            else:
+                print(f"  ❌ Errore: {result['error']}")
+            print()
+            
+            with open(checkpoint_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        
+        if result['status'] == 'ok':
+            completed[item['query']] = result
+    
+    positions = {item['query']: i for i, item in enumerate(evaluation_set, 1)}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda item: run_item(positions[item['query']], item), pending))
+    
+    wall_time = time.time() - wall_start
+    
+    # Risultati nell'ordine del dataset
+    results['individual_results'] = [completed[item['query']] for item in evaluation_set
+                                     if item['query'] in completed]
+    
+    # Valutazione completa: il checkpoint non serve più (resta solo se ci sono query fallite da ripetere)
+    if len(results['individual_results']) == len(evaluation_set):
+        checkpoint_path.unlink()
+    
     all_quality_scores = []
     all_rag_scores = []
     all_response_times = []
@@ -90,91 +256,20 @@ def evaluate_with_real_dataset(dataset_path: str,
     all_rouge_scores = []
     all_bert_scores = []
     
-    for i, item in enumerate(evaluation_set, 1):
-        query = item['query']
-        reference = item['reference_answer']
-        category = item['category']
-        
-        print(f"[{i}/{len(evaluation_set)}] Categoria: {category}")
-        print(f"Query: {query[:70]}...")
-        
-        start_time = time.time()
-        
-        try:
-            # Recupera documenti
-            retrieved_docs = chatbot.retrieve_documents(query, k=5)
-            retrieved_content = [doc['content'] for doc in retrieved_docs] if retrieved_docs else []
-            
-            # Genera risposta
-            response_dict = chatbot.chat(query)
-            generated_response = response_dict['response']
-            
-            response_time = time.time() - start_time
-            all_response_times.append(response_time)
-            
-            print(f"  ⏱️  Tempo: {response_time:.1f}s")
-            print(f"  📝 Risposta: {generated_response[:100]}...")
-            
-            # Calcola metriche se disponibili
-            if METRICS_AVAILABLE and quality_eval and rag_eval:
-                # Metriche qualità
-                quality_metrics = quality_eval.evaluate_response(
-                    query,
-                    generated_response,
-                    reference
-                )
-                
-                # Metriche RAG
-                rag_metrics = rag_eval.evaluate_rag_system(
-                    query=query,
-                    generated_response=generated_response,
-                    reference_response=reference,
-                    retrieved_documents=retrieved_content,
-                    relevant_documents=[item['source_file']]
-                )
-                
-                all_quality_scores.append(quality_metrics['overall_score'])
-                all_rag_scores.append(rag_metrics['rag_overall_score'])
-                
-                if 'bleu_score' in rag_metrics:
-                    all_bleu_scores.append(rag_metrics['bleu_score'])
-                if 'rouge_l' in rag_metrics:
-                    all_rouge_scores.append(rag_metrics['rouge_l'])
-                if 'bert_score' in rag_metrics:
-                    all_bert_scores.append(rag_metrics['bert_score'])
-                
-                print(f"  📊 Quality Score: {quality_metrics['overall_score']:.3f}")
-                print(f"  📊 RAG Score: {rag_metrics['rag_overall_score']:.3f}")
-                
-                result = {
-                    'query': query,
-                    'category': category,
-                    'reference_answer': reference,
-                    'generated_answer': generated_response,
-                    'response_time': response_time,
-                    'quality_metrics': quality_metrics,
-                    'rag_metrics': rag_metrics
-                }
-            else:
-                # Solo metriche base
-                result = {
-                    'query': query,
-                    'category': category,
-                    'reference_answer': reference,
-                    'generated_answer': generated_response,
-                    'response_time': response_time,
-                    'response_length': len(generated_response),
-                    'reference_length': len(reference)
-                }
-                
-                print(f"  ℹ️  Lunghezza risposta: {len(generated_response)} char")
-            
-            results['individual_results'].append(result)
-            print()
-            
-        except Exception as e:
-            print(f"  ❌ Errore: {e}\n")
-            continue
+    for result in results['individual_results']:
+        # Le risposte dalla cache non sono generazioni: escluse dai tempi
+        if not result.get('cached'):
+            all_response_times.append(result['response_time'])
+        if 'quality_metrics' in result:
+            rag_metrics = result['rag_metrics']
+            all_quality_scores.append(result['quality_metrics']['overall_score'])
+            all_rag_scores.append(rag_metrics['rag_overall_score'])
+            if 'bleu_score' in rag_metrics:
+                all_bleu_scores.append(rag_metrics['bleu_score'])
+            if 'rouge_l' in rag_metrics:
+                all_rouge_scores.append(rag_metrics['rouge_l'])
+            if 'bert_score' in rag_metrics:
+                all_bert_scores.append(rag_metrics['bert_score'])
     
     # Calcola metriche aggregate
     print(f"\n{'='*80}")
@@ -184,9 +279,19 @@ def evaluate_with_real_dataset(dataset_path: str,
     results['aggregate_metrics'] = {
         'num_successful': len(results['individual_results']),
         'num_failed': len(evaluation_set) - len(results['individual_results']),
-        'success_rate': (len(results['individual_results']) / len(evaluation_set)) * 100
+        'success_rate': (len(results['individual_results']) / len(evaluation_set)) * 100,
+        'num_cached': sum(1 for r in results['individual_results'] if r.get('cached')),
+        'wall_time': wall_time
     }
     
+    print(f"🕒 Tempo totale valutazione: {wall_time:.1f}s ({len(pending)} query, {workers} worker)")
+    if results['aggregate_metrics']['num_cached']:
+        print(f"   💾 Risposte dalla cache (escluse dai tempi): {results['aggregate_metrics']['num_cached']}")
+    if pending and wall_time > 0:
+        new_times = [completed[item['query']]['response_time'] for item in pending if item['query'] in completed]
+        results['aggregate_metrics']['parallel_speedup'] = sum(new_times) / wall_time
+        print(f"   Speedup rispetto all'esecuzione seriale: {sum(new_times) / wall_time:.2f}x\n")
+    
     if all_response_times:
         results['aggregate_metrics']['response_times'] = {
             'mean': statistics.mean(all_response_times),
@@ -201,6 +306,18 @@ def evaluate_with_real_dataset(dataset_path: str,
         print(f"   Mediana: {results['aggregate_metrics']['response_times']['median']:.1f}s")
         print(f"   Range: {results['aggregate_metrics']['response_times']['min']:.1f}s - {results['aggregate_metrics']['response_times']['max']:.1f}s")
     
+    retrieval_scored = [r['rag_metrics'] for r in results['individual_results'] if 'rag_metrics' in r]
+    if retrieval_scored:
+        results['aggregate_metrics']['retrieval'] = {
+            name: statistics.mean(m[name] for m in retrieval_scored)
+            for name in ('recall_at_1', 'recall_at_3', 'recall_at_5', 'mrr', 'context_precision')
+            if all(name in m for m in retrieval_scored)
+        }
+        retrieval = results['aggregate_metrics']['retrieval']
+        print(f"\n🔎 Retrieval (top-5):")
+        print(f"   Recall@1/3/5: {retrieval.get('recall_at_1', 0):.3f} / {retrieval.get('recall_at_3', 0):.3f} / {retrieval.get('recall_at_5', 0):.3f}")
+        print(f"   MRR: {retrieval.get('mrr', 0):.3f}  Context precision: {retrieval.get('context_precision', 0):.3f}")
+    
     if all_quality_scores:
         results['aggregate_metrics']['quality_scores'] = {
             'mean': statistics.mean(all_quality_scores),
@@ -250,9 +367,6 @@ def evaluate_with_real_dataset(dataset_path: str,
     
     # Salva risultati
     if save_results:
-        output_dir = Path(__file__).parent.parent / 'results'
-        output_dir.mkdir(exist_ok=True)
-        
         output_file = output_dir / 'metriche_rag_dataset_reale.json'
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
@@ -280,6 +394,32 @@ if __name__ == "__main__":
     project_root = script_dir.parent
     dataset_file = project_root / 'data' / 'dataset_rag_reale.json'
     
+    parser = argparse.ArgumentParser(description="Valutazione RAG con dataset reale")
+    parser.add_argument('--samples', type=int, help="Numero di coppie Q&A da valutare (default: chiede)")
+    parser.add_argument('--workers', type=int, help="Query valutate in parallelo (default: OLLAMA_NUM_PARALLEL o 1)")
+    parser.add_argument('--fresh', action='store_true', help="Ignora il checkpoint di una run interrotta e riparte da zero")
+    parser.add_argument('--retrieval', action='store_true',
+                        help="Solo metriche di retrieval su tutte le FAQ (Recall@k, MRR, nDCG), senza LLM")
+    parser.add_argument('--routing', action='store_true',
+                        help="Con --retrieval: ricerca prima nella partizione della categoria della domanda")
+    parser.add_argument('--cache', action='store_true',
+                        help="Usa la cache delle risposte (di default disattivata: le FAQ sono preriscaldate)")
+    parser.add_argument('--fake-ollama', action='store_true',
+                        help="Server Ollama simulato al posto di Mistral (misura retrieval e orchestrazione)")
+    args = parser.parse_args()
+    
+    # Le FAQ sono le domande preriscaldate da prewarm_cache.py: senza --cache si valuta il modello
+    if not args.cache:
+        os.environ['ANSWER_CACHE'] = '0'
+    
+    if args.retrieval:
+        sys.exit(0 if run_retrieval_evaluation(routed=args.routing) else 1)
+    
+    if args.fake_ollama:
+        sys.path.append(str(project_root / 'test'))
+        from fake_ollama import use_fake_ollama
+        use_fake_ollama()
+    
     if not dataset_file.exists():
         print(f"❌ Dataset non trovato: {dataset_file}")
         print(f"\n📝 Esegui prima:")
@@ -288,10 +428,12 @@ if __name__ == "__main__":
     
     try:
         # Chiedi quanti samples valutare
-        print(f"Il dataset contiene 25 coppie Q&A per evaluation.\n")
-        choice = input("Quanti samples vuoi valutare? (1-25, ENTER per tutti): ").strip()
+        num_samples = args.samples
+        choice = None
+        if num_samples is None:
+            print(f"Il dataset contiene 25 coppie Q&A per evaluation.\n")
+            choice = input("Quanti samples vuoi valutare? (1-25, ENTER per tutti): ").strip()
         
-        num_samples = None
         if choice:
             try:
                 num_samples = int(choice)
@@ -307,7 +449,9 @@ if __name__ == "__main__":
         results = evaluate_with_real_dataset(
             dataset_path=str(dataset_file),
             num_samples=num_samples,
-            save_results=True
+            save_results=True,
+            workers=args.workers,
+            resume=not args.fresh
         )
         
         if results:
@@ -3,6 +3,7 @@ import sys
 import os
 import re
 import time
+import logging
 
 # Setup path - Corretto per la nuova struttura
 current_dir = os.path.dirname(__file__)
@@ -12,12 +13,22 @@ sys.path.append(src_path)
 # Import corretti
 try:
     from local_embeddings import LocalEmbeddings
-    from creazione_vectorstore import search_vectorstore
+    from creazione_vectorstore import search_routed, warm_up_vectorstore, get_index_version
+    from intent_classifier import get_intent_classifier
+    from prompt_templates import TEMPLATE_VERSION
+    from answer_cache import get_answer_cache, ResponseCache
+    from query_log import get_query_log, build_entry
+    from log_config import setup_logging
     from ollama_llm import OllamaLLM
+    from warmup import WarmUp
 except ImportError as e:
     st.error(f"Errore import moduli: {e}")
     st.stop()
 
+# Logging non bloccante per le sessioni concorrenti (idempotente tra i rerun dello script)
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Configurazione pagina
 st.set_page_config(
     page_title="ChatBot UniBg - Segreteria Studenti",
@@ -266,18 +277,45 @@ class ChatbotRAG:
     def __init__(self):
         self.embedder = LocalEmbeddings()
         self.llm = OllamaLLM()
+        # Warm-up in background: il primo studente non paga il caricamento dei modelli
+        self.warmup = WarmUp({
+            "llm": self.llm.warm_up,
+            "embedder": self.embedder.warm_up,
+            "vectordb": warm_up_vectorstore
+        }).start(background=True)
+        # Cache persistente delle risposte: sopravvive ai riavvii di Streamlit
+        self.response_cache = None
+        if os.getenv('ANSWER_CACHE', '1') == '1':
+            try:
+                self.response_cache = ResponseCache(get_answer_cache(), self.llm.model, TEMPLATE_VERSION,
+                                                    get_index_version)
+            except Exception as e:
+                logger.warning("Cache risposte non disponibile: %s", e)
+        try:
+            self.query_log = get_query_log()
+        except Exception:
+            self.query_log = None
         
     def retrieve_documents(self, query, k=5):
         try:
-            results = search_vectorstore(query, k=k, embedder=self.embedder)
+            # Intento dai centroidi FAQ con lo stesso embedding della ricerca;
+            # prima i chunk della categoria della domanda, indice completo se deboli
+            query_embedding = self.embedder.embed_query_array(query, normalize=True)
+            intent = get_intent_classifier(self.embedder).classify(query, query_embedding)
+            results = search_routed(query, intent, k=k, query_embedding=query_embedding)
             if not results["documents"] or not results["documents"][0]:
                 return []
             
             docs = []
-            for doc, distance in zip(results["documents"][0], results["distances"][0]):
+            metadatas = results.get("metadatas") or [[{}] * len(results["documents"][0])]
+            for doc, distance, metadata, chunk_id in zip(results["documents"][0], results["distances"][0],
+                                                         metadatas[0], results["ids"][0]):
                 docs.append({
                     "content": doc,
-                    "score": distance
+                    "score": distance,
+                    "metadata": metadata or {},
+                    "id": chunk_id,
+                    "intent": intent
                 })
             return docs
         except Exception:
@@ -290,11 +328,25 @@ class ChatbotRAG:
             context = "Informazioni non trovate nei documenti disponibili."
         
         try:
-            response = self.llm.generate(query, context)
+            category = context_docs[0].get("intent") if context_docs else None
+            
+            # Chiave con i documenti passati davvero come contesto (qui i primi 3)
+            cache_entry = None
+            if self.response_cache is not None and context_docs:
+                cached, cache_entry = self.response_cache.lookup(query, context_docs[:3], category,
+                                                                 self.llm.generation_options(category))
+                if cached is not None:
+                    return {"response": cached, "context_used": len(context_docs), "should_redirect": False,
+                            "cached": True}
+            
+            response = self.llm.generate(query, context, category=category)
+            if self.response_cache is not None and "REDIRECT_TO_HUMAN" not in response:
+                self.response_cache.store(cache_entry, query, response, category)
             return {
                 "response": response,
                 "context_used": len(context_docs),
-                "should_redirect": len(context_docs) == 0 or "REDIRECT_TO_HUMAN" in response
+                "should_redirect": len(context_docs) == 0 or "REDIRECT_TO_HUMAN" in response,
+                "cached": False
             }
         except Exception as e:
             return {
@@ -304,8 +356,19 @@ class ChatbotRAG:
             }
     
     def chat(self, query):
+        start_time = time.time()
         docs = self.retrieve_documents(query)
+        retrieval_time = time.time() - start_time
         result = self.generate_response(query, docs)
+        
+        if self.query_log is not None and self.query_log.sampled():
+            total_time = time.time() - start_time
+            result["timings"] = {"retrieval": retrieval_time, "generation": total_time - retrieval_time,
+                                 "total": total_time}
+            try:
+                self.query_log.record(build_entry(query, docs, result))
+            except Exception as e:
+                logger.warning("Errore log delle query: %s", e)
         return result
 
 @st.cache_resource
@@ -393,6 +456,12 @@ def main():
         st.error("❌ Impossibile inizializzare il chatbot. Verifica che Ollama sia in esecuzione.")
         return
     
+    with st.sidebar:
+        if chatbot.warmup.is_ready():
+            st.caption(f"🟢 Sistema pronto ({chatbot.warmup.summary()})")
+        else:
+            st.caption(f"🟡 Preparazione modelli in corso... ({chatbot.warmup.summary()})")
+    
     # Inizializza chat
     if 'messages' not in st.session_state:
         st.session_state.messages = []
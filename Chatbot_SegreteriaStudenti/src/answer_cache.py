@@ -0,0 +1,226 @@
+"""
+Cache persistente delle risposte (SQLite)
+Una risposta è riutilizzata solo se la domanda normalizzata, i chunk recuperati, la versione
+dell'indice, la versione dei template di prompt, il modello e le opzioni di generazione
+sono identici: la chiave è l'hash di tutti questi elementi, quindi qualsiasi modifica
+produce una chiave nuova. Le voci create con un'altra versione di indice, template o
+modello vengono eliminate all'apertura (purge) invece di restare inutilizzate su disco.
+La cache sopravvive ai riavvii della CLI e di Streamlit.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "answer_cache.sqlite3"
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+_PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    category TEXT,
+    response TEXT NOT NULL,
+    index_version TEXT,
+    template_version TEXT,
+    model TEXT,
+    created_at REAL NOT NULL,
+    last_hit REAL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_cache_instances = {}
+_cache_instances_lock = threading.Lock()
+
+
+def normalize_query(query: str) -> str:
+    """Domanda in minuscolo, senza punteggiatura e spazi ripetuti"""
+    query = _PUNCTUATION_PATTERN.sub(' ', query.lower())
+    return _WHITESPACE_PATTERN.sub(' ', query).strip()
+
+
+def cache_key(query: str, chunk_ids: Iterable[str], index_version: str, template_version: str,
+              model: str, options: Dict[str, Any], category: str = None) -> str:
+    """Hash SHA-256 di tutti gli elementi che determinano la risposta generata"""
+    payload = json.dumps({
+        'query': normalize_query(query),
+        'chunks': list(chunk_ids),
+        'index': index_version,
+        'template': template_version,
+        'model': model,
+        'options': options,
+        'category': category
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """Cache esatta su SQLite, condivisibile tra thread (una connessione protetta da lock)"""
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES):
+        """Apre (o crea) il database della cache in path"""
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Risposta salvata per la chiave, None se assente"""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE answers SET hits = hits + 1, last_hit = ? WHERE key = ?",
+                               (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, query: str, response: str, category: str = None,
+            index_version: str = None, template_version: str = None, model: str = None):
+        """Salva una risposta; oltre max_entries elimina le voci usate meno di recente"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, query, category, response, index_version, "
+                "template_version, model, created_at, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, query, category, response, index_version, template_version, model, time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers "
+                    "ORDER BY COALESCE(last_hit, created_at) LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def purge(self, index_version: str = None, template_version: str = None, model: str = None) -> int:
+        """Elimina le voci create con una versione di indice, template o modello diversa"""
+        conditions, params = [], []
+        for column, value in (('index_version', index_version), ('template_version', template_version),
+                              ('model', model)):
+            if value is not None:
+                conditions.append(f"{column} IS NOT ?")
+                params.append(value)
+        if not conditions:
+            return 0
+
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM answers WHERE {' OR '.join(conditions)}", params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        """Svuota la cache"""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Numero di voci, hit totali e voci per categoria"""
+        with self._lock:
+            entries, hits = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM answers").fetchone()
+            by_category = dict(self._conn.execute(
+                "SELECT COALESCE(category, 'generic'), COUNT(*) FROM answers GROUP BY category"
+            ).fetchall())
+        return {'path': os.path.abspath(self.path), 'entries': entries, 'hits': hits, 'by_category': by_category}
+
+    def close(self):
+        """Chiude la connessione al database"""
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    Accesso alla cache per chi genera le risposte (CLI e Streamlit): chiave, purge delle voci
+    obsolete e get/put. Un errore della cache (es. "database is locked" mentre il job di
+    preriscaldamento scrive) non fa mai fallire la richiesta: si genera la risposta normalmente.
+    """
+
+    def __init__(self, cache: AnswerCache, model: str, template_version: str,
+                 index_version: Callable[[], str]):
+        """index_version: funzione che restituisce la versione corrente dell'indice"""
+        self.cache = cache
+        self.model = model
+        self.template_version = template_version
+        self.index_version = index_version
+        self._purged_for = None
+
+    def lookup(self, query: str, context_docs: List[Dict[str, Any]], category: str,
+               options: Dict[str, Any]) -> Tuple[Optional[str], Optional[Tuple[str, str]]]:
+        """
+        Risposta salvata per la domanda con i documenti passati come contesto al modello
+        Restituisce (risposta o None, voce da passare a store dopo la generazione)
+        """
+        try:
+            index_version = self.index_version()
+            # Dopo una ricostruzione dell'indice (o al primo uso) elimina le voci obsolete
+            if self._purged_for != index_version:
+                removed = self.cache.purge(index_version, self.template_version, self.model)
+                if removed:
+                    logger.info("Cache risposte: %d voci obsolete rimosse", removed)
+                self._purged_for = index_version
+
+            key = cache_key(query, [doc.get("id") for doc in context_docs], index_version,
+                            self.template_version, self.model, options, category)
+            return self.cache.get(key), (key, index_version)
+        except Exception as e:
+            logger.warning("Errore cache risposte: %s", e)
+            return None, None
+
+    def store(self, entry: Optional[Tuple[str, str]], query: str, response: str, category: str = None):
+        """Salva la risposta generata per la voce restituita da lookup (nessuna azione se None)"""
+        if entry is None:
+            return
+        key, index_version = entry
+        try:
+            self.cache.put(key, query, response, category, index_version, self.template_version, self.model)
+        except Exception as e:
+            logger.warning("Errore salvataggio cache risposte: %s", e)
+
+
+def get_answer_cache(persist_dir: str = "vectordb", path: str = None) -> AnswerCache:
+    """Cache condivisa per processo; di default accanto al vectorstore (ANSWER_CACHE_PATH per cambiarla)"""
+    path = os.path.abspath(path or os.getenv("ANSWER_CACHE_PATH") or os.path.join(persist_dir, CACHE_FILE))
+    with _cache_instances_lock:
+        if path not in _cache_instances:
+            _cache_instances[path] = AnswerCache(path)
+        return _cache_instances[path]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gestione della cache delle risposte")
+    parser.add_argument('--path', default=None, help="Database della cache (default vectordb/answer_cache.sqlite3)")
+    parser.add_argument('--clear', action='store_true', help="Elimina tutte le voci")
+    args = parser.parse_args()
+
+    cache = get_answer_cache(path=args.path)
+    if args.clear:
+        cache.clear()
+        print("🗑️  Cache svuotata")
+
+    stats = cache.stats()
+    print(f"💾 Cache risposte: {stats['path']}")
+    print(f"   Voci: {stats['entries']}  Hit totali: {stats['hits']}")
+    for category, count in sorted(stats['by_category'].items()):
+        print(f"   - {category:28s} {count}")
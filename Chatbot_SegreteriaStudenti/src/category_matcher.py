@@ -0,0 +1,138 @@
+"""
+Riconoscimento delle categorie di domanda con un unico matcher precompilato
+Tutte le parole chiave di tutte le categorie sono unite in una sola espressione regolare
+a trie costruita all'import: una sola passata sul testo restituisce ogni categoria
+trovata con il suo peso, invece di un ciclo "pattern in testo" per ogni parola chiave.
+"""
+
+import re
+from typing import Dict
+
+# Parole chiave (sottostringhe, minuscole) con peso per categoria, in ordine di priorità:
+# a parità di punteggio vince la categoria dichiarata prima.
+# Le parole generiche ("dove", "quando", "domanda") pesano meno: da sole bastano a
+# scegliere la categoria, ma non prevalgono su un termine specifico.
+CATEGORY_PATTERNS = {
+    'iscrizioni_esami': {
+        'iscriver': 1.0, 'esam': 1.0, 'prenotare': 1.0, 'prenotazione': 1.0, 'sessione': 1.0
+    },
+    'tasse_pagamenti': {
+        'tasse': 1.0, 'pagare': 1.0, 'pagament': 1.0, 'retta': 1.0, 'bollettino': 1.0, 'importo': 1.0
+    },
+    'certificati_documenti': {
+        'certificat': 1.0, 'document': 1.0, 'attestat': 1.0, 'dichiarazione': 1.0, 'autocertificazione': 1.0
+    },
+    'orari_contatti': {
+        'orari': 1.0, 'orario': 1.0, 'contatt': 1.0, 'telefono': 1.0, 'email': 1.0, 'dove': 0.5, 'quando': 0.5
+    },
+    'procedure_amministrative': {
+        'procedura': 1.0, 'come fare': 1.0, 'iter': 0.5, 'pratica': 1.0, 'domanda': 0.5, 'richiesta': 0.5
+    },
+    'servizi_studenti': {
+        'servizi': 1.0, 'agevolazioni': 1.0, 'borse': 1.0, 'alloggi': 1.0, 'mensa': 1.0, 'trasporti': 1.0
+    }
+}
+
+# Parole chiave per dare priorità ai paragrafi del contesto in base alla categoria della domanda
+PRIORITY_KEYWORDS = {
+    'iscrizioni_esami': {'iscrizione': 1.0, 'esame': 1.0, 'prenotazione': 1.0, 'sessione': 1.0, 'scadenza': 1.0},
+    'tasse_pagamenti': {'tassa': 1.0, 'pagamento': 1.0, 'importo': 1.0, 'scadenza': 1.0, 'bollettino': 1.0},
+    'certificati_documenti': {'certificato': 1.0, 'documento': 1.0, 'richiesta': 1.0, 'rilascio': 1.0, 'tempo': 1.0},
+    'orari_contatti': {'orario': 1.0, 'contatto': 1.0, 'telefono': 1.0, 'email': 1.0, 'sportello': 1.0},
+    'procedure_amministrative': {'procedura': 1.0, 'iter': 1.0, 'passo': 1.0, 'documento': 1.0, 'pratica': 1.0},
+    'servizi_studenti': {'servizio': 1.0, 'agevolazione': 1.0, 'borsa': 1.0, 'alloggio': 1.0, 'requisito': 1.0},
+    'generic': {'università': 1.0, 'studente': 1.0, 'segreteria': 1.0}
+}
+
+
+def _trie_pattern(keywords) -> str:
+    """
+    Espressione regolare a trie per un insieme di parole chiave
+    I prefissi comuni sono fattorizzati ("c(?:ertificat|o(?:me fare|ntatt))"): a ogni posizione
+    del testo il motore prova un solo ramo per carattere invece di tutte le alternative.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        optional = '' in node
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')' + ('?' if optional else '')
+
+    return build(trie)
+
+
+class CategoryMatcher:
+    """Matcher multi-pattern: un'unica regex a trie per tutte le parole chiave, compilata una volta"""
+
+    def __init__(self, patterns: Dict[str, Dict[str, float]]):
+        """patterns: categoria -> {parola chiave: peso}; una parola chiave può appartenere a più categorie"""
+        self.categories = list(patterns)
+        self._order = {category: i for i, category in enumerate(self.categories)}
+        self._weights = {}
+        for category, keywords in patterns.items():
+            for keyword, weight in keywords.items():
+                self._weights.setdefault(keyword.lower(), []).append((category, weight))
+
+        # La regex a trie trova la parola chiave più lunga a ogni posizione ("orario" prima di "orari")
+        self._regex = re.compile(_trie_pattern(self._weights))
+        # Regex per singola categoria: lo scoring dei paragrafi cerca solo le parole chiave necessarie
+        self._category_regex = {
+            category: (re.compile(_trie_pattern(k.lower() for k in keywords)), dict(keywords))
+            for category, keywords in patterns.items()
+        }
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Tutte le categorie trovate nel testo con la somma dei pesi delle occorrenze (una sola passata)"""
+        scores = {}
+        for keyword in self._regex.findall(text.lower()):
+            for category, weight in self._weights[keyword]:
+                scores[category] = scores.get(category, 0.0) + weight
+        return scores
+
+    def best(self, text: str, default: str = 'generic') -> str:
+        """Categoria con punteggio più alto (a parità, quella dichiarata prima)"""
+        scores = self.scores(text)
+        if not scores:
+            return default
+        return max(scores, key=lambda category: (scores[category], -self._order[category]))
+
+    def score(self, text: str, category: str) -> float:
+        """Punteggio del testo per una singola categoria (una passata con le sole sue parole chiave)"""
+        if category not in self._category_regex:
+            return 0.0
+        regex, weights = self._category_regex[category]
+        return sum(weights[keyword] for keyword in regex.findall(text.lower()))
+
+
+# Matcher condivisi, costruiti una volta all'import
+QUESTION_MATCHER = CategoryMatcher(CATEGORY_PATTERNS)
+PRIORITY_MATCHER = CategoryMatcher(PRIORITY_KEYWORDS)
+
+
+def categorize(text: str) -> str:
+    """Categoria di una domanda (prompt, footer dei link, metadati dei chunk)"""
+    return QUESTION_MATCHER.best(text)
+
+
+def category_scores(text: str) -> Dict[str, float]:
+    """Tutte le categorie riconosciute in una domanda con il loro peso"""
+    return QUESTION_MATCHER.scores(text)
+
+
+if __name__ == "__main__":
+    for question in [
+        "Come faccio a iscrivermi agli esami?",
+        "Quando devo pagare le tasse universitarie?",
+        "Dove posso richiedere un certificato di laurea?",
+        "Quali sono gli orari della segreteria?"
+    ]:
+        print(f"{question:50s} -> {categorize(question):25s} {category_scores(question)}")
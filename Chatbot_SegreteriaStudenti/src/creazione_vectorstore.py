@@ -1,31 +1,176 @@
 import os
+import re
+import sys
 import glob
-import chromadb
-from chromadb.config import Settings
+import hashlib
+import threading
+from collections import Counter
+import numpy as np
 from dotenv import load_dotenv
 
 from local_embeddings import LocalEmbeddings
-from dividi_chunks import split_text_in_chunks
+from dividi_chunks import split_text_in_chunks, split_text_by_tokens
+from prompt_templates import categorize_question
+from intent_classifier import faq_file_category
+
+# Il riconoscimento delle coppie domanda/risposta è condiviso con l'estrazione del dataset di valutazione
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from estrai_dataset_reale import parse_faq_file
 
 load_dotenv()
 
+# Collection aperte, riutilizzate tra le ricerche (chiave: percorso, nome collection)
+_collection_cache = {}
+_collection_lock = threading.Lock()
+
+
+# Distanza (L2 al quadrato su embedding normalizzati, cioè 2 - 2·coseno) oltre la quale il chunk
+# migliore della partizione di categoria è considerato debole e si cerca nell'intero indice
+ROUTING_MAX_DISTANCE = float(os.getenv("ROUTING_MAX_DISTANCE", "0.9"))
+
+# Titoli numerati delle guide ("4. PIANI DI STUDIO ED ESAMI DI PROFITTO"): numero seguito da testo senza minuscole
+_HEADING_PATTERN = re.compile(r"^\d+(?:\.\d+)*\.?\s+[^a-zà-ù]{3,}$")
+_URL_PATTERN = re.compile(r"https?://[^\s<>\"'()\[\]]+")
+
 
 def clean_text(text: str) -> str:
     """Normalizza spazi e ritorni a capo per migliorare consistenza vettoriale"""
     return " ".join(text.split())
 
 
-def crea_vectorstore_free(chunk_list, persist_dir="vectordb"):
+def chunk_metadata(chunk, source_file, doc_type, page=None, section=None, question=None):
+    """
+    Metadati di un chunk: file e tipo di documento, pagina, sezione, link e hash del contenuto
+    La categoria è quella usata dal routing: per le FAQ è la categoria del file (la stessa dei
+    centroidi di intent_classifier, quindi una domanda classificata correttamente trova le sue
+    FAQ nella partizione), altrimenti PromptOptimizer su domanda o titolo di sezione
+    ChromaDB accetta solo valori scalari: i link sono una stringa separata da spazi
+    """
+    metadata = {
+        "source_file": source_file,
+        "doc_type": doc_type,
+        "page": page,
+        "section": section,
+        "question": question,
+        "urls": " ".join(dict.fromkeys(url.rstrip(".,;:") for url in _URL_PATTERN.findall(chunk))),
+        "content_hash": hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:16],
+        "category": (doc_type == "faq" and faq_file_category(source_file))
+                    or categorize_question(question or section or chunk),
+    }
+    return {key: value for key, value in metadata.items() if value not in (None, "")}
+
+
+def split_pdf_text(testo, split):
+    """
+    Divide il testo estratto da un PDF pagina per pagina (separatore \\f di testi_estratti)
+    Restituisce tuple (chunk, pagina, sezione); la sezione è l'ultimo titolo numerato
+    che precede l'inizio del chunk, anche se si trova in una pagina precedente.
+    Senza separatori di pagina (estrazioni precedenti) la pagina è None.
+    """
+    pagine = testo.split("\f")
+    risultati = []
+    sezione = None
+    for numero, pagina in enumerate(pagine, start=1):
+        # Posizione dei titoli nel testo normalizzato della pagina
+        titoli = []
+        offset = 0
+        for riga in pagina.splitlines():
+            riga = clean_text(riga)
+            if not riga:
+                continue
+            if _HEADING_PATTERN.match(riga):
+                titoli.append((offset, riga))
+            offset += len(riga) + 1
+
+        testo_pagina = clean_text(pagina)
+        if not testo_pagina:
+            continue
+
+        cursore = 0
+        for chunk in split(testo_pagina):
+            inizio = testo_pagina.find(chunk[:80], cursore)
+            if inizio >= 0:
+                cursore = inizio
+            while titoli and titoli[0][0] <= cursore:
+                sezione = titoli.pop(0)[1]
+            risultati.append((chunk, numero if len(pagine) > 1 else None, sezione))
+        if titoli:
+            sezione = titoli[-1][1]
+    return risultati
+
+
+def _get_client(persist_dir):
+    """Apre il client ChromaDB persistente (import differito: chromadb è pesante da caricare)"""
+    import chromadb
+    from chromadb.config import Settings
+
+    return chromadb.PersistentClient(
+        path=persist_dir,
+        settings=Settings(anonymized_telemetry=False),
+    )
+
+
+def _collection_key(persist_dir):
+    """Chiave di cache per la collection configurata in un certo percorso"""
+    return (os.path.abspath(persist_dir), os.getenv("VECTORDB_COLLECTION", "unibg_docs"))
+
+
+def get_collection(persist_dir="vectordb"):
+    """Restituisce la collection del vectorstore, aprendo il client una sola volta per processo"""
+    key = _collection_key(persist_dir)
+    with _collection_lock:
+        if key not in _collection_cache:
+            client = _get_client(persist_dir)
+            _collection_cache[key] = client.get_collection(key[1])
+        return _collection_cache[key]
+
+
+def close_vectorstore(persist_dir="vectordb"):
+    """
+    Rimuove dalla cache le collection di persist_dir e ferma il client ChromaDB condiviso:
+    finché il client è attivo i file SQLite/HNSW restano aperti e su Windows la cartella
+    non può essere cancellata
+    """
+    path = os.path.abspath(persist_dir)
+    with _collection_lock:
+        for key in [key for key in _collection_cache if key[0] == path]:
+            del _collection_cache[key]
+
+    # ChromaDB riusa un System per percorso (API interna, assente in alcune versioni)
+    try:
+        from chromadb.api.client import SharedSystemClient
+
+        for identifier in {persist_dir, path}:
+            system = SharedSystemClient._identifier_to_system.pop(identifier, None)
+            if system is not None:
+                system.stop()
+    except (ImportError, AttributeError):
+        pass
+
+
+def get_index_version(persist_dir="vectordb"):
+    """Versione dell'indice: id della collection, nuovo a ogni ricostruzione del vectorstore"""
+    return str(get_collection(persist_dir).id)
+
+
+def warm_up_vectorstore(persist_dir="vectordb"):
+    """Apre la collection ed esegue una query fittizia per caricare l'indice HNSW in memoria"""
+    collection = get_collection(persist_dir)
+    sample = collection.get(limit=1, include=["embeddings"])
+    if sample["embeddings"] is not None and len(sample["embeddings"]) > 0:
+        collection.query(query_embeddings=np.asarray(sample["embeddings"][:1], dtype=np.float32), n_results=1)
+    return collection.count()
+
+
+def crea_vectorstore_free(chunk_list, persist_dir="vectordb", embedder=None, metadatas=None):
     """Crea database vettoriale usando ChromaDB e SentenceTransformers per embedding locali"""
     print(f"Creazione vectorstore in {persist_dir}...")
 
-    embedder = LocalEmbeddings()
+    if embedder is None:
+        embedder = LocalEmbeddings()
 
     # Configura ChromaDB
-    client = chromadb.PersistentClient(
-        path=persist_dir,
-        settings=Settings(anonymized_telemetry=False),
-    )
+    client = _get_client(persist_dir)
 
     # Nome della collection
     collection_name = os.getenv("VECTORDB_COLLECTION", "unibg_docs")
@@ -43,7 +188,8 @@ def crea_vectorstore_free(chunk_list, persist_dir="vectordb"):
 
     print(f"Preparazione di {len(chunk_list)} chunk...")
 
-    embeddings = embedder.embed_documents(chunk_list)
+    # Matrice float32 (n, dim) passata direttamente a Chroma, senza conversione in liste
+    embeddings = embedder.embed_documents_array(chunk_list, normalize=True)
 
     ids = [f"{collection_name}_chunk_{i}" for i in range(len(chunk_list))]
 
@@ -52,100 +198,219 @@ def crea_vectorstore_free(chunk_list, persist_dir="vectordb"):
         documents=chunk_list,
         embeddings=embeddings,
         ids=ids,
-        metadatas=[{"source": f"chunk_{i}"} for i in range(len(chunk_list))],
+        metadatas=[
+            {"source": f"chunk_{i}", **(metadatas[i] if metadatas else {})} for i in range(len(chunk_list))
+        ],
     )
 
+    with _collection_lock:
+        _collection_cache[_collection_key(persist_dir)] = collection
+
     print(f"Vectorstore creato con {len(chunk_list)} documenti!")
     print(f"Percorso: {os.path.abspath(persist_dir)}")
 
     return collection
 
 
-def search_vectorstore(query, persist_dir="vectordb", k=5, embedder=None):
-    """Esegue ricerca semantica nel database vettoriale esistente"""
-    if embedder is None:
-        embedder = LocalEmbeddings()
-
-    client = chromadb.PersistentClient(
-        path=persist_dir,
-        settings=Settings(anonymized_telemetry=False)
-    )
-    collection_name = os.getenv("VECTORDB_COLLECTION", "unibg_docs")
-    collection = client.get_collection(collection_name)
+def search_vectorstore(query, persist_dir="vectordb", k=5, embedder=None, where=None, query_embedding=None):
+    """
+    Esegue ricerca semantica nel database vettoriale esistente
+    where: filtro sui metadati in sintassi ChromaDB, es. {"category": "tasse_pagamenti"}
+    query_embedding: embedding normalizzato già calcolato (es. per la classificazione di intento)
+    """
+    collection = get_collection(persist_dir)
 
-    query_embedding = embedder.embed_query(query)
+    if query_embedding is None:
+        if embedder is None:
+            embedder = LocalEmbeddings()
+        query_embedding = embedder.embed_query_array(query, normalize=True)
 
-    results = collection.query(query_embeddings=[query_embedding], n_results=k)
+    results = collection.query(query_embeddings=query_embedding[np.newaxis, :], n_results=k, where=where or None)
     return results
 
 
-if __name__ == "__main__":
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    cartella_faq = os.path.join(BASE_DIR, "../data/FAQ")
-    cartella_estratti = os.path.join(BASE_DIR, "../data/testi_estratti")
+def select_routed(partition, fallback, k, max_distance=None):
+    """
+    Combina i risultati (di una singola query) della partizione di categoria e dell'indice globale
+    partition/fallback: dict con liste ids, documents, metadatas, distances; fallback può essere
+    una funzione che esegue la ricerca globale solo se serve.
+    Partizione vuota o con il migliore oltre max_distance: risultati globali.
+    Partizione con meno di k chunk: completata con i migliori globali non già presenti.
+    Restituisce (risultati, True se la partizione è stata usata)
+    """
+    if max_distance is None:
+        max_distance = ROUTING_MAX_DISTANCE
+
+    distances = partition["distances"] if partition else []
+    if not distances or distances[0] > max_distance:
+        return (fallback() if callable(fallback) else fallback), False
+    if len(distances) >= k:
+        return partition, True
+
+    fallback = fallback() if callable(fallback) else fallback
+    merged = {key: list(partition[key]) for key in ("ids", "documents", "metadatas", "distances")}
+    seen = set(merged["ids"])
+    for i, chunk_id in enumerate(fallback["ids"]):
+        if len(merged["ids"]) >= k:
+            break
+        if chunk_id not in seen:
+            for key in merged:
+                merged[key].append(fallback[key][i])
+    return merged, True
+
+
+def _first_query(results):
+    """Risultati della prima (unica) query di collection.query"""
+    return {key: (results.get(key) or [[]])[0] for key in ("ids", "documents", "metadatas", "distances")}
+
+
+def search_routed(query, category, persist_dir="vectordb", k=5, embedder=None, max_distance=None,
+                  query_embedding=None):
+    """
+    Ricerca instradata per categoria: prima i soli chunk della categoria della domanda
+    (metadato "category"), l'intero indice solo se la partizione dà risultati deboli
+    Risultato nel formato di search_vectorstore con in più "route": categoria usata o "global"
+    """
+    collection = get_collection(persist_dir)
+
+    if query_embedding is None:
+        if embedder is None:
+            embedder = LocalEmbeddings()
+        query_embedding = embedder.embed_query_array(query, normalize=True)
+    query_embedding = query_embedding[np.newaxis, :]
+
+    def global_search():
+        return _first_query(collection.query(query_embeddings=query_embedding, n_results=k))
+
+    partition = None
+    if category and category != "generic":
+        try:
+            partition = _first_query(collection.query(
+                query_embeddings=query_embedding, n_results=k, where={"category": category}
+            ))
+        except Exception:
+            partition = None  # Indice senza metadati di categoria: ricerca globale
+
+    selected, routed = select_routed(partition, global_search, k, max_distance)
+    results = {key: [value] for key, value in selected.items()}
+    results["route"] = category if routed else "global"
+    return results
 
-    print("CREAZIONE DATABASE VETTORIALE")
-    print("=" * 50)
+
+def carica_corpus(cartella_faq, cartella_estratti, max_len=None, overlap=None, separators=None,
+                  unit="tokens", faq_per_domanda=True, verbose=True):
+    """
+    Legge FAQ e testi PDF estratti e li divide in chunk (l'origine è nei metadati, non nel testo)
+    Restituisce chunk, metadati per chunk e numero di file processati
+    unit="tokens": max_len/overlap in token del modello di embedding (default 254/40)
+    unit="chars": max_len/overlap in caratteri (default 1000/200)
+    faq_per_domanda=True: un chunk per ogni coppia domanda/risposta delle FAQ
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    if unit == "tokens":
+        def split(testo):
+            return split_text_by_tokens(testo, max_tokens=max_len, overlap_tokens=overlap, separators=separators)
+    else:
+        def split(testo):
+            return split_text_in_chunks(testo, max_len=max_len or 1000,
+                                        overlap=200 if overlap is None else overlap, separators=separators)
 
     tutti_i_chunks = []
+    metadati = []
     file_processati = 0
 
     # 1. Processa file FAQ
     if os.path.exists(cartella_faq):
-        print(f"\nELABORAZIONE FAQ da {cartella_faq}")
-        for filepath in glob.glob(os.path.join(cartella_faq, "*.txt")):
+        log(f"\nELABORAZIONE FAQ da {cartella_faq}")
+        for filepath in sorted(glob.glob(os.path.join(cartella_faq, "*.txt"))):
             filename = os.path.basename(filepath)
-            print(f"   {filename}")
+            log(f"   {filename}")
 
             try:
+                # Una FAQ = un chunk: la risposta completa resta insieme alla sua domanda
+                coppie = parse_faq_file(filepath) if faq_per_domanda else []
+                if coppie:
+                    for coppia in coppie:
+                        domanda = clean_text(coppia["question"])
+                        chunk = f"{domanda} {clean_text(coppia['answer'])}"
+                        tutti_i_chunks.append(chunk)
+                        metadati.append(chunk_metadata(chunk, filename, "faq", question=domanda))
+                    file_processati += 1
+                    log(f"      {len(coppie)} coppie domanda/risposta")
+                    continue
+
                 with open(filepath, "r", encoding="utf-8") as f:
                     testo = clean_text(f.read())
 
                 if testo:
-                    chunks = split_text_in_chunks(testo, max_len=1000, overlap=200)
-                    for i, chunk in enumerate(chunks):
-                        tutti_i_chunks.append(f"[FAQ-{filename.replace('.txt', '')}] {chunk}")
+                    chunks = split(testo)
+                    for chunk in chunks:
+                        tutti_i_chunks.append(chunk)
+                        metadati.append(chunk_metadata(chunk, filename, "faq"))
                     file_processati += 1
-                    print(f"      {len(chunks)} chunk estratti")
+                    log(f"      {len(chunks)} chunk estratti")
             except Exception as e:
-                print(f"      Errore nel processare {filename}: {e}")
+                log(f"      Errore nel processare {filename}: {e}")
     else:
-        print(f"Cartella FAQ {cartella_faq} non trovata")
+        log(f"Cartella FAQ {cartella_faq} non trovata")
 
     # 2. Processa file PDF estratti
     if os.path.exists(cartella_estratti):
-        print(f"\nELABORAZIONE PDF ESTRATTI da {cartella_estratti}")
-        for filepath in glob.glob(os.path.join(cartella_estratti, "*_extracted.txt")):
+        log(f"\nELABORAZIONE PDF ESTRATTI da {cartella_estratti}")
+        for filepath in sorted(glob.glob(os.path.join(cartella_estratti, "*_extracted.txt"))):
             filename = os.path.basename(filepath)
-            print(f"   {filename}")
+            log(f"   {filename}")
 
             try:
                 with open(filepath, "r", encoding="utf-8") as f:
-                    testo = clean_text(f.read())
+                    testo = f.read()
 
-                if testo:
-                    chunks = split_text_in_chunks(testo, max_len=1000, overlap=200)
-                    fonte = filename.replace("_extracted.txt", "")
-                    for i, chunk in enumerate(chunks):
-                        tutti_i_chunks.append(f"[PDF-{fonte}] {chunk}")
+                if testo.strip():
+                    chunks = split_pdf_text(testo, split)
+                    for chunk, pagina, sezione in chunks:
+                        tutti_i_chunks.append(chunk)
+                        metadati.append(chunk_metadata(chunk, filename, "pdf", page=pagina, section=sezione))
                     file_processati += 1
-                    print(f"      {len(chunks)} chunk estratti")
+                    log(f"      {len(chunks)} chunk estratti")
             except Exception as e:
-                print(f"      Errore nel processare {filename}: {e}")
+                log(f"      Errore nel processare {filename}: {e}")
     else:
-        print(f"Cartella estratti {cartella_estratti} non trovata")
+        log(f"Cartella estratti {cartella_estratti} non trovata")
+
+    return tutti_i_chunks, metadati, file_processati
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    cartella_faq = os.path.join(BASE_DIR, "../data/FAQ")
+    cartella_estratti = os.path.join(BASE_DIR, "../data/testi_estratti")
+
+    print("CREAZIONE DATABASE VETTORIALE")
+    print("=" * 50)
+
+    tutti_i_chunks, metadati, file_processati = carica_corpus(cartella_faq, cartella_estratti)
 
     # 3. Crea vectorstore
     if tutti_i_chunks:
         print(f"\nRIEPILOGO:")
         print(f"   File processati: {file_processati}")
         print(f"   Chunk totali: {len(tutti_i_chunks)}")
+        categorie = Counter(metadato.get("category", "generic") for metadato in metadati)
+        print(f"   Chunk per categoria: {', '.join(f'{nome} {n}' for nome, n in sorted(categorie.items()))}")
         print(f"\nCreazione vectorstore...")
 
         try:
-            vectordb = crea_vectorstore_free(tutti_i_chunks)
+            embedder = LocalEmbeddings()
+            vectordb = crea_vectorstore_free(tutti_i_chunks, metadatas=metadati, embedder=embedder)
             print(f"\nDATABASE VETTORIALE COMPLETATO!")
             print(f"   Documenti salvati: {len(tutti_i_chunks)}")
+
+            # Centroidi per la classificazione di intento, calcolati con lo stesso modello dell'indice
+            from intent_classifier import IntentClassifier, CENTROIDS_FILE
+            classifier = IntentClassifier.from_faq(embedder, cartella_faq)
+            classifier.save(os.path.join("vectordb", CENTROIDS_FILE))
+            print(f"   Centroidi di intento: {len(classifier.faq_categories)} categorie FAQ")
             
         except Exception as e:
             print(f"Errore nella creazione del vectorstore: {e}")
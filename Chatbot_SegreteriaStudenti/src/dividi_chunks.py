@@ -1,20 +1,142 @@
+"""
+Suddivisione dei testi in chunk per il vectorstore, senza dipendenze da LangChain
+Lo splitter è ricorsivo (paragrafi -> frasi -> parole) e lavora su offset nel testo
+originale: i pezzi vengono uniti in chunk con un'unica passata e ogni chunk
+viene estratto con una sola slice. La lunghezza si misura in caratteri oppure
+in token del modello di embedding, che tronca i testi oltre max_seq_length.
+"""
+
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-def split_text_in_chunks(text, max_len=1000, overlap=200):
-    """Suddivide il testo in chunk semanticamente coerenti usando RecursiveCharacterTextSplitter"""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=max_len,
-        chunk_overlap=overlap,
-        length_function=len,
-        separators=["\n\n", "\n", ". ", "? ", "! ", " "]
-    )
-    
-    chunks = text_splitter.split_text(text)
-    return chunks
+import re
+import logging
+from bisect import bisect_left
+from functools import lru_cache
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", ". ", "? ", "! ", " "]
+
+# all-MiniLM-L6-v2 tronca a 256 token, inclusi [CLS] e [SEP]
+DEFAULT_MAX_TOKENS = 254
+DEFAULT_OVERLAP_TOKENS = 40
+
+# Stima senza tokenizer: WordPiece spezza le parole italiane in pezzi di circa 4 caratteri
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name=None):
+    """Tokenizer del modello di embedding (libreria tokenizers, senza torch); None se non disponibile"""
+    name = model_name or os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    try:
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_pretrained(name if '/' in name else f"sentence-transformers/{name}")
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        return tokenizer
+    except Exception as e:
+        logger.warning("Tokenizer di %s non disponibile, conteggio token stimato: %s", name, e)
+        return None
+
+
+def token_starts(text, tokenizer=None):
+    """Offset di inizio di ogni token del testo (una sola tokenizzazione per testo)"""
+    if tokenizer is not None:
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        return np.fromiter((start for start, _ in offsets), dtype=np.int64, count=len(offsets))
+    return np.fromiter((m.start() for m in _APPROX_TOKEN.finditer(text)), dtype=np.int64)
+
+
+def _split_units(text, start, end, separators, max_size, size_of, hard_split):
+    """Divide [start, end) in unità di dimensione <= max_size provando i separatori in ordine"""
+    if size_of(start, end) <= max_size:
+        return [(start, end)]
+
+    for i, separator in enumerate(separators):
+        pos = text.find(separator, start, end) if separator else -1
+        if pos == -1:
+            continue
+
+        # Il separatore resta in coda al pezzo precedente (fine frase)
+        units = []
+        piece_start = start
+        while pos != -1:
+            piece_end = pos + len(separator)
+            units.extend(_split_units(text, piece_start, piece_end, separators[i + 1:], max_size, size_of, hard_split))
+            piece_start = piece_end
+            pos = text.find(separator, piece_end, end)
+        if piece_start < end:
+            units.extend(_split_units(text, piece_start, end, separators[i + 1:], max_size, size_of, hard_split))
+        return units
+
+    return hard_split(start, end, max_size)
+
+
+def _pack_units(text, units, max_size, overlap, size_of):
+    """Unisce unità consecutive in chunk <= max_size, ripetendo in testa le ultime unità fino a overlap"""
+    chunks = []
+    window = []
+    for unit in units:
+        if window and size_of(window[0][0], unit[1]) > max_size:
+            chunks.append((window[0][0], window[-1][1]))
+
+            # Overlap: unità finali del chunk appena chiuso che entrano anche nel successivo
+            keep = len(window)
+            while (keep > 0 and size_of(window[keep - 1][0], window[-1][1]) <= overlap
+                   and size_of(window[keep - 1][0], unit[1]) <= max_size):
+                keep -= 1
+            window = window[keep:]
+        window.append(unit)
+    if window:
+        chunks.append((window[0][0], window[-1][1]))
+
+    return [chunk for chunk in (text[start:end].strip() for start, end in chunks) if chunk]
+
+
+def split_text_in_chunks(text, max_len=1000, overlap=200, separators=None):
+    """Suddivide il testo in chunk di al più max_len caratteri rispettando paragrafi, frasi e parole"""
+    def size_of(start, end):
+        return end - start
+
+    def hard_split(start, end, max_size):
+        return [(pos, min(pos + max_size, end)) for pos in range(start, end, max_size)]
+
+    units = _split_units(text, 0, len(text), separators or DEFAULT_SEPARATORS, max_len, size_of, hard_split)
+    return _pack_units(text, units, max_len, overlap, size_of)
+
+
+def split_text_by_tokens(text, max_tokens=None, overlap_tokens=None, separators=None, tokenizer=None):
+    """
+    Suddivide il testo in chunk di al più max_tokens token del modello di embedding
+    (nessuna parte del chunk viene troncata in fase di embedding) rispettando frasi e parole
+    """
+    max_tokens = max_tokens or int(os.getenv('CHUNK_MAX_TOKENS', DEFAULT_MAX_TOKENS))
+    if overlap_tokens is None:
+        overlap_tokens = int(os.getenv('CHUNK_OVERLAP_TOKENS', DEFAULT_OVERLAP_TOKENS))
+    if tokenizer is None:
+        tokenizer = get_tokenizer()
+
+    # Lista Python: bisect su scalari è più veloce di np.searchsorted chiamato per ogni pezzo
+    starts = token_starts(text, tokenizer).tolist()
+
+    def size_of(start, end):
+        return bisect_left(starts, end) - bisect_left(starts, start)
+
+    def hard_split(start, end, max_size):
+        # Taglio sui confini di token (solo per sequenze senza spazi più lunghe di un chunk)
+        first, last = bisect_left(starts, start), bisect_left(starts, end)
+        cuts = [start] + starts[first + max_size:last:max_size] + [end]
+        return list(zip(cuts[:-1], cuts[1:]))
+
+    units = _split_units(text, 0, len(text), separators or DEFAULT_SEPARATORS, max_tokens, size_of, hard_split)
+    return _pack_units(text, units, max_tokens, overlap_tokens, size_of)
+
 
 def split_text_in_chunks_simple(text, max_len=1000):
-    """Versione semplificata di chunking per sistemi senza LangChain"""
+    """Versione semplificata di chunking a finestre fisse di caratteri"""
     chunks = []
     start = 0
     while start < len(text):
@@ -54,12 +176,7 @@ if __name__ == "__main__":
                     testo = f.read()
                 
                 if testo.strip():
-                    try:
-                        # Prova prima con RecursiveCharacterTextSplitter
-                        chunks = split_text_in_chunks(testo, max_len=1000, overlap=200)
-                    except ImportError:
-                        print("LangChain non disponibile, uso chunking semplice")
-                        chunks = split_text_in_chunks_simple(testo, max_len=1000)
+                    chunks = split_text_by_tokens(testo)
                     
                     tutti_i_chunks.extend(chunks)
                     file_processati += 1
@@ -0,0 +1,154 @@
+"""
+Budget di generazione (num_predict) per categoria di domanda
+La lunghezza delle risposte FAQ di riferimento indica quanto deve essere lunga una risposta
+della stessa categoria: una domanda su orari e contatti non ha bisogno dei 350 token
+concessi a una procedura in più passaggi. Il budget è il 90° percentile delle risposte FAQ
+della categoria, con un margine, limitato tra un minimo e il massimo precedente.
+Il CompletionDetector chiude invece la generazione quando la risposta è già completa.
+"""
+
+import os
+import re
+import sys
+import glob
+import logging
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+from intent_classifier import FAQ_TO_PROMPT_CATEGORY
+from prompt_templates import estimate_tokens
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from estrai_dataset_reale import FAQ_FILE_CATEGORIES, parse_faq_file
+
+logger = logging.getLogger(__name__)
+
+MAX_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "350"))
+MIN_NUM_PREDICT = int(os.getenv("OLLAMA_MIN_NUM_PREDICT", "160"))
+BUDGET_PERCENTILE = 90
+BUDGET_FACTOR = 1.5        # Le risposte generate sono più discorsive delle FAQ
+BUDGET_MARGIN_TOKENS = 40
+
+# Inizio di un paragrafo di commiato: dopo una riga vuota la risposta vera e propria è finita.
+# Solo formule di saluto: "contatta...", "per maggiori informazioni..." introducono spesso
+# proprio l'informazione richiesta (indirizzo, telefono, link) e non chiudono la generazione
+_CLOSING_PATTERN = re.compile(
+    r'(?<=\S)[ \t]*\n[ \t]*\n\s*(?:\*\*)?'
+    r'(?:spero |non esitare|se hai (?:bisogno|dubbi|ulteriori domande|altre domande)|in caso di dubbi)',
+    re.IGNORECASE
+)
+# Recapiti: un commiato che li contiene fa parte della risposta e non viene tagliato
+_CONTACT_PATTERN = re.compile(
+    r'[\w.+-]+@[\w-]+\.\w|https?://|www\.|\b[\w-]+\.(?:it|eu|com|org)\b|'
+    r'\+39|\b0\d{1,3}[ ./-]?\d{3}[ ./-]?\d{2,5}\b',
+    re.IGNORECASE
+)
+_SENTENCE_END_PATTERN = re.compile(r'[.!?]\s')
+_CLOSING_TAIL_CHARS = 200
+
+# Categorie in cui il paragrafo finale con i recapiti è la risposta stessa
+NO_EARLY_STOP_CATEGORIES = frozenset({'orari_contatti'})
+
+_budgets = None
+_budgets_lock = threading.Lock()
+
+
+def compute_budgets(faq_dir: str) -> Dict[str, int]:
+    """num_predict per categoria di prompt dalle lunghezze (in token stimati) delle risposte FAQ"""
+    lengths = {}
+    for path in sorted(glob.glob(os.path.join(faq_dir, "*.txt"))):
+        category = FAQ_TO_PROMPT_CATEGORY.get(FAQ_FILE_CATEGORIES.get(os.path.basename(path)))
+        if not category:
+            continue
+        for pair in parse_faq_file(path):
+            lengths.setdefault(category, []).append(estimate_tokens(pair['answer']))
+
+    budgets = {}
+    for category, values in lengths.items():
+        reference = float(np.percentile(values, BUDGET_PERCENTILE))
+        budget = int(reference * BUDGET_FACTOR) + BUDGET_MARGIN_TOKENS
+        budgets[category] = max(MIN_NUM_PREDICT, min(MAX_NUM_PREDICT, budget))
+    return budgets
+
+
+def get_budgets(faq_dir: str = None) -> Dict[str, int]:
+    """Budget per categoria, calcolati una volta per processo"""
+    global _budgets
+    with _budgets_lock:
+        if _budgets is None:
+            if faq_dir is None:
+                faq_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "FAQ")
+            try:
+                _budgets = compute_budgets(faq_dir)
+            except Exception as e:
+                logger.warning("Budget di generazione non calcolabili: %s", e)
+                _budgets = {}
+            logger.info("Budget num_predict per categoria: %s (default %d)", _budgets, MAX_NUM_PREDICT)
+        return _budgets
+
+
+def get_num_predict(category: str = None) -> int:
+    """num_predict per la categoria della domanda (massimo per 'generic' o categorie senza FAQ)"""
+    return get_budgets().get(category, MAX_NUM_PREDICT)
+
+
+class CompletionDetector:
+    """
+    Rileva sul flusso di token il punto in cui la risposta è completa: una riga vuota
+    (fine di un elenco o di un paragrafo) seguita da una formula di commiato.
+    Il taglio è confermato solo alla fine della frase di commiato, se non contiene recapiti
+    (email, telefono, link). feed() restituisce la posizione (in caratteri) in cui terminare il testo.
+    """
+
+    def __init__(self):
+        """Nessuno stato oltre alla coda del testo ricevuto"""
+        self._tail = ''
+        self._offset = 0    # Posizione di _tail nel testo complessivo
+        self._pending = None    # Inizio (in _tail) del commiato in attesa di conferma
+        self.cut_at = None
+
+    def feed(self, token: str) -> Optional[int]:
+        """Aggiunge un token; restituisce la posizione di taglio se il commiato è confermato"""
+        if self.cut_at is not None:
+            return self.cut_at
+
+        self._tail += token
+        if self._pending is None and '\n' in self._tail:
+            match = _CLOSING_PATTERN.search(self._tail)
+            if match:
+                self._pending = match.start()
+
+        if self._pending is not None:
+            closing = self._tail[self._pending:]
+            if _CONTACT_PATTERN.search(closing):
+                # Il commiato contiene recapiti: si prosegue senza riesaminarlo
+                self._offset += len(self._tail)
+                self._tail = ''
+                self._pending = None
+            elif _SENTENCE_END_PATTERN.search(closing):
+                self.cut_at = self._offset + self._pending
+                return self.cut_at
+            return None
+
+        if len(self._tail) > _CLOSING_TAIL_CHARS:
+            drop = len(self._tail) - _CLOSING_TAIL_CHARS
+            self._tail = self._tail[drop:]
+            self._offset += drop
+        return None
+
+
+if __name__ == "__main__":
+    for category, budget in sorted(get_budgets().items(), key=lambda item: item[1]):
+        print(f"{category:28s} num_predict={budget}")
+    print(f"{'generic':28s} num_predict={get_num_predict('generic')}")
+
+    answer = ("Per prenotarti a un esame:\n1. Accedi allo Sportello Internet\n2. Seleziona l'appello\n\n"
+              "Spero di esserti stato utile! Buono studio.")
+    detector = CompletionDetector()
+    for token in re.findall(r'\S+\s*', answer):
+        cut = detector.feed(token)
+        if cut is not None:
+            print(f"\nRisposta completa:\n{answer[:cut]}")
+            break
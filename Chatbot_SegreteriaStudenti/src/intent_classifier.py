@@ -0,0 +1,205 @@
+"""
+Classificatore di intento basato sugli embedding
+Ogni categoria del dataset FAQ (estrai_dataset_reale) ha un centroide: la media normalizzata
+degli embedding delle sue domande, calcolata una volta alla creazione del vectorstore.
+A runtime la domanda viene confrontata con i centroidi usando lo stesso embedding già
+calcolato per il retrieval (un prodotto matrice-vettore, nessuna chiamata al modello).
+Se la similarità è bassa o ambigua si usa il riconoscimento per parole chiave.
+"""
+
+import os
+import sys
+import glob
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from category_matcher import categorize
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from estrai_dataset_reale import FAQ_FILE_CATEGORIES, parse_faq_file
+
+logger = logging.getLogger(__name__)
+
+# Categoria del dataset FAQ -> categoria dei prompt (None: file troppo eterogeneo, escluso)
+FAQ_TO_PROMPT_CATEGORY = {
+    'iscrizioni': 'procedure_amministrative',
+    'tasse': 'tasse_pagamenti',
+    'esami_lezioni': 'iscrizioni_esami',
+    'laurea': 'procedure_amministrative',
+    'certificati': 'certificati_documenti',
+    'servizi_dsa': 'servizi_studenti',
+    'servizi_diritto_studio': 'servizi_studenti',
+    'servizi_orientamento': 'servizi_studenti',
+    'carriera': 'procedure_amministrative',
+    'tessera': 'servizi_studenti',
+    'tirocini': 'procedure_amministrative',
+    'corsi_singoli': 'procedure_amministrative',
+    'contatti': 'orari_contatti',
+    'varie': None,
+    'sito_web': None
+}
+
+CENTROIDS_FILE = "intent_centroids.npz"
+
+# Similarità coseno minima con il centroide migliore e distacco minimo dalla migliore
+# categoria di prompt diversa: sotto queste soglie decide il matcher per parole chiave
+MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", "0.35"))
+MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.02"))
+
+_classifier_cache = {}
+_classifier_lock = threading.Lock()
+
+
+def faq_file_category(filename: str) -> Optional[str]:
+    """Categoria di prompt di un file FAQ (None se il file non è categorizzato)"""
+    return FAQ_TO_PROMPT_CATEGORY.get(FAQ_FILE_CATEGORIES.get(os.path.basename(filename)))
+
+
+class IntentClassifier:
+    """Classificazione per centroide più vicino, con fallback sulle parole chiave"""
+
+    def __init__(self, faq_categories, centroids: np.ndarray, model_name: str = None):
+        """faq_categories: nome della categoria FAQ per ogni riga di centroids (normalizzati)"""
+        self.faq_categories = [str(c) for c in faq_categories]
+        self.prompt_categories = [FAQ_TO_PROMPT_CATEGORY[c] for c in self.faq_categories]
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.model_name = model_name
+
+    @classmethod
+    def from_faq(cls, embedder, faq_dir: str):
+        """Calcola i centroidi dalle domande FAQ categorizzate (un solo embedding batch)"""
+        questions, labels = [], []
+        for path in sorted(glob.glob(os.path.join(faq_dir, "*.txt"))):
+            if not faq_file_category(path):
+                continue
+            faq_category = FAQ_FILE_CATEGORIES[os.path.basename(path)]
+            for pair in parse_faq_file(path):
+                questions.append(pair['question'])
+                labels.append(faq_category)
+
+        if not questions:
+            raise ValueError(f"Nessuna domanda FAQ categorizzata in {faq_dir}")
+
+        embeddings = embedder.embed_documents_array(questions, normalize=True)
+        labels = np.array(labels)
+        faq_categories = sorted(set(labels))
+        centroids = np.stack([embeddings[labels == c].mean(axis=0) for c in faq_categories])
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+        return cls(faq_categories, centroids, getattr(embedder, 'model_name', None))
+
+    @classmethod
+    def load(cls, path: str):
+        """Carica i centroidi salvati con save()"""
+        with np.load(path) as data:
+            model_name = str(data['model_name']) if 'model_name' in data else None
+            return cls(data['faq_categories'], data['centroids'], model_name or None)
+
+    def save(self, path: str):
+        """Salva i centroidi accanto al vectorstore"""
+        np.savez(path, faq_categories=np.array(self.faq_categories), centroids=self.centroids,
+                 model_name=np.array(self.model_name or ''))
+
+    def predict(self, query_embedding: np.ndarray) -> Tuple[Optional[str], float, float]:
+        """
+        Categoria di prompt del centroide più vicino, similarità e distacco dalla migliore
+        categoria di prompt diversa; l'embedding della domanda deve essere normalizzato
+        """
+        if query_embedding is None or query_embedding.size != self.centroids.shape[1]:
+            return None, 0.0, 0.0
+
+        similarities = self.centroids @ query_embedding
+        best = int(np.argmax(similarities))
+        category = self.prompt_categories[best]
+        others = [s for s, c in zip(similarities, self.prompt_categories) if c != category]
+        margin = float(similarities[best] - max(others)) if others else float(similarities[best])
+        return category, float(similarities[best]), margin
+
+    def classify(self, query: str, query_embedding: np.ndarray = None) -> str:
+        """Categoria della domanda: centroide se affidabile, altrimenti parole chiave"""
+        category, similarity, margin = self.predict(query_embedding)
+        if category and similarity >= MIN_SIMILARITY and margin >= MIN_MARGIN:
+            return category
+        return categorize(query)
+
+    def classify_details(self, query: str, query_embedding: np.ndarray = None) -> Dict[str, object]:
+        """Come classify, con similarità, distacco e origine della decisione (diagnostica)"""
+        category, similarity, margin = self.predict(query_embedding)
+        confident = bool(category) and similarity >= MIN_SIMILARITY and margin >= MIN_MARGIN
+        return {
+            'category': category if confident else categorize(query),
+            'method': 'embedding' if confident else 'keywords',
+            'similarity': similarity,
+            'margin': margin
+        }
+
+
+def get_intent_classifier(embedder, persist_dir: str = "vectordb", faq_dir: str = None) -> IntentClassifier:
+    """
+    Classificatore condiviso per processo: centroidi letti da persist_dir se calcolati con lo
+    stesso modello di embedding, altrimenti ricalcolati dalle FAQ e salvati (best effort)
+    """
+    model_name = getattr(embedder, 'model_name', None)
+    key = (os.path.abspath(persist_dir), model_name)
+    with _classifier_lock:
+        if key in _classifier_cache:
+            return _classifier_cache[key]
+
+        path = os.path.join(persist_dir, CENTROIDS_FILE)
+        classifier = None
+        if os.path.exists(path):
+            try:
+                classifier = IntentClassifier.load(path)
+                if classifier.model_name != model_name:
+                    classifier = None
+            except Exception as e:
+                logger.warning("Centroidi di intento non leggibili (%s): %s", path, e)
+
+        if classifier is None:
+            if faq_dir is None:
+                faq_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "FAQ")
+            classifier = IntentClassifier.from_faq(embedder, faq_dir)
+            try:
+                os.makedirs(persist_dir, exist_ok=True)
+                classifier.save(path)
+            except OSError as e:
+                logger.warning("Impossibile salvare i centroidi di intento: %s", e)
+
+        _classifier_cache[key] = classifier
+        return classifier
+
+
+if __name__ == "__main__":
+    # Confronto leave-one-out tra centroidi e parole chiave sulle domande FAQ categorizzate
+    from local_embeddings import LocalEmbeddings
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    faq_dir = os.path.join(BASE_DIR, "../data/FAQ")
+
+    embedder = LocalEmbeddings()
+    questions, labels = [], []
+    for path in sorted(glob.glob(os.path.join(faq_dir, "*.txt"))):
+        faq_category = FAQ_FILE_CATEGORIES.get(os.path.basename(path))
+        if FAQ_TO_PROMPT_CATEGORY.get(faq_category):
+            for pair in parse_faq_file(path):
+                questions.append(pair['question'])
+                labels.append(faq_category)
+
+    embeddings = embedder.embed_documents_array(questions, normalize=True)
+    labels = np.array(labels)
+    correct = {'embedding': 0, 'keywords': 0}
+    for i, question in enumerate(questions):
+        mask = np.arange(len(questions)) != i
+        faq_categories = sorted(set(labels[mask]))
+        centroids = np.stack([embeddings[mask & (labels == c)].mean(axis=0) for c in faq_categories])
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+        classifier = IntentClassifier(faq_categories, centroids)
+        expected = FAQ_TO_PROMPT_CATEGORY[labels[i]]
+        correct['embedding'] += classifier.classify(question, embeddings[i]) == expected
+        correct['keywords'] += categorize(question) == expected
+
+    print(f"Domande FAQ: {len(questions)}")
+    print(f"Accuratezza centroidi (+ fallback): {correct['embedding'] / len(questions):.1%}")
+    print(f"Accuratezza parole chiave:          {correct['keywords'] / len(questions):.1%}")
@@ -1,98 +1,127 @@
 import re
-from typing import Dict, List
+from typing import Dict, NamedTuple
+
+# Scansione unica della risposta: le alternative sono provate in ordine a ogni posizione.
+# Link markdown e URL già presenti vengono lasciati intatti (e contati); email, telefoni
+# e www.unibg.it vengono formattati; le parole di contatto servono solo al rilevamento.
+_SCAN_PATTERN = re.compile(
+    r'(?P<markdown>\[[^\]\n]*\]\([^)\s]*\))'
+    r'|(?P<url>https?://[^\s<>\)\]]+|(?:mailto|tel):[^\s<>\)\]]+)'
+    r'|(?P<email>[a-zA-Z0-9._%+-]+@unibg\.it)'
+    r'|(?P<phone>\b0?35\s?205\s?26\d{2}\b)'
+    r'|(?P<site>www\.unibg\.it)'
+    r'|(?P<contact>(?i:email|telefono|contatt|segreteria)|@|035)'
+)
+
+# Indizi di contatti già presenti nella risposta (email, telefono, segreteria)
+_CONTACT_PATTERN = re.compile(r'email|telefono|contatt|segreteria|@|035', re.IGNORECASE)
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_CLOSED_PATTERN = re.compile(r'[)\n]')
+
+
+class EnhancementResult(NamedTuple):
+    """Risultato del post-processing: testo e conteggi raccolti nella stessa scansione"""
+    text: str
+    original_links: int
+    links: int
+    has_contacts: bool
+    footer_added: bool
+
 
 class LinkEnhancer:
     """Sistema per migliorare formattazione link e aggiungere contatti istituzionali"""
-    
+
     def __init__(self):
-        """Inizializza contatti istituzionali sicuri e pattern di formattazione"""
+        """Inizializza contatti istituzionali sicuri e footer per categoria"""
         # SOLO contatti generici sicuri
         self.safe_contacts = {
             'email_segreteria': 'segreteria.studenti@unibg.it',
             'telefono_generale': '0352052620',
             'sito_base': 'https://helpdesk.unibg.it'
         }
-        
-        # Pattern per migliorare formattazione (senza link esterni)
-        self.formatting_patterns = {
-            'email': r'([a-zA-Z0-9._%+-]+@unibg\.it)',
-            'telefono': r'(\b0?35\s?205\s?26\d{2}\b)',
-            'sito_web': r'(www\.unibg\.it)'
-        }
-    
+
+        # Footer e relativo numero di link calcolati una volta
+        self._footers = self._load_footers()
+        self._footer_links = {category: self.count_links(footer) for category, footer in self._footers.items()}
+
     def enhance_response(self, response: str, category: str = None) -> str:
         """Migliora formattazione della risposta senza aggiungere link non verificati"""
-        enhanced_response = response
-        
-        # Migliora formattazione contatti esistenti
-        enhanced_response = self._enhance_contact_formatting(enhanced_response)
-        
+        return self.process(response, category).text
+
+    def process(self, response: str, category: str = None) -> EnhancementResult:
+        """
+        Formatta contatti e link e aggiunge il footer se mancano contatti, in una sola scansione
+        Restituisce anche i link presenti prima e dopo (al posto di due chiamate a count_links)
+        """
+        text, original_links, added_links, has_contacts = self._scan(response)
+
         # Aggiungi sezione contatti solo se mancante
-        enhanced_response = self._add_contact_section_if_missing(enhanced_response, category)
-        
-        return enhanced_response
-    
-    def _enhance_contact_formatting(self, text: str) -> str:
-        """Formatta email, telefoni e siti web esistenti come link cliccabili"""
-        # Formatta email come link mailto
-        if 'mailto:' not in text:
-            text = re.sub(
-                self.formatting_patterns['email'], 
-                r'[\1](mailto:\1)', 
-                text
-            )
-        
-        # Formatta telefoni come link tel
-        def replace_phone(match):
-            phone_display = match.group(1)
-            phone_clean = re.sub(r'\s+', '', phone_display)
-            if not phone_clean.startswith('035'):
-                phone_clean = '035' + phone_clean.lstrip('0')
-            return f'[{phone_display}](tel:+39{phone_clean})'
-        
-        if 'tel:' not in text:
-            text = re.sub(
-                self.formatting_patterns['telefono'], 
-                replace_phone,
-                text
-            )
-        
-        # Formatta sito come link web
-        if '[www.unibg.it]' not in text and 'https://www.unibg.it' not in text:
-            text = re.sub(
-                r'(^|[^\[\(])(www\.unibg\.it)([^\]\)]*)', 
-                r'\1[\2](https://\2)', 
-                text
-            )
-        
-        return text
-    
-    def _add_contact_section_if_missing(self, text: str, category: str) -> str:
-        """Aggiunge footer con contatti solo se la risposta ne è completamente priva"""
-        # Controlla se ci sono già contatti nella risposta
-        has_contacts = any([
-            'email' in text.lower(),
-            'telefono' in text.lower(), 
-            'contatt' in text.lower(),
-            '@' in text,
-            '035' in text,
-            'segreteria' in text.lower()
-        ])
-        
-        # Se non ci sono contatti, aggiungi footer minimal
-        if not has_contacts and category:
-            footer = self._get_minimal_footer(category)
-            text += "\n\n" + footer
-        
-        return text
-    
-    def _get_minimal_footer(self, category: str) -> str:
-        """Genera footer con contatti istituzionali appropriati per la categoria"""
-        category_footers = {
+        footer_added = not has_contacts and bool(category)
+        if footer_added:
+            footer_category = category if category in self._footers else 'generic'
+            text += "\n\n" + self._footers[footer_category]
+            added_links += self._footer_links[footer_category]
+
+        return EnhancementResult(text, original_links, original_links + added_links, has_contacts, footer_added)
+
+    def _scan(self, text: str):
+        """
+        Scansione unica: restituisce testo formattato, link già presenti, link aggiunti
+        e presenza di contatti
+        """
+        parts = []
+        last = 0
+        links = 0
+        added = 0
+        has_contacts = False
+
+        for match in _SCAN_PATTERN.finditer(text):
+            kind = match.lastgroup
+            value = match.group()
+
+            if kind in ('markdown', 'url'):
+                links += 1
+                if not has_contacts and _CONTACT_PATTERN.search(value):
+                    has_contacts = True
+                continue
+            if kind == 'contact':
+                has_contacts = True
+                continue
+
+            if kind == 'email':
+                has_contacts = True
+                replacement = f'[{value}](mailto:{value})'
+            elif kind == 'phone':
+                has_contacts = True
+                replacement = f'[{value}](tel:+39{self._normalize_phone(value)})'
+            else:
+                replacement = f'[{value}](https://{value})'
+
+            parts.append(text[last:match.start()])
+            parts.append(replacement)
+            last = match.end()
+            added += 1
+
+        if not parts:
+            return text, links, added, has_contacts
+        parts.append(text[last:])
+        return ''.join(parts), links, added, has_contacts
+
+    @staticmethod
+    def _normalize_phone(phone_display: str) -> str:
+        """Numero senza spazi e con lo 0 del prefisso di Bergamo (035)"""
+        phone_clean = _WHITESPACE_PATTERN.sub('', phone_display)
+        if not phone_clean.startswith('0'):
+            phone_clean = '0' + phone_clean
+        return phone_clean
+
+    def _load_footers(self) -> Dict[str, str]:
+        """Footer con contatti istituzionali per categoria"""
+        return {
             'iscrizioni_esami': """Per supporto iscrizioni:
 - Segreteria: https://helpdesk.unibg.it
 - Telefono: +390352052620""",
-            
+
             'tasse_pagamenti': """Per informazioni su tasse:
 - Segreteria: https://helpdesk.unibg.it
 - Telefono: +390352052620""",
@@ -106,16 +135,11 @@ class LinkEnhancer:
 - Telefono: +390352052620
 - Sito: www.unibg.it"""
         }
-        
-        return category_footers.get(category, category_footers['generic'])
-    
+
     def count_links(self, text: str) -> int:
-        """Conta il numero totale di link presenti nel testo"""
-        markdown_links = len(re.findall(r'\[.*?\]\([^)]+\)', text))
-        http_pattern = r'https?://[^\s\)\]]+(?![^\[]*\])'
-        http_links = len(re.findall(http_pattern, text))
-        return markdown_links + http_links
-    
+        """Conta i link presenti nel testo (link markdown e URL, con la stessa scansione di process)"""
+        return self._scan(text)[1]
+
     def get_enhancement_stats(self, original: str, enhanced: str) -> dict:
         """Calcola statistiche sui miglioramenti applicati al testo"""
         return {
@@ -127,23 +151,89 @@ class LinkEnhancer:
         }
 
 
+class StreamingLinkFormatter:
+    """
+    Applica la formattazione di LinkEnhancer a un flusso di token man mano che arrivano
+    Trattiene solo la coda che potrebbe ancora diventare (o allungare) un link o un contatto;
+    il resto viene restituito subito già formattato. finish() aggiunge l'eventuale footer.
+    """
+
+    # Caratteri trattenuti: più lunghi di qualsiasi email, telefono o indirizzo da formattare
+    HOLDBACK = 80
+
+    def __init__(self, enhancer: LinkEnhancer = None, category: str = None):
+        """enhancer condiviso (o nuovo) e categoria della domanda per il footer"""
+        self.enhancer = enhancer or LinkEnhancer()
+        self.category = category
+        self.has_contacts = False
+        self.original_links = 0
+        self.added_links = 0
+        self._buffer = ''
+
+    def feed(self, token: str) -> str:
+        """Aggiunge un token e restituisce il testo formattato pronto da mostrare"""
+        self._buffer += token
+        safe = len(self._buffer) - self.HOLDBACK
+        if safe <= 0:
+            return ''
+
+        # Non tagliare dentro una corrispondenza che termina nella coda trattenuta
+        cut = safe
+        for match in _SCAN_PATTERN.finditer(self._buffer):
+            if match.end() > safe:
+                cut = min(cut, match.start())
+                break
+        # Un link markdown ancora aperto ("[testo](..." senza ")") va trattenuto per intero
+        open_bracket = self._buffer.rfind('[', 0, cut)
+        if open_bracket >= 0 and not _CLOSED_PATTERN.search(self._buffer, open_bracket):
+            cut = open_bracket
+        if cut <= 0:
+            return ''
+
+        ready, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self._format(ready)
+
+    def finish(self) -> str:
+        """Formatta la coda trattenuta e aggiunge il footer se la risposta non aveva contatti"""
+        text = self._format(self._buffer)
+        self._buffer = ''
+        if not self.has_contacts and self.category:
+            footer_category = self.category if self.category in self.enhancer._footers else 'generic'
+            text += "\n\n" + self.enhancer._footers[footer_category]
+            self.added_links += self.enhancer._footer_links[footer_category]
+        return text
+
+    def _format(self, text: str) -> str:
+        """Formatta un tratto di testo aggiornando i conteggi complessivi"""
+        formatted, links, added, has_contacts = self.enhancer._scan(text)
+        self.original_links += links
+        self.added_links += added
+        self.has_contacts = self.has_contacts or has_contacts
+        return formatted
+
+
 if __name__ == "__main__":
     # Test del sistema
     enhancer = LinkEnhancer()
-    
+
     test_cases = [
         "Contatta la segreteria al numero 035 205 2620",
         "Per informazioni scrivi a segreteria.studenti@unibg.it",
         "Visita il sito www.unibg.it per maggiori dettagli",
         "Per iscriverti agli esami segui la procedura online"
     ]
-    
+
     for i, test in enumerate(test_cases, 1):
         print(f"\nTEST {i}:")
         print(f"ORIGINALE: {test}")
-        
+
         enhanced = enhancer.enhance_response(test, 'iscrizioni_esami')
         print(f"MIGLIORATO: {enhanced}")
-        
+
         stats = enhancer.get_enhancement_stats(test, enhanced)
-        print(f"STATS: {stats}")
\ No newline at end of file
+        print(f"STATS: {stats}")
+
+        # Stesso risultato fornendo il testo un token alla volta
+        formatter = StreamingLinkFormatter(enhancer, 'iscrizioni_esami')
+        streamed = ''.join(formatter.feed(token) for token in re.findall(r'\S+\s*', test)) + formatter.finish()
+        print(f"STREAMING IDENTICO: {streamed == enhanced}")
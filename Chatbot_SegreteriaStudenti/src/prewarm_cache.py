@@ -0,0 +1,169 @@
+"""
+Preriscaldamento della cache delle risposte
+Dopo la ricostruzione dell'indice la cache è vuota (la versione dell'indice è cambiata):
+questo job genera in anticipo le risposte alle domande più probabili, così i primi studenti
+non pagano l'intera latenza del modello. Le domande vengono dalle FAQ e, se presente,
+da un log delle query reali (le più frequenti per prime); le domande quasi identiche sono
+rimosse confrontando gli embedding. Le risposte passano da ChatbotRAG.chat, quindi
+retrieval, prompt e chiave della cache sono esattamente quelli delle richieste reali.
+
+Esempi:
+    python src/prewarm_cache.py
+    python src/prewarm_cache.py --log logs/query_log.jsonl --workers 2 --limit 100
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BASE_DIR)
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "data"))
+
+# Similarità coseno oltre la quale due domande sono considerate la stessa domanda
+DEDUP_THRESHOLD = 0.92
+
+
+def load_faq_questions(faq_dir: str) -> List[str]:
+    """Domande di tutte le coppie Q&A delle FAQ"""
+    from estrai_dataset_reale import extract_all_faq_pairs
+
+    _, all_pairs = extract_all_faq_pairs(faq_dir)
+    return [pair['question'] for pair in all_pairs]
+
+
+def load_logged_queries(path: str) -> List[Tuple[str, int]]:
+    """
+    Query di un log con il numero di occorrenze, dalla più frequente
+    Accetta JSONL (campo "query", anche compresso .gz) o testo semplice, una domanda per riga
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    counts = Counter()
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    line = json.loads(line).get('query') or ''
+                except json.JSONDecodeError:
+                    continue
+            if line:
+                counts[line.strip()] += 1
+    return counts.most_common()
+
+
+def deduplicate(questions: List[str], embedder, threshold: float = DEDUP_THRESHOLD) -> List[str]:
+    """Mantiene l'ordine e scarta le domande troppo simili a una già selezionata"""
+    if not questions:
+        return []
+
+    embeddings = embedder.embed_documents_array(questions, normalize=True)
+    selected = []
+    for i, embedding in enumerate(embeddings):
+        if selected and float(np.max(embeddings[selected] @ embedding)) >= threshold:
+            continue
+        selected.append(i)
+    return [questions[i] for i in selected]
+
+
+def prewarm(chatbot, questions: List[str], workers: int = 1) -> dict:
+    """Genera le risposte tramite chatbot.chat con al massimo workers richieste in parallelo"""
+    stats = Counter()
+    start_time = time.time()
+
+    def answer(question):
+        result = chatbot.chat(question)
+        if result.get('cached'):
+            outcome = 'already_cached'
+        elif result.get('should_redirect'):
+            outcome = 'redirect'
+        else:
+            outcome = 'generated'
+        return outcome, result.get('timings', {}).get('total', 0.0)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(answer, q): q for q in questions}
+        for i, future in enumerate(as_completed(futures), 1):
+            question = futures[future]
+            try:
+                outcome, elapsed = future.result()
+            except Exception as e:
+                outcome, elapsed = 'error', 0.0
+                print(f"❌ {question[:60]}: {e}")
+            stats[outcome] += 1
+            print(f"[{i}/{len(questions)}] {outcome:15s} {elapsed:5.1f}s  {question[:60]}")
+
+    return {'questions': len(questions), 'elapsed': time.time() - start_time, **stats}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preriscalda la cache delle risposte con FAQ e query reali")
+    parser.add_argument('--faq-dir', default=os.path.join(PROJECT_ROOT, "data", "FAQ"))
+    parser.add_argument('--log', default=None, help="Log delle query (JSONL, .jsonl.gz o testo)")
+    parser.add_argument('--no-faq', action='store_true', help="Usa solo le query del log")
+    parser.add_argument('--threshold', type=float, default=DEDUP_THRESHOLD,
+                        help="Similarità oltre cui due domande sono duplicate")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('PREWARM_WORKERS', '1')),
+                        help="Richieste concorrenti verso Ollama (non oltre OLLAMA_NUM_PARALLEL)")
+    parser.add_argument('--limit', type=int, default=None, help="Numero massimo di domande")
+    parser.add_argument('--dry-run', action='store_true', help="Mostra le domande senza generare")
+    args = parser.parse_args()
+
+    from log_config import setup_logging
+    setup_logging()
+
+    # Query reali prima (dalle più frequenti), poi le FAQ
+    questions = []
+    if args.log:
+        if os.path.exists(args.log):
+            logged = load_logged_queries(args.log)
+            questions += [query for query, _ in logged]
+            print(f"📜 Query dal log: {len(logged)} distinte")
+        else:
+            print(f"⚠️ Log delle query non trovato: {args.log}")
+    if not args.no_faq:
+        faq_questions = load_faq_questions(args.faq_dir)
+        questions += faq_questions
+
+    if not questions:
+        print("Nessuna domanda da preriscaldare")
+        sys.exit(0)
+
+    # Le domande di preriscaldamento non sono traffico reale: niente log delle query
+    os.environ.setdefault('QUERY_LOG', '0')
+    from main import ChatbotRAG
+
+    chatbot = ChatbotRAG(background=False)
+    if chatbot.answer_cache is None:
+        print("❌ Cache delle risposte non disponibile (ANSWER_CACHE=0?)")
+        sys.exit(1)
+
+    unique = deduplicate(questions, chatbot.embedder, args.threshold)
+    if args.limit:
+        unique = unique[:args.limit]
+    print(f"\n🔎 Domande: {len(questions)} → {len(unique)} dopo la deduplicazione semantica")
+
+    if args.dry_run:
+        for question in unique:
+            print(f"  - {question}")
+        sys.exit(0)
+
+    print(f"🔥 Preriscaldamento con {args.workers} richieste concorrenti...\n")
+    report = prewarm(chatbot, unique, max(1, args.workers))
+
+    print(f"\n✅ Completato in {report['elapsed']:.0f}s: {report.get('generated', 0)} generate, "
+          f"{report.get('already_cached', 0)} già in cache, {report.get('redirect', 0)} redirect, "
+          f"{report.get('error', 0)} errori")
+    stats = chatbot.answer_cache.stats()
+    print(f"💾 Cache: {stats['entries']} voci ({stats['path']})")
@@ -1,10 +1,61 @@
 """
 Sistema di template prompts ottimizzati per migliorare qualità risposte
+I template sono compilati una volta in parti statiche (prefisso, parte centrale, suffisso)
+con il numero di token già stimato: costruire un prompt è una concatenazione e il
+prefisso di istruzioni resta identico tra le richieste della stessa categoria, così
+Ollama può riusare la cache del prompt già valutato.
 """
 
-from typing import Dict, List
+from typing import Dict, List, NamedTuple
+import hashlib
+import json
 import re
 
+from category_matcher import CATEGORY_PATTERNS, PRIORITY_KEYWORDS, QUESTION_MATCHER, PRIORITY_MATCHER
+
+# Caratteri medi per token del tokenizer di Mistral su testo italiano (stima prudente)
+CHARS_PER_TOKEN = 3.5
+# Token lasciati liberi oltre alla stima (errori di stima, token speciali)
+BUDGET_MARGIN_TOKENS = 48
+# Limite del contesto in caratteri quando non è noto il budget del modello
+DEFAULT_CONTEXT_CHARS = 4000
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima il numero di token di un testo per il modello generativo"""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+class CompiledTemplate(NamedTuple):
+    """Template diviso in parti statiche attorno a {context} e {question}"""
+    category: str
+    prefix: str
+    middle: str
+    suffix: str
+    prefix_tokens: int
+    static_tokens: int
+
+    def render(self, context: str, question: str) -> str:
+        """Prompt finale: sola concatenazione, nessun parsing del template"""
+        return self.prefix + context + self.middle + question + self.suffix
+
+
+def compile_template(category: str, template: str) -> CompiledTemplate:
+    """Divide un template con {context} seguito da {question} e ne misura le parti statiche"""
+    prefix, rest = template.split('{context}')
+    middle, suffix = rest.split('{question}')
+    # Stesso risultato di str.format: le graffe raddoppiate diventano singole
+    prefix, middle, suffix = (part.replace('{{', '{').replace('}}', '}') for part in (prefix, middle, suffix))
+    return CompiledTemplate(
+        category=category,
+        prefix=prefix,
+        middle=middle,
+        suffix=suffix,
+        prefix_tokens=estimate_tokens(prefix),
+        static_tokens=estimate_tokens(prefix + middle + suffix)
+    )
+
+
 class PromptOptimizer:
     """Sistema di ottimizzazione prompts per diverse categorie di domande universitarie"""
     
@@ -12,57 +63,51 @@ class PromptOptimizer:
         """Inizializza templates e pattern per il riconoscimento delle categorie"""
         self.templates = self._load_templates()
         self.question_patterns = self._load_patterns()
+        self.compiled = {category: compile_template(category, template)
+                         for category, template in self.templates.items()}
+        # Versione dei template: cambia se cambia il testo di un qualsiasi template
+        self.version = hashlib.sha1(
+            json.dumps(self.templates, sort_keys=True).encode('utf-8')
+        ).hexdigest()[:12]
     
-    def optimize_prompt(self, question: str, context: str) -> str:
-        """Genera prompt ottimizzato basandosi sul tipo di domanda e contesto"""
-        
-        # Identifica categoria domanda
-        category = self._categorize_question(question)
+    def get_template(self, question: str, category: str = None) -> CompiledTemplate:
+        """Template compilato per la categoria indicata o riconosciuta dalla domanda"""
+        if category not in self.compiled:
+            category = self._categorize_question(question)
+        return self.compiled.get(category, self.compiled['generic'])
+    
+    def context_budget(self, template: CompiledTemplate, question: str, num_ctx: int, num_predict: int) -> int:
+        """Token disponibili per il contesto: finestra del modello meno risposta, parti statiche e domanda"""
+        return max(0, num_ctx - num_predict - template.static_tokens - estimate_tokens(question)
+                   - BUDGET_MARGIN_TOKENS)
+    
+    def optimize_prompt(self, question: str, context: str, category: str = None,
+                        max_context_tokens: int = None) -> str:
+        """
+        Genera prompt ottimizzato basandosi sul tipo di domanda e contesto
+        category: categoria già nota (es. dal classificatore di intento), altrimenti parole chiave
+        max_context_tokens: budget del contesto (vedi context_budget); None = limite in caratteri
+        """
         
-        # Seleziona template appropriato
-        template = self.templates.get(category, self.templates['generic'])
+        # Identifica categoria domanda e seleziona template compilato
+        template = self.get_template(question, category)
         
         # Applica ottimizzazioni specifiche
-        optimized_context = self._optimize_context(context, category)
+        max_chars = int(max_context_tokens * CHARS_PER_TOKEN) if max_context_tokens is not None \
+            else DEFAULT_CONTEXT_CHARS
+        optimized_context = self._optimize_context(context, template.category, max_chars)
         
-        return template.format(
-            context=optimized_context,
-            question=question
-        )
+        return template.render(optimized_context, question)
     
     def _categorize_question(self, question: str) -> str:
         """Analizza la domanda e la classifica nella categoria più appropriata"""
         
-        question_lower = question.lower()
-        
-        for category, patterns in self.question_patterns.items():
-            if any(pattern in question_lower for pattern in patterns):
-                return category
-        
-        return 'generic'
+        # Una sola passata del matcher precompilato: vince la categoria con peso maggiore
+        return QUESTION_MATCHER.best(question)
     
     def _load_patterns(self) -> Dict[str, List[str]]:
         """Definisce i pattern testuali per il riconoscimento automatico delle categorie"""
-        return {
-            'iscrizioni_esami': [
-                'iscriver', 'esam', 'prenotare', 'prenotazione', 'sessione'
-            ],
-            'tasse_pagamenti': [
-                'tasse', 'pagare', 'pagamento', 'retta', 'bollettino', 'importo'
-            ],
-            'certificati_documenti': [
-                'certificat', 'document', 'attestat', 'dichiarazione', 'autocertificazione'
-            ],
-            'orari_contatti': [
-                'orari', 'orario', 'contatt', 'telefono', 'email', 'dove', 'quando'
-            ],
-            'procedure_amministrative': [
-                'procedura', 'come fare', 'iter', 'pratica', 'domanda', 'richiesta'
-            ],
-            'servizi_studenti': [
-                'servizi', 'agevolazioni', 'borse', 'alloggi', 'mensa', 'trasporti'
-            ]
-        }
+        return {category: list(patterns) for category, patterns in CATEGORY_PATTERNS.items()}
     
     def _load_templates(self) -> Dict[str, str]:
         """Carica i template di prompt specializzati per ogni categoria di domande"""
@@ -227,46 +272,70 @@ DOMANDA STUDENTE: {question}
 RISPOSTA PROFESSIONALE:"""
         }
     
-    def _optimize_context(self, context: str, category: str) -> str:
-        """Ottimizza il contesto in base alla categoria per migliorare rilevanza"""
+    def _optimize_context(self, context: str, category: str, max_chars: int = DEFAULT_CONTEXT_CHARS) -> str:
+        """Ottimizza il contesto in base alla categoria per rispettare il budget e migliorare rilevanza"""
         
-        if len(context) > 4000:  # Aumentato limite per più dettagli
+        if len(context) > max_chars:
             # Prioritizza informazioni rilevanti per la categoria
-            priority_keywords = self._get_priority_keywords(category)
+            if category not in PRIORITY_KEYWORDS:
+                category = 'generic'
             
-            # Split in paragrafi e scoring
+            # Split in paragrafi e scoring (una passata del matcher per paragrafo)
             paragraphs = context.split('\n\n')
             scored_paragraphs = []
             
             for para in paragraphs:
-                score = sum(1 for keyword in priority_keywords if keyword in para.lower())
+                score = PRIORITY_MATCHER.score(para, category)
                 scored_paragraphs.append((score, para))
             
-            # Ordina per rilevanza e prendi i migliori
+            # Ordina per rilevanza e prendi i migliori finché c'è spazio nel budget
             scored_paragraphs.sort(key=lambda x: x[0], reverse=True)
-            selected = scored_paragraphs[:8]  # Aumentato numero paragrafi
+            selected = []
+            used = 0
+            for _, para in scored_paragraphs:
+                remaining = max_chars - used
+                if remaining <= 0:
+                    break
+                if len(para) > remaining:
+                    if selected:
+                        continue
+                    para = para[:remaining]  # Nemmeno il paragrafo migliore entra: troncato
+                selected.append(para)
+                used += len(para) + 2
             
-            return '\n\n'.join([para for _, para in selected])
+            return '\n\n'.join(selected)
         
         return context
     
     def _get_priority_keywords(self, category: str) -> List[str]:
         """Restituisce le parole chiave prioritarie per una specifica categoria"""
-        priority_map = {
-            'iscrizioni_esami': ['iscrizione', 'esame', 'prenotazione', 'sessione', 'scadenza'],
-            'tasse_pagamenti': ['tassa', 'pagamento', 'importo', 'scadenza', 'bollettino'],
-            'certificati_documenti': ['certificato', 'documento', 'richiesta', 'rilascio', 'tempo'],
-            'orari_contatti': ['orario', 'contatto', 'telefono', 'email', 'sportello'],
-            'procedure_amministrative': ['procedura', 'iter', 'passo', 'documento', 'pratica'],
-            'servizi_studenti': ['servizio', 'agevolazione', 'borsa', 'alloggio', 'requisito']
-        }
-        return priority_map.get(category, ['università', 'studente', 'segreteria'])
+        return list(PRIORITY_KEYWORDS.get(category, PRIORITY_KEYWORDS['generic']))
+
+# Istanza condivisa: template, pattern e compilazione costruiti una sola volta per processo
+_optimizer = PromptOptimizer()
+TEMPLATE_VERSION = _optimizer.version
+
+def get_prompt_optimizer() -> PromptOptimizer:
+    """Restituisce l'ottimizzatore di prompt condiviso"""
+    return _optimizer
 
 # Funzione helper per integrare facilmente
-def get_optimized_prompt(question: str, context: str) -> str:
-    """Funzione helper per ottenere prompt ottimizzato per qualsiasi domanda"""
-    optimizer = PromptOptimizer()
-    return optimizer.optimize_prompt(question, context)
+def get_optimized_prompt(question: str, context: str, category: str = None,
+                         num_ctx: int = None, num_predict: int = None) -> str:
+    """
+    Funzione helper per ottenere prompt ottimizzato per qualsiasi domanda
+    Con num_ctx e num_predict il contesto viene ridotto al budget di token del modello
+    """
+    max_context_tokens = None
+    if num_ctx and num_predict is not None:
+        template = _optimizer.get_template(question, category)
+        max_context_tokens = _optimizer.context_budget(template, question, num_ctx, num_predict)
+        category = template.category
+    return _optimizer.optimize_prompt(question, context, category, max_context_tokens)
+
+def categorize_question(question: str) -> str:
+    """Funzione helper per ottenere la categoria di una domanda (usata anche per i metadati dei chunk)"""
+    return QUESTION_MATCHER.best(question)
 
 if __name__ == "__main__":
     # Test sistema di ottimizzazione
@@ -275,4 +344,8 @@ if __name__ == "__main__":
     
     optimized = get_optimized_prompt(question, context)
     print("PROMPT OTTIMIZZATO:")
-    print(optimized)
\ No newline at end of file
+    print(optimized)
+    
+    print(f"\nVersione template: {TEMPLATE_VERSION}")
+    for category, template in _optimizer.compiled.items():
+        print(f"  {category:25s} prefisso {template.prefix_tokens:4d} token, parti statiche {template.static_tokens:4d} token")
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Log strutturato delle query (JSONL)
+Una riga JSON per richiesta: domanda, categoria, chunk recuperati con distanza, esito della
+cache, tempi per fase ed esito. Il file è solo in append, ruota oltre una dimensione massima
+(i file ruotati possono essere compressi in gzip) e le richieste possono essere campionate.
+Il log alimenta il preriscaldamento della cache (prewarm_cache.py) e il replay del traffico
+reale nei test di carico (test/test_replay.py).
+"""
+
+import os
+import gzip
+import json
+import time
+import random
+import shutil
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_PATH = os.path.join("logs", "query_log.jsonl")
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def _gzip_rotator(source: str, dest: str):
+    """Comprime il file ruotato invece di rinominarlo"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class QueryLog:
+    """Log delle query con rotazione, compressione e campionamento (thread-safe)"""
+
+    def __init__(self, path: str = DEFAULT_PATH, sample_rate: float = 1.0, max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 10, compress: bool = True):
+        """sample_rate: frazione di richieste registrate (0-1); max_bytes: dimensione prima della rotazione"""
+        self.path = path
+        self.sample_rate = sample_rate
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                            encoding='utf-8', delay=True)
+        self._handler.setFormatter(logging.Formatter('%(message)s'))
+        if compress:
+            self._handler.namer = lambda name: name + '.gz'
+            self._handler.rotator = _gzip_rotator
+
+        # Logger dedicato: non propaga al root, le righe vanno solo nel file JSONL
+        self._logger = logging.getLogger(f"query_log.{os.path.abspath(path)}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(self._handler)
+
+    def sampled(self) -> bool:
+        """Decide se registrare la richiesta corrente"""
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record(self, entry: Dict[str, Any]):
+        """Aggiunge una riga al log (campo ts aggiunto se assente)"""
+        entry.setdefault('ts', time.time())
+        self._logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def close(self):
+        """Chiude il file del log"""
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+
+def build_entry(query: str, docs: List[Dict[str, Any]], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Riga del log da documenti recuperati e risultato di ChatbotRAG.chat"""
+    if not docs:
+        outcome = 'no_docs'
+    elif result.get('should_redirect'):
+        outcome = 'redirect'
+    else:
+        outcome = 'answered'
+
+    return {
+        'ts': time.time(),
+        'query': query,
+        'category': docs[0].get('intent') if docs else None,
+        'route': docs[0].get('route') if docs else None,
+        'chunks': [{'id': doc.get('id'), 'score': doc.get('score')} for doc in docs],
+        'cache': ('hit' if result.get('cached') else 'miss') if 'cached' in result else None,
+        'timings': result.get('timings'),
+        'generation': result.get('generation'),
+        'outcome': outcome,
+        'response_chars': len(result.get('response', ''))
+    }
+
+
+def get_query_log(path: str = None) -> Optional[QueryLog]:
+    """
+    Log condiviso per processo configurato da variabili d'ambiente (None se QUERY_LOG=0):
+    QUERY_LOG_PATH, QUERY_LOG_SAMPLE_RATE, QUERY_LOG_MAX_BYTES, QUERY_LOG_BACKUPS, QUERY_LOG_COMPRESS
+    """
+    if os.getenv('QUERY_LOG', '1') != '1':
+        return None
+
+    path = os.path.abspath(path or os.getenv('QUERY_LOG_PATH', DEFAULT_PATH))
+    with _instances_lock:
+        if path not in _instances:
+            _instances[path] = QueryLog(
+                path,
+                sample_rate=float(os.getenv('QUERY_LOG_SAMPLE_RATE', '1.0')),
+                max_bytes=int(os.getenv('QUERY_LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+                backup_count=int(os.getenv('QUERY_LOG_BACKUPS', '10')),
+                compress=os.getenv('QUERY_LOG_COMPRESS', '1') == '1'
+            )
+        return _instances[path]
+
+
+def read_entries(path: str) -> Iterator[Dict[str, Any]]:
+    """Righe di un log (anche .gz) e dei suoi file ruotati, dal più vecchio"""
+    directory = os.path.dirname(os.path.abspath(path))
+    base = os.path.basename(path)
+    rotated = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            suffix = name[len(base) + 1:].split('.')[0] if name.startswith(base + '.') else ''
+            if suffix.isdigit():
+                rotated.append((int(suffix), os.path.join(directory, name)))
+    # I file ruotati con indice più alto sono i più vecchi
+    files = [p for _, p in sorted(rotated, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+
+    for file_path in files:
+        opener = gzip.open if file_path.endswith('.gz') else open
+        with opener(file_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    parser = argparse.ArgumentParser(description="Riepilogo del log delle query")
+    parser.add_argument('--path', default=os.getenv('QUERY_LOG_PATH', DEFAULT_PATH))
+    args = parser.parse_args()
+
+    entries = list(read_entries(args.path))
+    print(f"📜 {len(entries)} richieste registrate in {args.path} (inclusi i file ruotati)")
+    if entries:
+        outcomes = Counter(e.get('outcome') for e in entries)
+        cache = Counter(e.get('cache') for e in entries if e.get('cache'))
+        categories = Counter(e.get('category') or 'generic' for e in entries)
+        print(f"   Esiti: {dict(outcomes)}")
+        print(f"   Cache: {dict(cache)}")
+        print("   Domande più frequenti:")
+        for query, count in Counter(e['query'] for e in entries).most_common(10):
+            print(f"   {count:4d}  {query[:70]}")
+        print("   Categorie:")
+        for category, count in categories.most_common():
+            print(f"   {count:4d}  {category}")
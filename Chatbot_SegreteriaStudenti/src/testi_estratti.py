@@ -65,6 +65,8 @@ def pdf_to_txt_with_inline_links(pdf_path, txt_path):
         flush_buffer()
         if line_text:
             output_lines.append(" ".join(line_text))
+        # Separatore di pagina: permette di associare a ogni chunk il numero di pagina
+        output_lines.append("\f")
 
     with open(txt_path, "w", encoding="utf-8") as f:
         f.write("\n".join(output_lines))
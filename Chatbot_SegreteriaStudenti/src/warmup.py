@@ -0,0 +1,82 @@
+"""
+Fase di warm-up dei componenti del chatbot (modello Ollama, embedder, indice vettoriale)
+Ogni componente viene preparato in un thread dedicato, così il primo studente
+ottiene già la latenza a regime
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """Esegue in parallelo i task di warm-up e tiene traccia dello stato di prontezza"""
+
+    def __init__(self, tasks: Dict[str, Callable[[], Any]]):
+        """Registra i task di warm-up (nome componente -> funzione senza argomenti)"""
+        self.tasks = tasks
+        self.status = {name: {"state": "in attesa"} for name in tasks}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self, background: bool = True) -> "WarmUp":
+        """Avvia il warm-up; con background=False attende il completamento di tutti i task"""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+
+        threads = [
+            threading.Thread(target=self._run_task, args=(name, task), name=f"warmup-{name}", daemon=True)
+            for name, task in self.tasks.items()
+        ]
+        for thread in threads:
+            thread.start()
+
+        if background:
+            threading.Thread(target=self._wait_all, args=(threads,), name="warmup", daemon=True).start()
+        else:
+            self._wait_all(threads)
+        return self
+
+    def _run_task(self, name: str, task: Callable[[], Any]):
+        """Esegue un singolo task registrando durata ed eventuale errore"""
+        with self._lock:
+            self.status[name] = {"state": "in corso"}
+        start_time = time.time()
+        try:
+            result = task()
+            outcome = {"state": "pronto" if result is not False else "fallito"}
+        except Exception as e:
+            outcome = {"state": "fallito", "error": str(e)[:200]}
+        outcome["seconds"] = round(time.time() - start_time, 2)
+        with self._lock:
+            self.status[name] = outcome
+
+    def _wait_all(self, threads):
+        """Attende la fine di tutti i task e segnala la prontezza"""
+        for thread in threads:
+            thread.join()
+        self._ready.set()
+        logger.info("Warm-up completato: %s", self.summary())
+
+    def is_ready(self) -> bool:
+        """True quando tutti i task di warm-up sono terminati (con successo o meno)"""
+        return self._ready.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Attende la fine del warm-up; restituisce False se scade il timeout"""
+        return self._ready.wait(timeout)
+
+    def summary(self) -> str:
+        """Descrizione compatta dello stato dei componenti"""
+        with self._lock:
+            parts = []
+            for name, info in self.status.items():
+                seconds = f" {info['seconds']:.1f}s" if "seconds" in info else ""
+                parts.append(f"{name} {info['state']}{seconds}")
+        return ", ".join(parts)
@@ -0,0 +1,387 @@
+"""
+Server Ollama simulato per benchmark riproducibili senza modello
+Implementa /api/tags, /api/generate (streaming e non), /api/show e /api/pull
+con velocità di generazione, ritardo del primo token, errori iniettati e
+risposte predefinite configurabili. Le risposte sono deterministiche:
+stessa domanda e stesso seed producono sempre lo stesso output.
+
+Esempi:
+    python fake_ollama.py --port 11434 --tokens-per-second 15 --first-token-delay 0.8
+    python fake_ollama.py --error-rate 0.1 --stall-rate 0.05 --parallel 1
+    python test_performance.py --fake-ollama
+"""
+import os
+import sys
+import json
+import time
+import random
+import select
+import socket
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Risposte predefinite: parola chiave nel prompt -> risposta
+DEFAULT_RESPONSES = {
+    "esam": "Per iscriverti a un appello d'esame accedi allo Sportello Internet con le tue credenziali, "
+            "seleziona la voce Appelli e scegli l'appello di interesse entro la data di chiusura delle iscrizioni.",
+    "tass": "Le tasse universitarie si pagano in tre rate tramite PagoPA dallo Sportello Internet. "
+            "L'importo della seconda e terza rata dipende dall'ISEE presentato entro la scadenza.",
+    "iscri": "Per immatricolarti compila la domanda online sullo Sportello Internet, carica i documenti richiesti "
+             "e paga la prima rata: l'iscrizione è perfezionata dopo la verifica della segreteria.",
+    "laure": "Per laurearti presenta la domanda di conseguimento titolo online entro le scadenze della sessione, "
+             "dopo aver sostenuto tutti gli esami e caricato la tesi approvata dal relatore.",
+    "piano": "Il piano di studi si compila online nei periodi indicati dal calendario accademico; "
+             "le modifiche successive vanno richieste alla segreteria del tuo corso.",
+    "certificat": "I certificati si scaricano in autocertificazione dallo Sportello Internet nella sezione "
+                  "Certificati; per usi esteri è possibile richiedere il certificato in bollo.",
+    "borsa": "Le borse di studio sono gestite dal servizio Diritto allo Studio: la domanda si presenta online "
+             "entro il bando annuale allegando l'ISEE per le prestazioni universitarie.",
+}
+GENERIC_RESPONSE = ("Per questa richiesta consulta la pagina della segreteria studenti sul portale di Ateneo "
+                    "oppure apri un ticket dal servizio di assistenza online indicando il tuo numero di matricola.")
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """HTTP server con configurazione, stato dei modelli e statistiche condivise tra i thread"""
+
+    daemon_threads = True
+
+    def __init__(self, address, model='mistral:7b', tokens_per_second=20.0, first_token_delay=0.5,
+                 load_delay=0.0, error_rate=0.0, error_status=500, stall_rate=0.0, parallel=4,
+                 responses=None, seed=42):
+        super().__init__(address, FakeOllamaHandler)
+        self.models = {model}
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+        self.load_delay = load_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.responses = responses if responses is not None else DEFAULT_RESPONSES
+        self.seed = seed
+
+        # Come OLLAMA_NUM_PARALLEL: oltre questo numero le generazioni restano in coda
+        self.slots = threading.Semaphore(parallel)
+        self.loaded = False
+        self.stats = {'requests': 0, 'generated': 0, 'errors': 0, 'stalled': 0, 'cancelled': 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw(self):
+        """Estrae un numero casuale dal generatore con seed (riproducibile a parità di ordine)"""
+        with self._lock:
+            return self._rng.random()
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def pick_response(self, prompt):
+        """Sceglie la risposta predefinita: prima parola chiave presente nella domanda, altrimenti generica"""
+        # Nei prompt RAG la domanda è alla fine, dopo il contesto
+        question = prompt.lower()[-300:]
+        for keyword, answer in self.responses.items():
+            if keyword.lower() in question:
+                return answer
+        return GENERIC_RESPONSE
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Gestore delle API Ollama usate dal chatbot"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- Utility di risposta ---
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _send_chunk(self, payload):
+        line = json.dumps(payload).encode('utf-8') + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _model_not_found(self, name):
+        self._send_json({"error": f"model '{name}' not found, try pulling it first"}, status=404)
+
+    # --- Routing ---
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.count('requests')
+        if self.path == '/':
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/api/tags':
+            self._send_json({"models": [_model_entry(name) for name in sorted(self.server.models)]})
+        elif self.path == '/fake/stats':
+            self._send_json(self.server.stats)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        self.server.count('requests')
+        payload = self._read_json()
+        routes = {'/api/generate': self._generate, '/api/show': self._show, '/api/pull': self._pull}
+        handler = routes.get(self.path)
+        if handler is None:
+            self._send_json({"error": "not found"}, status=404)
+            return
+        try:
+            handler(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # Il client ha chiuso lo stream (deadline scaduta): generazione annullata
+            self.server.count('cancelled')
+
+    # --- Endpoint ---
+
+    def _generate(self, payload):
+        server = self.server
+        model = payload.get('model', '')
+        if model not in server.models:
+            self._model_not_found(model)
+            return
+
+        prompt = payload.get('prompt', '')
+        stream = payload.get('stream', True)
+        created_at = _now()
+
+        # Prompt vuoto: solo caricamento del modello (warm-up)
+        if not prompt:
+            self._load_model()
+            self._send_json({"model": model, "created_at": created_at, "response": "",
+                             "done": True, "done_reason": "load"})
+            return
+
+        if server.error_rate and server.draw() < server.error_rate:
+            server.count('errors')
+            self._send_json({"error": "llama runner process has terminated"}, status=server.error_status)
+            return
+
+        with server.slots:
+            started = time.time()
+            load_duration = self._load_model()
+
+            options = payload.get('options') or {}
+            answer = server.pick_response(prompt)
+            tokens = [word + " " for word in answer.split()]
+            num_predict = options.get('num_predict', -1)
+            done_reason = 'stop'
+            if 0 < num_predict < len(tokens):
+                tokens, done_reason = tokens[:num_predict], 'length'
+
+            # Stallo: il server smette di rispondere a metà generazione (per testare le deadline)
+            stall_at = None
+            if server.stall_rate and server.draw() < server.stall_rate:
+                server.count('stalled')
+                stall_at = len(tokens) // 2
+
+            interval = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+            prompt_eval_count = max(1, len(prompt) // 4)
+
+            if stream:
+                self._start_stream()
+            time.sleep(server.first_token_delay)
+            eval_start = time.time()
+            for i, token in enumerate(tokens):
+                if i == stall_at:
+                    self._stall()
+                    return
+                if i and interval:
+                    time.sleep(interval)
+                if stream:
+                    self._send_chunk({"model": model, "created_at": _now(), "response": token, "done": False})
+            eval_duration = time.time() - eval_start
+
+            final = {
+                "model": model,
+                "created_at": _now() if stream else created_at,
+                "response": "" if stream else "".join(tokens),
+                "done": True,
+                "done_reason": done_reason,
+                "total_duration": _ns(time.time() - started),
+                "load_duration": _ns(load_duration),
+                "prompt_eval_count": prompt_eval_count,
+                "prompt_eval_duration": _ns(server.first_token_delay),
+                "eval_count": len(tokens),
+                "eval_duration": _ns(eval_duration)
+            }
+            if stream:
+                self._send_chunk(final)
+                self._end_stream()
+            else:
+                self._send_json(final)
+            server.count('generated')
+
+    def _show(self, payload):
+        name = payload.get('name') or payload.get('model', '')
+        if name not in self.server.models:
+            self._send_json({"error": f"model '{name}' not found"}, status=404)
+            return
+        self._send_json({
+            "modelfile": f"FROM {name}",
+            "parameters": "stop \"[INST]\"\nstop \"[/INST]\"",
+            "template": "[INST] {{ .Prompt }} [/INST]",
+            "details": _model_details(),
+            "model_info": {"general.architecture": "llama", "llama.context_length": 32768}
+        })
+
+    def _pull(self, payload):
+        name = payload.get('name') or payload.get('model', '')
+        steps = [{"status": "pulling manifest"},
+                 {"status": f"pulling {_digest(name)[:12]}", "digest": f"sha256:{_digest(name)}",
+                  "total": 4109865159, "completed": 4109865159},
+                 {"status": "verifying sha256 digest"},
+                 {"status": "writing manifest"},
+                 {"status": "success"}]
+        with self.server._lock:
+            self.server.models.add(name)
+        if payload.get('stream', True):
+            self._start_stream()
+            for step in steps:
+                self._send_chunk(step)
+            self._end_stream()
+        else:
+            self._send_json(steps[-1])
+
+    def _stall(self, max_seconds=300):
+        """Resta in silenzio finché il client non chiude la connessione (o per max_seconds)"""
+        deadline = time.time() + max_seconds
+        while time.time() < deadline:
+            readable, _, _ = select.select([self.connection], [], [], 0.5)
+            if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                raise ConnectionResetError("client disconnesso durante lo stallo")
+        self.close_connection = True
+
+    def _load_model(self):
+        """Simula il caricamento in memoria alla prima richiesta; restituisce la durata"""
+        server = self.server
+        with server._lock:
+            if server.loaded:
+                return 0.0
+            server.loaded = True
+        time.sleep(server.load_delay)
+        return server.load_delay
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _ns(seconds):
+    return int(seconds * 1e9)
+
+
+def _digest(name):
+    return hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+
+def _model_details():
+    return {"format": "gguf", "family": "llama", "families": ["llama"],
+            "parameter_size": "7.2B", "quantization_level": "Q4_0"}
+
+
+def _model_entry(name):
+    return {"name": name, "model": name, "modified_at": "2024-01-01T00:00:00Z",
+            "size": 4109865159, "digest": _digest(name), "details": _model_details()}
+
+
+def start_fake_ollama(port=0, host='127.0.0.1', **options):
+    """Avvia il server simulato in un thread in background (port=0: porta libera casuale)"""
+    server = FakeOllamaServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='fake-ollama', daemon=True).start()
+    return server
+
+
+def use_fake_ollama(**options):
+    """Avvia il server simulato e indirizza OllamaLLM verso di esso tramite OLLAMA_BASE_URL"""
+    server = start_fake_ollama(**options)
+    os.environ['OLLAMA_BASE_URL'] = server.base_url
+    os.environ['OLLAMA_MODEL'] = next(iter(server.models))
+    print(f"🧪 Ollama simulato attivo su {server.base_url}")
+    return server
+
+
+def load_responses(path):
+    """Carica risposte predefinite da JSON ({"parola chiave": "risposta"})"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Server Ollama simulato per benchmark")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--model', default=os.getenv('OLLAMA_MODEL', 'mistral:7b'))
+    parser.add_argument('--tokens-per-second', type=float, default=20.0)
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help="Secondi prima del primo token")
+    parser.add_argument('--load-delay', type=float, default=0.0, help="Caricamento modello alla prima richiesta (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Frazione di generazioni che falliscono")
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="Frazione di generazioni che si bloccano")
+    parser.add_argument('--parallel', type=int, default=4, help="Generazioni contemporanee (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument('--responses', help="File JSON con risposte predefinite per parola chiave")
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = FakeOllamaServer(
+        (args.host, args.port), model=args.model, tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay, load_delay=args.load_delay,
+        error_rate=args.error_rate, error_status=args.error_status, stall_rate=args.stall_rate,
+        parallel=args.parallel, responses=load_responses(args.responses) if args.responses else None,
+        seed=args.seed
+    )
+    print(f"🧪 Ollama simulato ({args.model}) in ascolto su {server.base_url}")
+    print(f"   {args.tokens_per_second} token/s, primo token {args.first_token_delay}s, "
+          f"errori {args.error_rate:.0%}, stalli {args.stall_rate:.0%}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Server arrestato")
+        sys.exit(0)
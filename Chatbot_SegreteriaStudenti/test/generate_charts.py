@@ -14,13 +14,13 @@ plt.style.use('seaborn-v0_8')
 sns.set_palette("husl")
 
 
-def load_results():
+def load_results(results_path="results/performance_results.json"):
     """Carica risultati test da JSON"""
-    results_path = Path("results/performance_results.json")
+    results_path = Path(results_path)
     
     if not results_path.exists():
         print(f"❌ File non trovato: {results_path}")
-        print("⚠️  Esegui prima: python test_performance.py")
+        print(f"⚠️  Esegui prima: python {'test_load.py' if 'load' in results_path.name else 'test_performance.py'}")
         return None
     
     with open(results_path, 'r', encoding='utf-8') as f:
@@ -88,6 +88,60 @@ def generate_distribution_chart(data):
     return output_path
 
 
+def generate_load_chart(data):
+    """Genera grafico percentili di latenza e throughput al variare del carico"""
+    runs = data.get('runs', [])
+    if not runs:
+        return None
+    
+    # Asse X: utenti concorrenti (ciclo chiuso) o frequenza di arrivo (ciclo aperto)
+    closed_loop = runs[0]['mode'] == 'closed'
+    x = [run['users'] if closed_loop else run['rate'] for run in runs]
+    x_label = 'Utenti concorrenti' if closed_loop else 'Frequenza di arrivo (req/s)'
+    
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+    
+    # 1. Percentili di latenza e TTFT
+    for key, label, style in [('latency_p50', 'p50', '-o'), ('latency_p90', 'p90', '-s'),
+                              ('latency_p99', 'p99', '-^'), ('ttft_p50', 'TTFT p50', '--o')]:
+        values = [run['metrics'].get(key) for run in runs]
+        if any(v is not None for v in values):
+            ax1.plot(x, [v if v is not None else np.nan for v in values], style, linewidth=2, label=label)
+    ax1.set_xlabel(x_label, fontsize=12)
+    ax1.set_ylabel('Latenza (secondi)', fontsize=12)
+    ax1.set_title('Percentili di Latenza', fontsize=14, fontweight='bold')
+    ax1.legend(fontsize=11)
+    ax1.grid(True, alpha=0.3)
+    
+    # 2. Throughput e tasso di errore/redirect
+    ax2.plot(x, [run['metrics']['throughput'] for run in runs], '-o', color='navy',
+             linewidth=2, label='Throughput')
+    ax2.set_xlabel(x_label, fontsize=12)
+    ax2.set_ylabel('Risposte/secondo', fontsize=12)
+    ax2.set_title('Throughput e Saturazione', fontsize=14, fontweight='bold')
+    ax2.grid(True, alpha=0.3)
+    
+    ax3 = ax2.twinx()
+    ax3.plot(x, [run['metrics']['error_rate'] + run['metrics']['redirect_rate'] for run in runs],
+             '--s', color='red', linewidth=1.5, label='Errori + redirect')
+    ax3.set_ylabel('Tasso errori + redirect', fontsize=12)
+    ax3.set_ylim(0, 1)
+    
+    lines = ax2.get_legend_handles_labels()[0] + ax3.get_legend_handles_labels()[0]
+    ax2.legend(lines, [line.get_label() for line in lines], fontsize=11, loc='upper left')
+    
+    plt.suptitle(f"Test di Carico ChatBot UniBg (target: {data.get('target', 'chatbot')})",
+                 fontsize=16, fontweight='bold')
+    plt.tight_layout()
+    
+    output_path = 'results/load_test_scaling.png'
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+    
+    print(f"📊 Grafico salvato: {output_path}")
+    return output_path
+
+
 def main():
     """Funzione principale"""
     print("📊 GENERAZIONE GRAFICI PERFORMANCE")
@@ -110,6 +164,12 @@ def main():
     print()
     generate_distribution_chart(data)
     
+    # Grafico scalabilità dal test di carico (se eseguito)
+    if Path('results/load_test_results.json').exists():
+        load_data = load_results('results/load_test_results.json')
+        if load_data:
+            generate_load_chart(load_data)
+    
     print()
     print("✅ Grafico generato con successo!")
     print(f"📁 Disponibile in: results/response_time_distribution.png")
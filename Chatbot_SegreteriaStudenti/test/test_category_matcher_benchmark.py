@@ -0,0 +1,147 @@
+"""
+Micro-benchmark del riconoscimento di categoria
+Confronta il matcher precompilato (category_matcher) con i cicli "pattern in testo"
+usati in precedenza da PromptOptimizer e OllamaLLM: tempo per domanda, tempo di
+scoring dei paragrafi del contesto e domande classificate diversamente.
+
+Esempio:
+    python test_category_matcher_benchmark.py --repeat 200
+"""
+import sys
+import os
+import time
+import json
+import glob
+import argparse
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, 'src'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'data'))
+
+from test_performance import TEST_QUERIES
+
+# Implementazione precedente di PromptOptimizer._categorize_question (riferimento)
+LEGACY_PATTERNS = {
+    'iscrizioni_esami': ['iscriver', 'esam', 'prenotare', 'prenotazione', 'sessione'],
+    'tasse_pagamenti': ['tasse', 'pagare', 'pagamento', 'retta', 'bollettino', 'importo'],
+    'certificati_documenti': ['certificat', 'document', 'attestat', 'dichiarazione', 'autocertificazione'],
+    'orari_contatti': ['orari', 'orario', 'contatt', 'telefono', 'email', 'dove', 'quando'],
+    'procedure_amministrative': ['procedura', 'come fare', 'iter', 'pratica', 'domanda', 'richiesta'],
+    'servizi_studenti': ['servizi', 'agevolazioni', 'borse', 'alloggi', 'mensa', 'trasporti']
+}
+
+
+def legacy_categorize(question):
+    """Prima categoria con almeno una sottostringa presente (ciclo su categorie e pattern)"""
+    question_lower = question.lower()
+    for category, patterns in LEGACY_PATTERNS.items():
+        if any(pattern in question_lower for pattern in patterns):
+            return category
+    return 'generic'
+
+
+def legacy_score_paragraphs(paragraphs, keywords):
+    """Scoring dei paragrafi con un ciclo sulle parole chiave per ogni paragrafo"""
+    return [sum(1 for keyword in keywords if keyword in para.lower()) for para in paragraphs]
+
+
+def load_questions():
+    """Domande di test più tutte le domande estratte dalle FAQ"""
+    from estrai_dataset_reale import parse_faq_file
+
+    questions = list(TEST_QUERIES)
+    for path in sorted(glob.glob(os.path.join(PROJECT_ROOT, 'data', 'FAQ', '*.txt'))):
+        questions += [pair['question'] for pair in parse_faq_file(path)]
+    return questions
+
+
+def load_paragraphs():
+    """Paragrafi dei testi PDF estratti (contesti lunghi come quelli passati a _optimize_context)"""
+    paragraphs = []
+    for path in sorted(glob.glob(os.path.join(PROJECT_ROOT, 'data', 'testi_estratti', '*_extracted.txt'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            paragraphs += [p for p in f.read().split('\n') if p.strip()]
+    return paragraphs
+
+
+def measure(fn, repeat):
+    """Tempo mediano di repeat esecuzioni di fn"""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def run_category_benchmark(repeat=100):
+    """Confronta matcher precompilato e cicli di sottostringhe"""
+    from category_matcher import QUESTION_MATCHER, PRIORITY_MATCHER, PRIORITY_KEYWORDS
+
+    print("🏷️  BENCHMARK CATEGORIE")
+    print("=" * 60)
+
+    questions = load_questions()
+    paragraphs = load_paragraphs()
+    print(f"Domande: {len(questions)}  Paragrafi di contesto: {len(paragraphs)}\n")
+
+    legacy_time = measure(lambda: [legacy_categorize(q) for q in questions], repeat)
+    matcher_time = measure(lambda: [QUESTION_MATCHER.best(q) for q in questions], repeat)
+
+    keywords = list(PRIORITY_KEYWORDS['iscrizioni_esami'])
+    context_repeat = max(1, repeat // 20)
+    legacy_context_time = measure(lambda: legacy_score_paragraphs(paragraphs, keywords), context_repeat)
+    matcher_context_time = measure(
+        lambda: [PRIORITY_MATCHER.score(p, 'iscrizioni_esami') for p in paragraphs], context_repeat
+    )
+
+    changed = []
+    for question in questions:
+        before, after = legacy_categorize(question), QUESTION_MATCHER.best(question)
+        if before != after:
+            changed.append({'question': question, 'legacy': before, 'matcher': after,
+                            'scores': QUESTION_MATCHER.scores(question)})
+
+    results = {
+        'questions': len(questions),
+        'paragraphs': len(paragraphs),
+        'categorize_us_per_question': {
+            'legacy': legacy_time / len(questions) * 1e6,
+            'matcher': matcher_time / len(questions) * 1e6
+        },
+        'context_scoring_ms': {
+            'legacy': legacy_context_time * 1000,
+            'matcher': matcher_context_time * 1000
+        },
+        'changed_categories': changed
+    }
+
+    q = results['categorize_us_per_question']
+    c = results['context_scoring_ms']
+    print(f"  Categoria per domanda: legacy {q['legacy']:6.2f} µs   matcher {q['matcher']:6.2f} µs")
+    print(f"  Scoring contesto:      legacy {c['legacy']:6.2f} ms   matcher {c['matcher']:6.2f} ms")
+    print(f"\n🔀 Domande classificate diversamente: {len(changed)}/{len(questions)}")
+    for item in changed[:10]:
+        print(f"   - {item['question'][:60]:60s} {item['legacy']} → {item['matcher']}")
+
+    return results
+
+
+def save_results(results, output_path='results/category_matcher_benchmark.json'):
+    """Salva risultati in JSON"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print(f"💾 Risultati salvati: {os.path.abspath(output_path)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del riconoscimento di categoria")
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    results = run_category_benchmark(args.repeat)
+    save_results(results)
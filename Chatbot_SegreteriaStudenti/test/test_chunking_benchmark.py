@@ -0,0 +1,116 @@
+"""
+Benchmark dello splitter nativo rispetto a RecursiveCharacterTextSplitter di LangChain
+Misura throughput, numero di chunk e quota di chunk che superano il limite di token
+del modello di embedding (la parte eccedente non viene mai rappresentata nel vettore).
+
+Esempio:
+    python test_chunking_benchmark.py --repeat 5
+"""
+import sys
+import os
+import time
+import json
+import argparse
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, 'src'))
+
+from test_retrieval_benchmark import load_corpus_texts
+
+
+def langchain_splitter(max_len=1000, overlap=200):
+    """Splitter LangChain con la configurazione storica del progetto (1000/200 caratteri)"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from dividi_chunks import DEFAULT_SEPARATORS
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=max_len,
+        chunk_overlap=overlap,
+        length_function=len,
+        separators=DEFAULT_SEPARATORS
+    )
+    return splitter.split_text
+
+
+def measure_splitter(split, texts, repeat):
+    """Tempo migliore e mediano di una passata sull'intero corpus"""
+    times = []
+    chunks = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        chunks = [chunk for text in texts for chunk in split(text)]
+        times.append(time.perf_counter() - start_time)
+    return chunks, min(times), statistics.median(times)
+
+
+def run_chunking_benchmark(repeat=3):
+    """Confronta gli splitter sullo stesso corpus (FAQ + testi PDF estratti)"""
+    from creazione_vectorstore import clean_text
+    from dividi_chunks import (split_text_in_chunks, split_text_by_tokens, get_tokenizer,
+                               token_starts, DEFAULT_MAX_TOKENS)
+
+    print("✂️  BENCHMARK CHUNKING")
+    print("=" * 60)
+
+    texts = [clean_text(text) for text in load_corpus_texts()]
+    total_chars = sum(len(t) for t in texts)
+    tokenizer = get_tokenizer()
+    print(f"Corpus: {len(texts)} file, {total_chars:,} caratteri")
+    print(f"Conteggio token: {'tokenizer del modello' if tokenizer else 'stima (tokenizers non installato)'}\n")
+
+    splitters = {
+        'nativo_caratteri': lambda text: split_text_in_chunks(text, max_len=1000, overlap=200),
+        'nativo_token': lambda text: split_text_by_tokens(text, tokenizer=tokenizer)
+    }
+    try:
+        splitters['langchain_caratteri'] = langchain_splitter()
+    except ImportError as e:
+        print(f"⚠️  LangChain non disponibile, confronto solo tra splitter nativi: {e}\n")
+
+    results = {'corpus_chars': total_chars, 'max_tokens': DEFAULT_MAX_TOKENS, 'splitters': {}}
+    for name, split in splitters.items():
+        chunks, best, median = measure_splitter(split, texts, repeat)
+        token_counts = [len(token_starts(chunk, tokenizer)) for chunk in chunks]
+        truncated = sum(count > DEFAULT_MAX_TOKENS for count in token_counts)
+
+        results['splitters'][name] = {
+            'chunks': len(chunks),
+            'best_time': best,
+            'median_time': median,
+            'chars_per_second': total_chars / best if best > 0 else None,
+            'avg_tokens': statistics.mean(token_counts) if token_counts else 0,
+            'truncated_chunks': truncated,
+            'truncated_ratio': truncated / len(chunks) if chunks else 0
+        }
+        r = results['splitters'][name]
+        print(f"  {name:20s} {best * 1000:8.1f} ms  {r['chars_per_second'] / 1e6:6.2f} Mchar/s  "
+              f"{r['chunks']:5d} chunk  {r['avg_tokens']:6.1f} token medi  "
+              f"troncati {r['truncated_ratio']:.0%}")
+
+    if 'langchain_caratteri' in results['splitters']:
+        speedup = (results['splitters']['langchain_caratteri']['best_time']
+                   / results['splitters']['nativo_caratteri']['best_time'])
+        results['speedup_vs_langchain'] = speedup
+        print(f"\n🚀 Splitter nativo (caratteri) {speedup:.1f}x rispetto a LangChain")
+
+    return results
+
+
+def save_results(results, output_path='results/chunking_benchmark_results.json'):
+    """Salva risultati in JSON"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print(f"💾 Risultati salvati: {os.path.abspath(output_path)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark degli splitter di testo")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run_chunking_benchmark(args.repeat)
+    save_results(results)
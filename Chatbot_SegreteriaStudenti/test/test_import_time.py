@@ -0,0 +1,125 @@
+"""
+Benchmark tempi di avvio e di import del chatbot
+Usa 'python -X importtime' per individuare i moduli più lenti da caricare
+e misura l'avvio dei comandi leggeri di main.py (--help, --setup)
+"""
+import sys
+import os
+import time
+import json
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Librerie che non devono essere caricate dall'import di main.py
+HEAVY_MODULES = ['torch', 'transformers', 'sentence_transformers', 'chromadb', 'langchain']
+
+# Comandi leggeri da cronometrare con il relativo budget (secondi)
+LIGHT_COMMANDS = ['--help', '--setup']
+STARTUP_BUDGET = 1.0
+
+
+def parse_importtime(stderr):
+    """Converte l'output di -X importtime in lista di (modulo, self_us, cumulative_us)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            _, timings = line.split(':', 1)
+            self_us, cumulative_us, name = timings.split('|')
+            # Il primo spazio è il separatore, i successivi indicano la profondità
+            entries.append((name.rstrip()[1:], int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return entries
+
+
+def measure_import(module='main'):
+    """Importa il modulo in un interprete pulito con -X importtime"""
+    start_time = time.time()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    wall_time = time.time() - start_time
+
+    entries = parse_importtime(proc.stderr)
+    top_level = [e for e in entries if not e[0].startswith(' ')]
+    total_us = sum(e[2] for e in top_level)
+    loaded = {e[0].strip().split('.')[0] for e in entries}
+
+    return {
+        'module': module,
+        'ok': proc.returncode == 0,
+        'wall_time': wall_time,
+        'import_time': total_us / 1e6,
+        'heavy_modules_loaded': sorted(m for m in HEAVY_MODULES if m in loaded),
+        'slowest_modules': [
+            {'module': name.strip(), 'self': s / 1e6, 'cumulative': c / 1e6}
+            for name, s, c in sorted(entries, key=lambda e: e[2], reverse=True)[:15]
+        ],
+        'error': proc.stderr.strip().splitlines()[-1] if proc.returncode != 0 and proc.stderr.strip() else None
+    }
+
+
+def measure_command(arg, repeat=3):
+    """Cronometra 'python main.py <arg>' (migliore di N esecuzioni)"""
+    times = []
+    for _ in range(repeat):
+        start_time = time.time()
+        subprocess.run([sys.executable, 'main.py', arg], cwd=PROJECT_ROOT,
+                       capture_output=True, text=True)
+        times.append(time.time() - start_time)
+    return min(times)
+
+
+def run_import_benchmark():
+    """Esegue il benchmark completo di import e avvio"""
+    print("⏱️  BENCHMARK IMPORT E AVVIO")
+    print("=" * 60)
+
+    results = {'import': measure_import('main'), 'commands': {}, 'budget': STARTUP_BUDGET}
+
+    imp = results['import']
+    if not imp['ok']:
+        print(f"❌ Import di main.py fallito: {imp['error']}")
+    else:
+        print(f"Import main.py:   {imp['import_time']:.3f}s (processo {imp['wall_time']:.3f}s)")
+        print("\nModuli più lenti (cumulativo):")
+        for entry in imp['slowest_modules'][:10]:
+            print(f"  {entry['cumulative']:7.3f}s  {entry['module']}")
+
+    print()
+    for arg in LIGHT_COMMANDS:
+        elapsed = measure_command(arg)
+        results['commands'][arg] = elapsed
+        status = "✅" if elapsed < STARTUP_BUDGET else "❌"
+        print(f"{status} main.py {arg:8s} {elapsed:.3f}s")
+
+    if imp['heavy_modules_loaded']:
+        print(f"\n❌ Librerie pesanti caricate all'import: {', '.join(imp['heavy_modules_loaded'])}")
+
+    results['passed'] = (
+        imp['ok']
+        and not imp['heavy_modules_loaded']
+        and all(t < STARTUP_BUDGET for t in results['commands'].values())
+    )
+    print(f"\n🎯 Esito: {'✅ OK' if results['passed'] else '❌ AVVIO TROPPO LENTO'}")
+    return results
+
+
+def save_results(results, output_path='results/import_time_results.json'):
+    """Salva risultati in JSON"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print(f"💾 Risultati salvati: {os.path.abspath(output_path)}")
+
+
+if __name__ == "__main__":
+    results = run_import_benchmark()
+    save_results(results)
+    sys.exit(0 if results['passed'] else 1)
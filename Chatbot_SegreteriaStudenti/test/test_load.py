@@ -0,0 +1,300 @@
+"""
+Test di carico del chatbot con utenti concorrenti
+Genera traffico a ciclo chiuso (N utenti che inviano domande una dopo l'altra)
+o a ciclo aperto (arrivi di Poisson a frequenza fissa) e misura percentili di
+latenza, time-to-first-token, throughput, tassi di errore/redirect e attesa in coda.
+
+Esempi:
+    python test_load.py --users 1,2,4,8 --requests-per-user 5
+    python test_load.py --mode open --rate 0.5 --duration 120
+    python test_load.py --target http --users 1,2,4   # solo backend Ollama
+"""
+import sys
+import os
+import math
+import time
+import json
+import random
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Aggiungi il percorso del progetto
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from test_performance import TEST_QUERIES
+
+
+def percentile(values, p):
+    """Percentile con metodo nearest-rank (p tra 0 e 100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class ChatbotTarget:
+    """Invia le query a ChatbotRAG.chat nello stesso processo (istanza condivisa tra i thread)"""
+
+    name = 'chatbot'
+
+    def __init__(self):
+        from main import ChatbotRAG
+        self.chatbot = ChatbotRAG(background=False)
+
+    def send(self, query):
+        result = self.chatbot.chat(query)
+        timings = result.get('timings', {})
+        if result.get('should_redirect'):
+            outcome = 'redirect'
+        elif result.get('cached'):
+            # Risposta dalla cache: nessuna generazione, esclusa da latenze e TTFT
+            outcome = 'cached'
+        elif result.get('response', '').strip():
+            outcome = 'ok'
+        else:
+            outcome = 'error'
+        return outcome, timings.get('first_token')
+
+
+class OllamaHTTPTarget:
+    """Invia le query direttamente a /api/generate in streaming (misura la saturazione del backend)"""
+
+    name = 'http'
+
+    def __init__(self, num_predict=200):
+        import requests
+        self.requests = requests
+        self.base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+        self.model = os.getenv('OLLAMA_MODEL', 'mistral:7b')
+        self.num_predict = num_predict
+
+    def send(self, query):
+        start_time = time.time()
+        first_token = None
+        payload = {
+            "model": self.model,
+            "prompt": f"Rispondi in italiano alla domanda di uno studente universitario: {query}",
+            "stream": True,
+            "options": {"num_predict": self.num_predict, "num_ctx": 2048}
+        }
+        with self.requests.post(f"{self.base_url}/api/generate", json=payload,
+                                stream=True, timeout=(3, 120)) as response:
+            if response.status_code != 200:
+                return 'error', None
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if first_token is None and chunk.get('response'):
+                    first_token = time.time() - start_time
+                if chunk.get('done'):
+                    break
+        return 'ok', first_token
+
+
+def _execute(target, query, scheduled_at, records, lock):
+    """Esegue una richiesta registrando attesa in coda, latenza, TTFT ed esito"""
+    started_at = time.time()
+    try:
+        outcome, first_token = target.send(query)
+        error = None
+    except Exception as e:
+        outcome, first_token, error = 'error', None, str(e)[:120]
+    finished_at = time.time()
+
+    with lock:
+        records.append({
+            'query': query,
+            'scheduled_at': scheduled_at,
+            'queue_wait': started_at - scheduled_at,
+            'latency': finished_at - scheduled_at,
+            'service_time': finished_at - started_at,
+            'first_token': first_token,
+            'outcome': outcome,
+            'error': error
+        })
+
+
+def run_closed_loop(target, users, requests_per_user, think_time=0.0):
+    """Ciclo chiuso: ogni utente invia la domanda successiva solo dopo la risposta"""
+    records, lock = [], threading.Lock()
+    rng = random.Random(42)
+    plans = [[rng.choice(TEST_QUERIES) for _ in range(requests_per_user)] for _ in range(users)]
+
+    def user_loop(queries):
+        for query in queries:
+            _execute(target, query, time.time(), records, lock)
+            if think_time:
+                time.sleep(think_time)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user_loop, plans))
+    return records, time.time() - start_time
+
+
+def run_open_loop(target, rate, duration, max_inflight=32):
+    """Ciclo aperto: arrivi di Poisson a 'rate' richieste/s indipendenti dalle risposte"""
+    records, lock = [], threading.Lock()
+    rng = random.Random(42)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        next_arrival = start_time
+        while next_arrival < start_time + duration:
+            delay = next_arrival - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_execute, target, rng.choice(TEST_QUERIES), next_arrival, records, lock)
+            next_arrival += rng.expovariate(rate)
+    return records, time.time() - start_time
+
+
+def summarize(records, wall_time):
+    """Calcola le metriche aggregate di una run"""
+    total = len(records)
+    ok = [r for r in records if r['outcome'] == 'ok']
+    cached = sum(r['outcome'] == 'cached' for r in records)
+    latencies = [r['latency'] for r in ok]
+    ttfts = [r['first_token'] for r in ok if r['first_token'] is not None]
+    waits = [r['queue_wait'] for r in records]
+
+    metrics = {
+        'requests': total,
+        'successful': len(ok),
+        'error_rate': sum(r['outcome'] == 'error' for r in records) / total if total else 0,
+        'redirect_rate': sum(r['outcome'] == 'redirect' for r in records) / total if total else 0,
+        'cache_hits': cached,
+        'cache_hit_rate': cached / total if total else 0,
+        'throughput': len(ok) / wall_time if wall_time > 0 else 0,
+        'wall_time': wall_time,
+        'queue_wait_p50': percentile(waits, 50),
+        'queue_wait_p99': percentile(waits, 99)
+    }
+    for p in (50, 90, 99):
+        metrics[f'latency_p{p}'] = percentile(latencies, p)
+        metrics[f'ttft_p{p}'] = percentile(ttfts, p)
+
+    # Campi compatibili con generate_charts.py
+    if latencies:
+        metrics.update({
+            'avg_response_time': statistics.mean(latencies),
+            'median_response_time': statistics.median(latencies),
+            'min_response_time': min(latencies),
+            'max_response_time': max(latencies),
+            'std_deviation': statistics.stdev(latencies) if len(latencies) > 1 else 0
+        })
+    return metrics
+
+
+def print_summary(label, metrics):
+    """Stampa una riga di riepilogo per una run"""
+    def fmt(value):
+        return f"{value:6.1f}s" if value is not None else "     -"
+
+    print(f"  {label:14s} p50 {fmt(metrics['latency_p50'])}  p90 {fmt(metrics['latency_p90'])}  "
+          f"p99 {fmt(metrics['latency_p99'])}  TTFT p50 {fmt(metrics['ttft_p50'])}  "
+          f"{metrics['throughput']:.3f} req/s  err {metrics['error_rate']:.0%}  "
+          f"redirect {metrics['redirect_rate']:.0%}  cache {metrics['cache_hit_rate']:.0%}  "
+          f"coda p99 {fmt(metrics['queue_wait_p99'])}")
+
+
+def run_load_test(args):
+    """Esegue le run configurate e restituisce i risultati in formato JSON-serializzabile"""
+    print("🚦 TEST DI CARICO CHATBOT")
+    print("=" * 60)
+
+    original_dir = os.getcwd()
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(project_root)
+    try:
+        target = ChatbotTarget() if args.target == 'chatbot' else OllamaHTTPTarget()
+    except Exception as e:
+        print(f"❌ Errore inizializzazione target: {e}")
+        os.chdir(original_dir)
+        return None
+
+    runs = []
+    if args.mode == 'closed':
+        for users in args.users:
+            print(f"🔄 Ciclo chiuso: {users} utenti x {args.requests_per_user} richieste...")
+            records, wall_time = run_closed_loop(target, users, args.requests_per_user, args.think_time)
+            metrics = summarize(records, wall_time)
+            print_summary(f"{users} utenti", metrics)
+            runs.append({'mode': 'closed', 'users': users, 'metrics': metrics, 'records': records})
+    else:
+        for rate in args.rate:
+            print(f"🔄 Ciclo aperto: {rate} req/s per {args.duration}s...")
+            records, wall_time = run_open_loop(target, rate, args.duration, args.max_inflight)
+            metrics = summarize(records, wall_time)
+            print_summary(f"{rate} req/s", metrics)
+            runs.append({'mode': 'open', 'rate': rate, 'metrics': metrics, 'records': records})
+
+    os.chdir(original_dir)
+
+    # Il blocco di primo livello replica lo schema di performance_results.json (run più carica)
+    last = runs[-1]
+    return {
+        'target': target.name,
+        'queries_total': last['metrics']['requests'],
+        'queries_successful': last['metrics']['successful'],
+        'response_times': [r['latency'] for r in last['records'] if r['outcome'] == 'ok'],
+        'performance_metrics': last['metrics'],
+        'runs': runs
+    }
+
+
+def save_results(results, output_path='results/load_test_results.json'):
+    """Salva risultati in JSON"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print()
+    print(f"💾 Risultati salvati: {os.path.abspath(output_path)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Test di carico del chatbot")
+    parser.add_argument('--target', choices=['chatbot', 'http'], default='chatbot',
+                        help="chatbot: ChatbotRAG.chat in-process | http: /api/generate di Ollama")
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--users', type=lambda s: [int(x) for x in s.split(',')], default=[1, 2, 4],
+                        help="Livelli di concorrenza per il ciclo chiuso (es. 1,2,4,8)")
+    parser.add_argument('--requests-per-user', type=int, default=3)
+    parser.add_argument('--think-time', type=float, default=0.0, help="Pausa tra richieste dello stesso utente (s)")
+    parser.add_argument('--rate', type=lambda s: [float(x) for x in s.split(',')], default=[0.1],
+                        help="Frequenze di arrivo per il ciclo aperto in richieste/s (es. 0.05,0.1,0.2)")
+    parser.add_argument('--duration', type=float, default=120.0, help="Durata di ogni run a ciclo aperto (s)")
+    parser.add_argument('--max-inflight', type=int, default=32, help="Richieste contemporanee massime (ciclo aperto)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Usa la cache delle risposte (le risposte in cache sono contate a parte)")
+    parser.add_argument('--fake-ollama', action='store_true',
+                        help="Usa il server Ollama simulato (fake_ollama.py) al posto del modello")
+    parser.add_argument('--fake-parallel', type=int, default=1,
+                        help="Generazioni contemporanee del server simulato (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument('--output', default='results/load_test_results.json')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Il traffico sintetico non deve finire nel log delle query reali (prewarm, replay)
+    os.environ['QUERY_LOG'] = '0'
+    # Senza --cache ogni richiesta arriva al modello: le latenze misurano Ollama, non la cache
+    if not args.cache:
+        os.environ['ANSWER_CACHE'] = '0'
+    if args.fake_ollama:
+        from fake_ollama import use_fake_ollama
+        use_fake_ollama(parallel=args.fake_parallel)
+    results = run_load_test(args)
+
+    if results:
+        save_results(results, args.output)
+        print()
+        print("✅ Test di carico completato!")
+        print("📊 Esegui 'python generate_charts.py' per creare i grafici")
@@ -50,6 +50,7 @@ def run_performance_test():
         'queries_total': len(TEST_QUERIES),
         'queries_successful': 0,
         'queries_failed': 0,
+        'cache_hits': 0,
         'response_times': [],
         'error_details': []
     }
@@ -62,8 +63,9 @@ def run_performance_test():
         
         from main import ChatbotRAG
         print("🤖 Inizializzazione chatbot...")
-        chatbot = ChatbotRAG()
-        print("✅ Chatbot pronto\n")
+        # Warm-up sincrono: le misure riflettono la latenza a regime
+        chatbot = ChatbotRAG(background=False)
+        print(f"✅ Chatbot pronto ({chatbot.warmup.summary()})\n")
     except Exception as e:
         print(f"❌ Errore inizializzazione: {e}")
         os.chdir(original_dir)
@@ -88,7 +90,12 @@ def run_performance_test():
             else:
                 response = str(result)
             
-            if response and len(response.strip()) > 0:
+            if isinstance(result, dict) and result.get('cached'):
+                # Risposta dalla cache: non è una generazione, esclusa dai tempi
+                results['queries_successful'] += 1
+                results['cache_hits'] += 1
+                print(f"💾 {response_time:.1f}s - Cache")
+            elif response and len(response.strip()) > 0:
                 results['response_times'].append(response_time)
                 results['queries_successful'] += 1
                 print(f"✅ {response_time:.1f}s")
@@ -145,6 +152,8 @@ def run_performance_test():
     print(f"Query totali:     {results['queries_total']}")
     print(f"✅ Successi:      {results['queries_successful']}")
     print(f"❌ Fallimenti:    {results['queries_failed']}")
+    if results['cache_hits']:
+        print(f"💾 Dalla cache:   {results['cache_hits']} (escluse dai tempi)")
     
     if results['response_times']:
         metrics = results['performance_metrics']
@@ -175,6 +184,16 @@ def save_results(results, output_path='results/performance_results.json'):
 
 
 if __name__ == "__main__":
+    # Le query di test non devono finire nel log delle query reali (prewarm, replay)
+    os.environ['QUERY_LOG'] = '0'
+    # --cache: usa la cache delle risposte; di default ogni query arriva al modello
+    if '--cache' not in sys.argv:
+        os.environ['ANSWER_CACHE'] = '0'
+    # --fake-ollama: server simulato al posto di Mistral (misura retrieval e orchestrazione)
+    if '--fake-ollama' in sys.argv:
+        from fake_ollama import use_fake_ollama
+        use_fake_ollama()
+    
     results = run_performance_test()
     
     if results:
@@ -0,0 +1,153 @@
+"""
+Replay del traffico reale registrato nel log delle query
+Rinvia le domande di logs/query_log.jsonl (e dei file ruotati) rispettando gli intervalli
+originali tra le richieste, oppure accelerandoli (--speed 10 = dieci volte più veloce).
+Le richieste partono all'istante previsto anche se le precedenti non sono terminate
+(ciclo aperto), quindi la coda si forma come con il traffico vero.
+
+Esempi:
+    python test_replay.py --speed 1
+    python test_replay.py --speed 20 --max-gap 5 --limit 200
+    python test_replay.py --speed 10 --fake-ollama --fake-parallel 2
+"""
+import sys
+import os
+import time
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, 'src'))
+
+from test_load import ChatbotTarget, OllamaHTTPTarget, _execute, summarize, print_summary
+from query_log import read_entries, DEFAULT_PATH
+
+
+def load_schedule(path, limit=None, max_gap=None, outcomes=None):
+    """
+    Domande del log con il loro ritardo (s) dall'inizio del replay, nell'ordine originale
+    max_gap: pausa massima tra due richieste consecutive (comprime le ore senza traffico)
+    """
+    entries = [e for e in read_entries(path) if e.get('query') and e.get('ts') is not None]
+    if outcomes:
+        entries = [e for e in entries if e.get('outcome') in outcomes]
+    entries.sort(key=lambda e: e['ts'])
+    if limit:
+        entries = entries[:limit]
+
+    schedule = []
+    offset = 0.0
+    previous_ts = None
+    for entry in entries:
+        if previous_ts is not None:
+            gap = entry['ts'] - previous_ts
+            offset += min(gap, max_gap) if max_gap is not None else gap
+        previous_ts = entry['ts']
+        schedule.append((offset, entry['query']))
+    return schedule
+
+
+def run_replay(target, schedule, speed=1.0, max_inflight=32):
+    """Invia ogni domanda all'istante originale diviso per speed"""
+    records, lock = [], threading.Lock()
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        for offset, query in schedule:
+            scheduled_at = start_time + offset / speed
+            delay = scheduled_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_execute, target, query, scheduled_at, records, lock)
+    return records, time.time() - start_time
+
+
+def run_replay_test(args):
+    """Carica il log, esegue il replay e restituisce i risultati in formato JSON-serializzabile"""
+    print("🎞️  REPLAY DEL TRAFFICO REGISTRATO")
+    print("=" * 60)
+
+    schedule = load_schedule(args.log, args.limit, args.max_gap, args.outcomes)
+    if not schedule:
+        print(f"❌ Nessuna richiesta nel log: {args.log}")
+        return None
+    span = schedule[-1][0]
+    print(f"📜 {len(schedule)} richieste in {span:.0f}s originali → {span / args.speed:.0f}s a velocità x{args.speed:g}")
+
+    original_dir = os.getcwd()
+    os.chdir(PROJECT_ROOT)
+    try:
+        target = ChatbotTarget() if args.target == 'chatbot' else OllamaHTTPTarget()
+    except Exception as e:
+        print(f"❌ Errore inizializzazione target: {e}")
+        os.chdir(original_dir)
+        return None
+
+    records, wall_time = run_replay(target, schedule, args.speed, args.max_inflight)
+    os.chdir(original_dir)
+
+    metrics = summarize(records, wall_time)
+    print_summary(f"x{args.speed:g}", metrics)
+
+    return {
+        'target': target.name,
+        'log': os.path.abspath(args.log),
+        'speed': args.speed,
+        'max_gap': args.max_gap,
+        'queries_total': metrics['requests'],
+        'queries_successful': metrics['successful'],
+        'response_times': [r['latency'] for r in records if r['outcome'] == 'ok'],
+        'performance_metrics': metrics,
+        'records': records
+    }
+
+
+def save_results(results, output_path='results/replay_results.json'):
+    """Salva risultati in JSON"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print()
+    print(f"💾 Risultati salvati: {os.path.abspath(output_path)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay del log delle query")
+    parser.add_argument('--log', default=os.path.join(PROJECT_ROOT, DEFAULT_PATH),
+                        help="Log JSONL delle query (i file ruotati .N/.N.gz sono inclusi)")
+    parser.add_argument('--target', choices=['chatbot', 'http'], default='chatbot')
+    parser.add_argument('--speed', type=float, default=1.0, help="Fattore di accelerazione (1 = tempi originali)")
+    parser.add_argument('--max-gap', type=float, default=None, help="Pausa massima tra richieste nel log (s)")
+    parser.add_argument('--limit', type=int, default=None, help="Numero massimo di richieste")
+    parser.add_argument('--outcomes', type=lambda s: s.split(','), default=None,
+                        help="Solo richieste con questi esiti (es. answered,redirect)")
+    parser.add_argument('--max-inflight', type=int, default=32, help="Richieste contemporanee massime")
+    parser.add_argument('--no-cache', action='store_true', help="Disattiva la cache delle risposte")
+    parser.add_argument('--fake-ollama', action='store_true',
+                        help="Usa il server Ollama simulato (fake_ollama.py) al posto del modello")
+    parser.add_argument('--fake-parallel', type=int, default=1,
+                        help="Generazioni contemporanee del server simulato (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument('--output', default='results/replay_results.json')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Il replay non deve finire nel log che sta rileggendo
+    os.environ['QUERY_LOG'] = '0'
+    if args.no_cache:
+        os.environ['ANSWER_CACHE'] = '0'
+    if args.fake_ollama:
+        from fake_ollama import use_fake_ollama
+        use_fake_ollama(parallel=args.fake_parallel)
+    results = run_replay_test(args)
+
+    if results:
+        save_results(results, args.output)
+        print()
+        print("✅ Replay completato!")
@@ -0,0 +1,323 @@
+"""
+Micro-benchmark della sola pipeline di retrieval (nessuna chiamata all'LLM)
+Misura embed_query, search_vectorstore a diversi k, caricamento dell'indice,
+chunking con split_text_by_tokens ed estrazione PDF, e confronta ogni stage
+con i valori di riferimento salvati in test/baselines: se uno stage peggiora oltre la
+tolleranza lo script termina con codice 1. Il gate fallisce anche se la baseline manca,
+se uno stage richiesto è stato saltato (dipendenze mancanti) o non ha un riferimento
+confrontabile. La baseline contiene i tempi della macchina su cui è registrata e non è
+versionata: va creata con --update-baseline sulla macchina di riferimento.
+
+Esempi:
+    python test_retrieval_benchmark.py                    # confronto con la baseline
+    python test_retrieval_benchmark.py --update-baseline  # registra nuova baseline
+    python test_retrieval_benchmark.py --stages embed_query,search --tolerance 0.3
+"""
+import sys
+import os
+import io
+import time
+import json
+import glob
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(PROJECT_ROOT, 'src')
+sys.path.append(PROJECT_ROOT)
+sys.path.append(SRC_DIR)
+
+from test_performance import TEST_QUERIES
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'retrieval_baseline.json')
+STAGES = ['index_load', 'embed_query', 'search', 'chunking', 'pdf_extraction']
+SEARCH_K = [1, 5, 10, 20]
+
+# Peggioramento massimo ammesso rispetto alla baseline (20%) e soglia assoluta sotto
+# la quale le differenze sono rumore di misura (stage da pochi millisecondi)
+TOLERANCE = 0.20
+NOISE_FLOOR = 0.002
+
+
+def time_calls(fn, items, warmup=2):
+    """Esegue fn su ogni elemento e restituisce i tempi per chiamata (dopo alcune chiamate di riscaldamento)"""
+    for item in items[:warmup]:
+        fn(item)
+    times = []
+    for item in items:
+        start_time = time.perf_counter()
+        fn(item)
+        times.append(time.perf_counter() - start_time)
+    return times
+
+
+def stage_result(times, unit, per_unit=1.0):
+    """Statistiche di uno stage; 'value' è la mediana in secondi per unità (metrica del gate, minore è meglio)"""
+    median = statistics.median(times)
+    ordered = sorted(times)
+    return {
+        'value': median / per_unit,
+        'unit': unit,
+        'median': median,
+        'p95': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        'mean': statistics.mean(times),
+        'runs': len(times)
+    }
+
+
+def bench_index_load(repeat=3):
+    """Apertura della collection e caricamento HNSW in un interprete pulito (import esclusi dal tempo)"""
+    code = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {SRC_DIR!r})\n"
+        "import chromadb\n"
+        "import creazione_vectorstore as cv\n"
+        "start = time.perf_counter()\n"
+        "cv.warm_up_vectorstore('vectordb')\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    times = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "errore sconosciuto")
+        times.append(float(proc.stdout.strip().splitlines()[-1]))
+    return stage_result(times, 's/caricamento')
+
+
+def bench_embed_query(embedder, queries):
+    """Latenza di embed_query per singola domanda (modello già caricato)"""
+    return stage_result(time_calls(embedder.embed_query, queries), 's/query')
+
+
+def bench_search(embedder, queries, k):
+    """Latenza di search_vectorstore (embedding + ricerca ANN) con collection già aperta"""
+    from creazione_vectorstore import search_vectorstore
+
+    def search(query):
+        search_vectorstore(query, k=k, embedder=embedder)
+
+    return stage_result(time_calls(search, queries), 's/query')
+
+
+def load_corpus_texts():
+    """Testi FAQ e PDF estratti usati per costruire il vectorstore"""
+    paths = glob.glob(os.path.join(PROJECT_ROOT, 'data', 'FAQ', '*.txt'))
+    paths += glob.glob(os.path.join(PROJECT_ROOT, 'data', 'testi_estratti', '*_extracted.txt'))
+    texts = []
+    for path in sorted(paths):
+        with open(path, 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    return texts
+
+
+def bench_chunking(texts, repeat=5):
+    """Throughput di split_text_by_tokens sull'intero corpus (secondi per milione di caratteri)"""
+    from dividi_chunks import split_text_by_tokens, get_tokenizer
+
+    if not texts:
+        raise RuntimeError("nessun testo in data/FAQ o data/testi_estratti")
+
+    tokenizer = get_tokenizer()  # Caricamento del tokenizer escluso dalla misura
+
+    def chunk_corpus(_):
+        for text in texts:
+            split_text_by_tokens(text)
+
+    total_chars = sum(len(t) for t in texts)
+    result = stage_result(time_calls(chunk_corpus, list(range(repeat)), warmup=1), 's/Mchar', total_chars / 1e6)
+    result['chars_per_second'] = total_chars / result['median']
+    # Con il conteggio stimato il codice misurato è diverso: i due casi non sono confrontabili
+    result['tokenizer'] = 'model' if tokenizer is not None else 'estimate'
+    return result
+
+
+def bench_pdf_extraction(repeat=1):
+    """Throughput di pdf_to_txt_with_inline_links sulle guide PDF (secondi per pagina)"""
+    import fitz
+    from testi_estratti import pdf_to_txt_with_inline_links
+
+    pdf_files = sorted(glob.glob(os.path.join(PROJECT_ROOT, 'data', 'guida_dello_studente', '*.pdf')))
+    if not pdf_files:
+        raise RuntimeError("nessun PDF in data/guida_dello_studente")
+
+    total_pages = 0
+    for pdf_path in pdf_files:
+        with fitz.open(pdf_path) as doc:
+            total_pages += doc.page_count
+
+    def extract_all(_):
+        with tempfile.TemporaryDirectory() as tmp_dir, redirect_stdout(io.StringIO()):
+            for pdf_path in pdf_files:
+                pdf_to_txt_with_inline_links(pdf_path, os.path.join(tmp_dir, 'out.txt'))
+
+    result = stage_result(time_calls(extract_all, list(range(repeat)), warmup=0), 's/pagina', total_pages)
+    result['pages_per_second'] = total_pages / result['median']
+    return result
+
+
+def compare_with_baseline(stages, baseline, tolerance):
+    """
+    Confronta gli stage misurati con la baseline; restituisce l'elenco degli stage che non
+    superano il gate (regressione, stage saltato o senza riferimento confrontabile)
+    """
+    regressions = []
+    for name, result in stages.items():
+        reference = baseline.get('stages', {}).get(name)
+        if 'value' not in result:
+            result['gate'] = 'saltato'
+        elif not reference or 'value' not in reference:
+            result['gate'] = 'senza baseline'
+        elif reference.get('tokenizer') != result.get('tokenizer'):
+            result['gate'] = f"baseline non confrontabile (tokenizer {reference.get('tokenizer')})"
+        else:
+            ratio = result['value'] / reference['value'] if reference['value'] > 0 else 1.0
+            result['baseline'] = reference['value']
+            result['change'] = ratio - 1
+            # Differenza assoluta in secondi per operazione (value è normalizzato per unità)
+            slower_by = (result['value'] - reference['value']) * result['median'] / result['value']
+            if not (ratio > 1 + tolerance and slower_by > NOISE_FLOOR):
+                continue
+        regressions.append(name)
+    return regressions
+
+
+def run_retrieval_benchmark(args):
+    """Esegue gli stage richiesti e applica il gate di regressione"""
+    print("🔎 BENCHMARK RETRIEVAL")
+    print("=" * 60)
+
+    original_dir = os.getcwd()
+    os.chdir(PROJECT_ROOT)
+
+    stages = {}
+    queries = TEST_QUERIES[:args.queries]
+
+    def run_stage(name, fn):
+        print(f"  ⏱️  {name:22s}", end=" ", flush=True)
+        try:
+            result = fn()
+            stages[name] = result
+            print(f"{result['value'] * 1000:9.2f} ms ({result['unit']})")
+        except Exception as e:
+            stages[name] = {'skipped': str(e)[:200]}
+            print(f"⚠️  saltato: {str(e)[:80]}")
+
+    try:
+        if 'index_load' in args.stages:
+            run_stage('index_load', lambda: bench_index_load(args.repeat))
+
+        if 'embed_query' in args.stages or 'search' in args.stages:
+            try:
+                from local_embeddings import LocalEmbeddings
+                embedder = LocalEmbeddings()
+            except Exception as e:
+                embedder = None
+                print(f"  ⚠️  Embedder non disponibile: {e}")
+                # Registrati come saltati: il gate non deve passare per stage mai eseguiti
+                if 'embed_query' in args.stages:
+                    stages['embed_query'] = {'skipped': f"embedder non disponibile: {str(e)[:160]}"}
+                if 'search' in args.stages:
+                    stages.update({f'search_k{k}': {'skipped': f"embedder non disponibile: {str(e)[:160]}"}
+                                   for k in SEARCH_K})
+
+            if embedder and 'embed_query' in args.stages:
+                run_stage('embed_query', lambda: bench_embed_query(embedder, queries))
+            if embedder and 'search' in args.stages:
+                for k in SEARCH_K:
+                    run_stage(f'search_k{k}', lambda k=k: bench_search(embedder, queries, k))
+
+        if 'chunking' in args.stages:
+            texts = load_corpus_texts()
+            run_stage('chunking', lambda: bench_chunking(texts, args.repeat))
+
+        if 'pdf_extraction' in args.stages:
+            run_stage('pdf_extraction', lambda: bench_pdf_extraction(1))
+    finally:
+        os.chdir(original_dir)
+
+    results = {
+        'machine': {'node': platform.node(), 'processor': platform.processor(), 'python': platform.python_version()},
+        'tolerance': args.tolerance,
+        'stages': stages,
+        'regressions': []
+    }
+
+    if args.update_baseline:
+        skipped = [name for name, result in stages.items() if 'value' not in result]
+        if skipped:
+            print(f"\n⚠️  Stage saltati, esclusi dalla baseline: {', '.join(skipped)}")
+        return results
+
+    if not os.path.exists(BASELINE_PATH):
+        print(f"\n❌ Nessuna baseline in {BASELINE_PATH}: esegui con --update-baseline")
+        results['passed'] = False
+        return results
+
+    with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('machine', {}).get('node') != results['machine']['node']:
+        print(f"\n⚠️  Baseline registrata su un'altra macchina ({baseline.get('machine', {}).get('node')})")
+
+    results['regressions'] = compare_with_baseline(stages, baseline, args.tolerance)
+
+    print(f"\n📊 Confronto con baseline (tolleranza {args.tolerance:.0%}):")
+    for name, result in stages.items():
+        if 'change' in result:
+            status = "❌" if name in results['regressions'] else "✅"
+            print(f"  {status} {name:22s} {result['change']:+7.1%}")
+        else:
+            print(f"  ❌ {name:22s} {result['gate']}")
+
+    results['passed'] = not results['regressions']
+    print(f"\n🎯 Esito: {'✅ OK' if results['passed'] else '❌ GATE NON SUPERATO: ' + ', '.join(results['regressions'])}")
+    return results
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """Salva gli stage misurati come nuova baseline"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    baseline = {
+        'machine': results['machine'],
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'stages': {name: r for name, r in results['stages'].items() if 'value' in r}
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, ensure_ascii=False)
+    print(f"\n📌 Baseline aggiornata: {path}")
+
+
+def save_results(results, output_path='results/retrieval_benchmark_results.json'):
+    """Salva risultati in JSON"""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print(f"💾 Risultati salvati: {os.path.abspath(output_path)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Micro-benchmark della pipeline di retrieval")
+    parser.add_argument('--stages', type=lambda s: s.split(','), default=STAGES,
+                        help=f"Stage da eseguire separati da virgola ({','.join(STAGES)})")
+    parser.add_argument('--queries', type=int, default=len(TEST_QUERIES), help="Numero di query di test")
+    parser.add_argument('--repeat', type=int, default=3, help="Ripetizioni per index_load e chunking")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Peggioramento ammesso (0.2 = 20%%)")
+    parser.add_argument('--update-baseline', action='store_true', help="Registra i tempi misurati come baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run_retrieval_benchmark(args)
+    save_results(results)
+
+    if args.update_baseline:
+        save_baseline(results)
+        sys.exit(0)
+    sys.exit(0 if results['passed'] else 1)